@@ -0,0 +1,133 @@
+# adaptive_allocator.py
+#
+# Sequential trial allocation for run_sweep.py --adaptive.
+#
+# Instead of a fixed number of runs for every (model, test case, lang,
+# spec_lang, prompt_style) cell, each cell is sampled until its 95% Wilson
+# interval (the same interval reported by 05_Reports/analyze_with_ci.py) is
+# narrower than a target width, or until the whole interval lies above or
+# below a reference success rate. A model that fails everything stops after a
+# handful of runs; the freed runs go to the cells whose intervals are still the
+# widest, up to a per-cell cap and a total budget that defaults to the cost of
+# the fixed design.
+#
+# Note that the intervals are not adjusted for optional stopping, so
+# min_runs should not be set much lower than the default.
+#
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '05_Reports'))
+from survival_stats import wilson_interval
+
+CELL_KEYS = ('model', 'test_case', 'lang', 'spec_lang', 'prompt_style')
+
+def wilson_bounds(successes, runs, alpha=0.05):
+    lower, upper = wilson_interval(successes, runs, alpha=alpha)
+    return float(lower), float(upper)
+
+class _Cell:
+    def __init__(self, config):
+        self.config = config
+        self.issued = 0
+        self.completed = 0
+        self.successes = 0
+        self.stop_reason = None
+
+class AdaptiveAllocator:
+    """
+    Hands out trials one at a time to the cell that needs them most and stops
+    cells as soon as their outcome is settled. Safe to use from several threads.
+    """
+
+    def __init__(self, cells, min_runs=5, max_runs=60, budget=None, target_width=0.3,
+                 reference=None, alpha=0.05):
+        self.cells = [_Cell({key: config[key] for key in CELL_KEYS}) for config in cells]
+        self.min_runs = min_runs
+        self.max_runs = max_runs
+        self.budget = budget if budget is not None else len(self.cells) * max_runs
+        self.target_width = target_width
+        self.reference = reference
+        self.alpha = alpha
+        self.issued = 0
+        self._by_key = {tuple(cell.config[key] for key in CELL_KEYS): cell for cell in self.cells}
+        self._lock = threading.Lock()
+
+    def _is_open(self, cell):
+        return cell.stop_reason is None and cell.issued < self.max_runs
+
+    def _priority(self, cell):
+        # Cells below min_runs come first, then the widest projected interval:
+        # the current success rate at the sample size once in-flight runs finish.
+        if cell.issued < self.min_runs:
+            return (1, -cell.issued)
+        rate = cell.successes / cell.completed if cell.completed else 0.5
+        lower, upper = wilson_bounds(rate * cell.issued, cell.issued, self.alpha)
+        return (0, upper - lower)
+
+    def next_trial(self, has_capacity=lambda model: True):
+        """
+        Returns the next trial dict (cell config plus a 1-based 'run') for a
+        model that has capacity, or None if no such trial is available now.
+        """
+        with self._lock:
+            if self.issued >= self.budget:
+                return None
+            candidates = [cell for cell in self.cells if self._is_open(cell) and has_capacity(cell.config['model'])]
+            if not candidates:
+                return None
+            cell = max(candidates, key=self._priority)
+            cell.issued += 1
+            self.issued += 1
+            return dict(cell.config, run=cell.issued)
+
+    def restore(self, trial, success=None):
+        """
+        Re-registers a trial issued by an interrupted sweep that is being
+        resumed: as finished with `success`, or (success=None) as issued and
+        about to be retried. Trials of cells not in this sweep are ignored.
+        """
+        with self._lock:
+            cell = self._by_key.get(tuple(trial[key] for key in CELL_KEYS))
+            if cell is None:
+                return
+            cell.issued = max(cell.issued, trial['run'])
+            self.issued += 1
+        if success is not None:
+            self.record(trial, success)
+
+    def record(self, trial, success):
+        """Records a finished trial and stops its cell if the outcome is settled."""
+        with self._lock:
+            cell = self._by_key[tuple(trial[key] for key in CELL_KEYS)]
+            cell.completed += 1
+            cell.successes += 1 if success else 0
+            if cell.stop_reason is not None or cell.completed < self.min_runs:
+                return
+            lower, upper = wilson_bounds(cell.successes, cell.completed, self.alpha)
+            if upper - lower <= self.target_width:
+                cell.stop_reason = 'ci_width'
+            elif self.reference is not None and (lower > self.reference or upper < self.reference):
+                cell.stop_reason = 'separated'
+
+    def finished(self):
+        """True once no further trial will ever be handed out."""
+        with self._lock:
+            return self.issued >= self.budget or not any(self._is_open(cell) for cell in self.cells)
+
+    def summary(self):
+        """Returns one dict per cell with its runs, successes, Wilson bounds and stop reason."""
+        rows = []
+        with self._lock:
+            for cell in self.cells:
+                lower, upper = wilson_bounds(cell.successes, cell.completed, self.alpha) if cell.completed else (0.0, 1.0)
+                if cell.stop_reason is not None:
+                    reason = cell.stop_reason
+                elif cell.issued >= self.max_runs:
+                    reason = 'max_runs'
+                else:
+                    reason = 'budget'
+                rows.append(dict(cell.config, runs=cell.completed, successes=cell.successes,
+                                 ci_lower=lower, ci_upper=upper, stop_reason=reason))
+        return rows
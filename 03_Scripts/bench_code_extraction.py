@@ -0,0 +1,107 @@
+# bench_code_extraction.py
+#
+# Micro-benchmark of clean_generated_code() over the archived model responses
+# (step1_raw_spec and step2_generated_code_raw of every result.json). It
+# compares the original regex + ast.parse implementation, kept below as the
+# reference, with the code_extraction.py fast path, and reports how many
+# responses are cleaned differently.
+#
+# Example:
+#   python3 03_Scripts/bench_code_extraction.py 04_RawData --repeat 3
+#
+import argparse
+import ast
+import json
+import re
+import time
+
+from code_extraction import extract_code, is_valid_python
+from result_pack import find_result_files, load_result
+
+def reference_clean_generated_code(raw_code, strict_mode=False):
+    """The original implementation of clean_generated_code()."""
+    full_text = raw_code.strip()
+    matches = re.findall(r"```(?:\w+)?\n(.*?)\n```", full_text, re.DOTALL)
+
+    def dedent_block(block_content):
+        lines = block_content.splitlines()
+        min_indent = float('inf')
+        for line in lines:
+            if line.strip():
+                indent = len(line) - len(line.lstrip())
+                min_indent = min(min_indent, indent)
+        if min_indent == float('inf') or min_indent == 0:
+            return block_content
+        dedented_lines = [line[min_indent:] if len(line) >= min_indent else line for line in lines]
+        return "\n".join(dedented_lines)
+
+    if not matches:
+        if full_text.startswith('`') and full_text.endswith('`'):
+            return dedent_block(full_text[1:-1].strip())
+        return dedent_block(full_text)
+
+    if strict_mode:
+        return dedent_block(matches[0].strip())
+    for block in matches:
+        code_candidate = dedent_block(block.strip())
+        try:
+            ast.parse(code_candidate)
+            return code_candidate
+        except SyntaxError:
+            continue
+    return dedent_block(matches[0].strip()) if matches else dedent_block(full_text)
+
+def load_responses(data_dirs):
+    """Returns every recorded raw model response under data_dirs."""
+    responses = []
+    for result_path in find_result_files(data_dirs):
+        try:
+            result = load_result(result_path)
+        except (json.JSONDecodeError, IOError):
+            continue
+        for cycle_log in result.get('logs', []):
+            for key in ('step1_raw_spec', 'step2_generated_code_raw'):
+                if isinstance(cycle_log.get(key), str):
+                    responses.append(cycle_log[key])
+    return responses
+
+def time_calls(clean, responses, strict_mode, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        extract_code.cache_clear()
+        is_valid_python.cache_clear()
+        start = time.perf_counter()
+        for response in responses:
+            clean(response, strict_mode)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clean_generated_code() on archived responses.")
+    parser.add_argument("data_dirs", nargs='*', default=['04_RawData'], help="Directories containing result.json files.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (the best one is reported).")
+    args = parser.parse_args()
+
+    responses = load_responses(args.data_dirs)
+    if not responses:
+        print("No responses found.")
+        return
+    total_chars = sum(len(response) for response in responses)
+    print(f"{len(responses)} responses ({len(set(responses))} distinct, {total_chars / 1e6:.1f} MB)")
+
+    for strict_mode in (True, False):
+        label = 'strict' if strict_mode else 'forgiving'
+        reference = time_calls(reference_clean_generated_code, responses, strict_mode, args.repeat)
+        fast = time_calls(extract_code, responses, strict_mode, args.repeat)
+        # Uncached: the fast path without memoization hits, i.e. every response seen once.
+        uncached = time_calls(lambda response, strict: extract_code.__wrapped__(response, strict),
+                              list(set(responses)), strict_mode, args.repeat)
+        reference_distinct = time_calls(reference_clean_generated_code, list(set(responses)), strict_mode, args.repeat)
+        differing = sum(1 for response in set(responses)
+                        if reference_clean_generated_code(response, strict_mode) != extract_code(response, strict_mode))
+        print(f"{label:9}: reference {reference:.3f}s, fast path {fast:.3f}s ({reference / fast:.1f}x); "
+              f"distinct responses only: {reference_distinct:.3f}s vs {uncached:.3f}s; "
+              f"{differing} distinct responses cleaned differently")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# bench_harness.py
+#
+# Throughput benchmark of the harness itself, runnable on any Linux machine:
+# model calls go to stub_ollama.py (started in this process, replaying the
+# responses recorded in 04_RawData), so the numbers measure our pipeline, not
+# a GPU.
+#
+# Suites:
+#   runner     run_sweep's SweepScheduler over a trial matrix against the stub:
+#              trials/sec, cycles/sec and per-stage latency percentiles
+#              (from the cycle logs' timings)
+#   validator  validate_code() over archived step-2 code, in a fresh python3
+#              process per validation and in a pre-warmed sandbox worker
+#   analysis   analyze_with_ci.analyze_results() and the degradation curve
+#              data over 04_RawData
+#
+# Each suite runs in its own process, so the reported CPU time (own and of its
+# child processes, e.g. validations) and peak RSS belong to that suite alone.
+#
+# Save a run with --output and compare later runs with --baseline: the exit
+# status is 1 if a metric got worse by more than --tolerance (throughput
+# lower, or latency/CPU/memory higher).
+#
+# Example:
+#   python3 03_Scripts/bench_harness.py --output 05_Reports/bench_baseline.json
+#   python3 03_Scripts/bench_harness.py --baseline 05_Reports/bench_baseline.json
+#
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SUITES = ('runner', 'validator', 'analysis')
+STAGES = ('step1_api_call', 'step1_clean', 'step2_api_call', 'step2_clean', 'step2_validate')
+RESULT_PREFIX = 'BENCH_RESULT '
+
+# Differences below these are noise, whatever the relative change.
+ABSOLUTE_FLOORS = {'_ms': 1.0, '_seconds': 0.05, '_mb': 5.0}
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0..100) of a non-empty list."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def latency_metrics(prefix, seconds):
+    """p50/p90/p99 of a list of durations, in milliseconds."""
+    if not seconds:
+        return {}
+    return {f'{prefix}_p{q}_ms': percentile(seconds, q) * 1000 for q in (50, 90, 99)}
+
+def resource_metrics():
+    """CPU time and peak RSS of this process and its finished child processes."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu_seconds': own.ru_utime + own.ru_stime,
+        'children_cpu_seconds': children.ru_utime + children.ru_stime,
+        # ru_maxrss is in kilobytes on Linux.
+        'max_rss_mb': own.ru_maxrss / 1024,
+    }
+
+def _base_dirs():
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    return base_dir, os.path.join(base_dir, '02_Prompts'), os.path.join(base_dir, '01_TestDefinitions')
+
+def run_runner_suite(config):
+    from run_sweep import SweepScheduler, build_trial_matrix
+
+    base_dir, base_prompt_dir, base_test_def_dir = _base_dirs()
+    sandbox = None
+    if config['sandbox_workers']:
+        from sandbox_pool import SandboxPool
+        sandbox = SandboxPool(size=config['sandbox_workers'])
+    results_dir = tempfile.mkdtemp(prefix='bench_runner_')
+    trials = build_trial_matrix(config['models'], config['test_cases'], config['langs'], config['spec_langs'],
+                                config['prompt_styles'], config['num_runs'])
+    scheduler = SweepScheduler(config['api_url'], results_dir, base_prompt_dir, base_test_def_dir,
+                               mode=config['mode'], max_cycles=config['max_cycles'], max_workers=config['max_workers'],
+                               per_model_limit=config['per_model_limit'], stream=config['stream'], sandbox=sandbox)
+    start = time.monotonic()
+    try:
+        completed = scheduler.run(trials)
+    finally:
+        elapsed = time.monotonic() - start
+        if sandbox is not None:
+            sandbox.close()
+        shutil.rmtree(results_dir, ignore_errors=True)
+
+    cycle_logs = [cycle_log for _, result in completed for cycle_log in result.get('logs', [])]
+    metrics = {
+        'trials': len(completed),
+        'wall_seconds': elapsed,
+        'trials_per_sec': len(completed) / elapsed,
+        'cycles_per_sec': len(cycle_logs) / elapsed,
+        'success_rate': sum(1 for _, result in completed if "SUCCESS" in result['status']) / max(1, len(completed)),
+    }
+    for stage in STAGES:
+        metrics.update(latency_metrics(stage, [log['timings'][stage] for log in cycle_logs if stage in log.get('timings', {})]))
+    return metrics
+
+def _archived_validations(data_dirs, base_test_def_dir, limit):
+    """Returns up to `limit` (code, test_def_dir) pairs of archived step-2 code, spread over the archive."""
+    from result_pack import find_result_files, load_result
+    from run_sweep import parse_trial_dir_name
+
+    candidates = []
+    for result_path in find_result_files(data_dirs):
+        trial = parse_trial_dir_name(os.path.basename(os.path.dirname(result_path)))
+        if trial is None:
+            continue
+        candidates.append((result_path, os.path.join(base_test_def_dir, trial['test_case'], 'python')))
+    step = max(1, len(candidates) // limit)
+    # Every step-th trial first, then the others if too few of those have code.
+    ordered = candidates[::step] + [candidate for index, candidate in enumerate(candidates) if index % step]
+    pairs = []
+    for result_path, test_def_dir in ordered:
+        try:
+            logs = load_result(result_path).get('logs', [])
+        except (json.JSONDecodeError, IOError):
+            continue
+        code = next((log['step2_generated_code_clean'] for log in logs if 'step2_generated_code_clean' in log), None)
+        if code is not None:
+            pairs.append((code, test_def_dir))
+        if len(pairs) == limit:
+            break
+    return pairs
+
+def run_validator_suite(config):
+    from run_cycle_test_syntactic import validate_code
+    from sandbox_pool import SandboxPool
+
+    base_dir, _, base_test_def_dir = _base_dirs()
+    pairs = _archived_validations(config['data_dirs'], base_test_def_dir, config['validations'])
+    metrics = {'validations': len(pairs)}
+    with SandboxPool(size=1) as sandbox:
+        for label, pool in (('subprocess', None), ('sandbox', sandbox)):
+            durations = []
+            start = time.monotonic()
+            for code, test_def_dir in pairs:
+                call_start = time.monotonic()
+                validate_code(code, test_def_dir, sandbox=pool)
+                durations.append(time.monotonic() - call_start)
+            elapsed = time.monotonic() - start
+            metrics[f'{label}_validations_per_sec'] = len(pairs) / elapsed if elapsed else 0.0
+            metrics.update(latency_metrics(f'{label}_validate', durations))
+    return metrics
+
+def run_analysis_suite(config):
+    base_dir = _base_dirs()[0]
+    sys.path.insert(0, os.path.join(base_dir, '05_Reports'))
+    import analyze_with_ci
+    import generate_degradation_data
+    from result_pack import find_result_files
+
+    files = sum(1 for _ in find_result_files(config['data_dirs']))
+    metrics = {'result_files': files}
+    output_dir = tempfile.mkdtemp(prefix='bench_analysis_')
+    try:
+        for label, run in (
+            ('analyze_with_ci', lambda: [analyze_with_ci.analyze_results(data_dir) for data_dir in config['data_dirs']]),
+            ('degradation_data', lambda: generate_degradation_data.main(config['data_dirs'], os.path.join(output_dir, 'degradation_data.csv'))),
+        ):
+            start = time.monotonic()
+            run()
+            elapsed = time.monotonic() - start
+            metrics[f'{label}_seconds'] = elapsed
+            metrics[f'{label}_files_per_sec'] = files / elapsed if elapsed else 0.0
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return metrics
+
+SUITE_FUNCTIONS = {'runner': run_runner_suite, 'validator': run_validator_suite, 'analysis': run_analysis_suite}
+
+def run_suite_process(name, config):
+    """Runs one suite in a child process and returns its metrics (or {'error': ...})."""
+    process = subprocess.run([sys.executable, os.path.realpath(__file__), 'suite', name, json.dumps(config)],
+                             capture_output=True, text=True)
+    for line in reversed(process.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    return {'error': (process.stderr.strip().splitlines() or [f'exit status {process.returncode}'])[-1]}
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def lower_is_better(metric):
+    return not (metric.endswith('_per_sec') or metric == 'success_rate')
+
+def compare(results, baseline, tolerance):
+    """Returns a list of (suite, metric, old, new) that got worse by more than tolerance."""
+    regressions = []
+    for suite, metrics in results.items():
+        old_metrics = baseline.get('suites', {}).get(suite, {})
+        for metric, new in metrics.items():
+            old = old_metrics.get(metric)
+            if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or metric in ('trials', 'validations', 'result_files'):
+                continue
+            floor = next((value for suffix, value in ABSOLUTE_FLOORS.items() if metric.endswith(suffix)), 0.0)
+            if lower_is_better(metric):
+                worse = new > old * (1 + tolerance) and new - old > floor
+            else:
+                worse = new < old * (1 - tolerance)
+            if worse:
+                regressions.append((suite, metric, old, new))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the harness (runner, validator, analysis) against a local stub Ollama server.")
+    parser.add_argument("--suites", nargs='+', default=list(SUITES), choices=SUITES, help="Suites to run.")
+    parser.add_argument("--data-dirs", nargs='+', default=None, help="Archived result.json directories (default: 04_RawData).")
+    parser.add_argument("--api-url", default=None, help="Benchmark against this server instead of a built-in stub.")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Stub: seconds before the first token.")
+    parser.add_argument("--stub-token-rate", type=float, default=0.0, help="Stub: generated tokens per second (0 = instant).")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="Stub: fraction of failed requests.")
+    parser.add_argument("--stub-num-parallel", type=int, default=8, help="Stub: concurrently generated requests.")
+    parser.add_argument("--models", nargs='+', default=['gemma3:4b', 'falcon3:3b', 'llama3.2:3b'], help="Runner: models of the trial matrix.")
+    parser.add_argument("--test-cases", nargs='+', default=['fizzbuzz', 'separate_vowels_and_consonants'], help="Runner: test cases.")
+    parser.add_argument("--langs", nargs='+', default=['en'], help="Runner: prompt languages.")
+    parser.add_argument("--spec-langs", nargs='+', default=['pseudocode'], help="Runner: specification languages.")
+    parser.add_argument("--prompt-styles", nargs='+', default=['hyper_guided'], help="Runner: prompt styles.")
+    parser.add_argument("--num-runs", type=int, default=5, help="Runner: runs per combination.")
+    parser.add_argument("--max-cycles", type=int, default=10, help="Runner: cycles per trial.")
+    parser.add_argument("--mode", default='forgiving', choices=['strict', 'forgiving', 'composite'], help="Runner: evaluation mode.")
+    parser.add_argument("--max-workers", type=int, default=8, help="Runner: concurrent trials.")
+    parser.add_argument("--per-model-limit", type=int, default=4, help="Runner: concurrent trials per model.")
+    parser.add_argument("--stream", action='store_true', help="Runner: use streaming requests.")
+    parser.add_argument("--sandbox-workers", type=int, default=0, help="Runner: validate in this many sandbox workers (0 = subprocess per validation).")
+    parser.add_argument("--validations", type=int, default=200, help="Validator: number of archived programs to validate.")
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", default=None, help="JSON file of an earlier run to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative change counted as a regression.")
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'suite':
+        # Child process: run one suite and print its metrics.
+        name, config = sys.argv[2], json.loads(sys.argv[3])
+        metrics = SUITE_FUNCTIONS[name](config)
+        metrics.update(resource_metrics())
+        print(RESULT_PREFIX + json.dumps(metrics), flush=True)
+        return
+
+    args = parser.parse_args()
+    base_dir, base_prompt_dir, base_test_def_dir = _base_dirs()
+    data_dirs = args.data_dirs or [os.path.join(base_dir, '04_RawData')]
+
+    server = None
+    api_url = args.api_url
+    if api_url is None and 'runner' in args.suites:
+        from stub_ollama import RecordedCorpus, start_server
+        corpus = RecordedCorpus.load(data_dirs, base_prompt_dir, base_test_def_dir, models=args.models)
+        server = start_server(corpus, port=_free_port(), latency=args.stub_latency, token_rate=args.stub_token_rate,
+                              error_rate=args.stub_error_rate, num_parallel=args.stub_num_parallel, seed=0)
+        api_url = f'http://127.0.0.1:{server.server_address[1]}'
+        print(f"Stub server on {api_url} with {corpus.trials} recorded trials.")
+
+    config = {
+        'api_url': api_url, 'data_dirs': data_dirs, 'models': args.models, 'test_cases': args.test_cases,
+        'langs': args.langs, 'spec_langs': args.spec_langs, 'prompt_styles': args.prompt_styles,
+        'num_runs': args.num_runs, 'max_cycles': args.max_cycles, 'mode': args.mode, 'max_workers': args.max_workers,
+        'per_model_limit': args.per_model_limit, 'stream': args.stream, 'sandbox_workers': args.sandbox_workers,
+        'validations': args.validations, 'stub_latency': args.stub_latency, 'stub_token_rate': args.stub_token_rate,
+        'stub_error_rate': args.stub_error_rate, 'stub_num_parallel': args.stub_num_parallel,
+    }
+    results = {}
+    for name in args.suites:
+        print(f"Running suite '{name}'...", flush=True)
+        results[name] = run_suite_process(name, config)
+        for metric, value in results[name].items():
+            print(f"  {metric:36} {value:.4g}" if isinstance(value, float) else f"  {metric:36} {value}")
+    if server is not None:
+        results['runner']['stub'] = dict(server.stats)
+        server.shutdown()
+        server.server_close()
+
+    report = {'time': time.time(), 'host': socket.gethostname(), 'python': sys.version.split()[0],
+              'config': {k: v for k, v in config.items() if k != 'api_url'}, 'suites': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print("Warning: the baseline was run with a different configuration.")
+        regressions = compare(results, baseline, args.tolerance)
+        for suite, metric, old, new in regressions:
+            print(f"REGRESSION {suite}.{metric}: {old:.4g} -> {new:.4g}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# checkpoint_tree.py
+#
+# Fork-from-checkpoint execution of round-trip cycles.
+#
+# The outcome of one cycle depends only on the trial configuration (model,
+# mode, test case, lang, spec_lang, prompt_style) and the code the cycle starts
+# from. For greedy generation (temperature 0) the runs of a configuration
+# therefore form a tree: every run starts at the root (initial_code.py),
+# identical prefixes are computed once, and runs only branch where the
+# generated code diverges. CheckpointTree stores one node per
+# (configuration, current_code) with the finished cycle log; iter_cycle() asks
+# the tree before computing a cycle and publishes what it computed, so each
+# run's result.json still contains a complete `logs` list.
+#
+# Concurrent runs that reach the same node wait for the run computing it
+# instead of calling the model a second time. Cycles that end in a failed
+# model call are not stored, since the failure is not a property of the code.
+#
+# Do not use this with sampled generation, seeded or not: runs with per-run
+# seeds are distinct samples, and sharing would collapse them into one.
+#
+import hashlib
+import json
+import threading
+
+class CheckpointTree:
+    """Thread-safe store of computed cycles shared by all runs of a sweep."""
+
+    def __init__(self):
+        self.computed = 0
+        self.reused = 0
+        self._nodes = {}
+        self._in_progress = {}
+        self._lock = threading.Lock()
+
+    def scope(self, model, mode, test_case, lang, spec_lang, prompt_style, options=None):
+        """
+        Returns the view of the tree for one trial configuration, to pass to
+        iter_cycle(). Runs with different generation options never share
+        cycles; run_sweep.py leaves the per-run seed out, as it has no effect
+        at temperature 0.
+        """
+        return _ScopedCheckpoints(self, (model, mode, test_case, lang, spec_lang, prompt_style,
+                                         json.dumps(options or {}, sort_keys=True)))
+
+    def _acquire(self, key):
+        while True:
+            with self._lock:
+                if key in self._nodes:
+                    self.reused += 1
+                    return self._nodes[key]
+                event = self._in_progress.get(key)
+                if event is None:
+                    self._in_progress[key] = threading.Event()
+                    return None
+            event.wait()
+
+    def _release(self, key, cycle_log):
+        with self._lock:
+            if cycle_log is not None:
+                self._nodes[key] = cycle_log
+                self.computed += 1
+            self._in_progress.pop(key).set()
+
+    def summary(self):
+        total = self.computed + self.reused
+        share = (self.reused / total * 100) if total else 0.0
+        return f"Checkpoint tree: {self.computed} cycles computed, {self.reused} reused from shared prefixes ({share:.1f}%)"
+
+class _ScopedCheckpoints:
+    def __init__(self, tree, config):
+        self._tree = tree
+        self._config = config
+
+    def _key(self, current_code):
+        return self._config + (hashlib.sha256(current_code.encode('utf-8', 'surrogatepass')).hexdigest(),)
+
+    def acquire(self, current_code):
+        """
+        Returns the stored cycle log (without its 'cycle' number) for a cycle
+        starting from current_code, or None. On None the caller owns the node
+        and must call release() once the cycle is finished or abandoned.
+        """
+        return self._tree._acquire(self._key(current_code))
+
+    def release(self, current_code, cycle_log):
+        """Publishes the computed cycle log, or abandons the node with cycle_log=None."""
+        self._tree._release(self._key(current_code), cycle_log)
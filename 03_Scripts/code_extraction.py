@@ -0,0 +1,141 @@
+# code_extraction.py
+#
+# Fast path behind clean_generated_code(): finds fenced code blocks in a
+# model response and picks the one to evaluate.
+#
+# iter_fenced_blocks() is a single left-to-right scan with str.find that
+# yields exactly the blocks of the original
+#     re.findall(r"```(?:\w+)?\n(.*?)\n```", text, re.DOTALL)
+# (same language-tag rule, same closing rule, same non-overlapping restart),
+# so results of archived trials do not change.
+#
+# iter_loose_blocks() is only consulted in forgiving mode when a response has
+# no such block at all. It reads Markdown-style fences line by line: ``` or ~~~
+# fences of any length, indented fences (their indentation is removed from the
+# content), any info string after the fence, and an unterminated fence that
+# runs to the end of the response.
+#
+# Whether a candidate parses is memoized per block text (is_valid_python), and
+# whole clean_generated_code() results are memoized per (response, mode): the
+# archive holds the same responses many times over, and step1/step2 of
+# deterministic runs repeat as well.
+#
+# Benchmark against the original implementation with:
+#   python3 03_Scripts/bench_code_extraction.py 04_RawData
+#
+import ast
+from functools import lru_cache
+
+FENCE = '```'
+
+def _is_word_char(ch):
+    # Same definition as \w in a str pattern.
+    return ch.isalnum() or ch == '_'
+
+def iter_fenced_blocks(text):
+    """Yields the contents of the ```tag\\n...\\n``` blocks of text, like the original regex."""
+    length = len(text)
+    start = text.find(FENCE)
+    while start != -1:
+        # Optional language tag made of word characters, then a newline.
+        position = start + 3
+        while position < length and _is_word_char(text[position]):
+            position += 1
+        if position < length and text[position] == '\n':
+            close = text.find('\n' + FENCE, position + 1)
+            if close == -1:
+                # No closing fence after this point, so no later fence can close either.
+                return
+            yield text[position + 1:close]
+            start = text.find(FENCE, close + 4)
+        else:
+            # Not an opening fence here; the regex retries one character later.
+            start = text.find(FENCE, start + 1)
+
+def _fence_marker(line):
+    """Returns (indent, fence) if line opens or closes a ``` / ~~~ fence, else None."""
+    stripped = line.lstrip(' ')
+    indent = len(line) - len(stripped)
+    for char in '`~':
+        if stripped.startswith(char * 3):
+            run = len(stripped) - len(stripped.lstrip(char))
+            return indent, stripped[:run]
+    return None
+
+def iter_loose_blocks(text):
+    """Yields the contents of Markdown-style fenced blocks, including ~~~, indented and unterminated fences."""
+    lines = text.split('\n')
+    index = 0
+    while index < len(lines):
+        marker = _fence_marker(lines[index])
+        index += 1
+        if marker is None:
+            continue
+        indent, fence = marker
+        body = []
+        while index < len(lines):
+            line = lines[index]
+            index += 1
+            closing = _fence_marker(line)
+            if closing is not None and closing[1][0] == fence[0] and len(closing[1]) >= len(fence) \
+                    and not line.strip()[len(closing[1]):]:
+                break
+            # Remove up to the fence's own indentation from the content.
+            removable = len(line) - len(line.lstrip(' '))
+            body.append(line[min(indent, removable):])
+        yield '\n'.join(body)
+
+def dedent_block(block_content):
+    """Removes the common indentation of the non-empty lines of a block."""
+    if not block_content or not block_content[0].isspace():
+        # The first line is not indented, so the common indentation is zero.
+        return block_content
+    lines = block_content.splitlines()
+    min_indent = min((len(line) - len(line.lstrip()) for line in lines if line.strip()), default=0)
+    if min_indent == 0:
+        return block_content
+    return "\n".join(line[min_indent:] if len(line) >= min_indent else line for line in lines)
+
+@lru_cache(maxsize=65536)
+def is_valid_python(code):
+    """True if code parses (ast.parse), memoized per block text."""
+    try:
+        ast.parse(code)
+        return True
+    except SyntaxError:
+        return False
+
+@lru_cache(maxsize=16384)
+def extract_code(raw_code, strict_mode=False):
+    """
+    Strict mode: the first fenced block. Forgiving mode: the first fenced block
+    that parses, then the first loosely fenced block that parses, then the
+    first fenced block. Without any block the response itself is used (minus
+    surrounding backticks).
+    """
+    full_text = raw_code.strip()
+    blocks = iter_fenced_blocks(full_text)
+    first = next(blocks, None)
+
+    if first is None:
+        if not strict_mode:
+            for block in iter_loose_blocks(full_text):
+                candidate = dedent_block(block.strip('\n')).strip()
+                if candidate and is_valid_python(candidate):
+                    return candidate
+        # Fallback for non-markdown blocks, strip outer backticks if present
+        if full_text.startswith('`') and full_text.endswith('`'):
+            return dedent_block(full_text[1:-1].strip())
+        return dedent_block(full_text)
+
+    first_candidate = dedent_block(first.strip())
+    if strict_mode:
+        return first_candidate
+    if is_valid_python(first_candidate):
+        return first_candidate
+    for block in blocks:
+        candidate = dedent_block(block.strip())
+        if is_valid_python(candidate):
+            return candidate
+    # Fallback if no valid block found in forgiving mode
+    return first_candidate
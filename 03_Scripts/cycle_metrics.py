@@ -0,0 +1,267 @@
+# cycle_metrics.py
+#
+# Per-stage latency and token traces of finished trials.
+#
+# Every cycle log carries the wall time of each stage in `timings`
+# (step1_api_call, step1_clean, step2_api_call, step2_clean, step2_validate)
+# and the Ollama-reported token counts and durations in step1_stats /
+# step2_stats (prompt_eval_count, eval_count, load_duration,
+# prompt_eval_duration, eval_duration, total_duration). This module turns them
+# into one trace record per cycle and writes them either as JSON lines or as
+# OpenMetrics/Prometheus text aggregated per model (for a node_exporter
+# textfile collector or a quick `grep`). Like the JSON lines, the OpenMetrics
+# counters accumulate across writers, including one process per trial as in
+# the bash drivers; <file>.lock serializes them. Delete the file to start over.
+#
+# Usage:
+#   python3 03_Scripts/run_sweep.py ... --trace 07_Logs/sweep_trace.jsonl
+#   python3 03_Scripts/run_sweep.py ... --trace 07_Logs/sweep.prom --trace-format openmetrics
+#
+#   # Tokens/sec and cost per successful cycle, per model
+#   python3 03_Scripts/cycle_metrics.py summarize 07_Logs/sweep_trace.jsonl \
+#       --output 05_Reports/cost_per_model.csv
+#
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows.
+    fcntl = None
+
+STAGES = ('step1_api_call', 'step1_clean', 'step2_api_call', 'step2_clean', 'step2_validate')
+TOKEN_FIELDS = ('prompt_eval_count', 'eval_count', 'prompt_eval_tokens_saved')
+SERVER_FIELDS = ('load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration')
+
+def cycle_records(trial, result):
+    """Yields one flat trace record per cycle of a finished trial."""
+    for cycle_log in result.get('logs', []):
+        record = {key: trial.get(key) for key in ('model', 'test_case', 'lang', 'spec_lang', 'prompt_style', 'run')}
+        record['cycle'] = cycle_log.get('cycle')
+        record['success'] = cycle_log.get('step2_status') == 'SUCCESS'
+        record['shared_prefix'] = bool(cycle_log.get('shared_prefix'))
+        record.update(cycle_log.get('timings') or {})
+        for step in ('step1', 'step2'):
+            stats = cycle_log.get(f'{step}_stats') or {}
+            for field in TOKEN_FIELDS + SERVER_FIELDS:
+                if field in stats:
+                    record[f'{step}_{field}'] = stats[field]
+        yield record
+
+class JsonlTraceWriter:
+    """Appends one JSON line per cycle; safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write_trial(self, trial, result):
+        lines = [json.dumps(dict(record, time=time.time())) for record in cycle_records(trial, result)]
+        with self._lock:
+            self._file.write(''.join(line + '\n' for line in lines))
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# (metric name in the file, counter attribute of OpenMetricsWriter, label names, value type)
+OPENMETRICS_SERIES = (
+    ('roundtrip_stage_seconds_sum', '_stage_seconds', ('model', 'stage'), float),
+    ('roundtrip_stage_seconds_count', '_stage_count', ('model', 'stage'), int),
+    ('roundtrip_tokens_total', '_tokens', ('model', 'kind'), int),
+    ('roundtrip_server_seconds_total', '_server_seconds', ('model', 'phase'), float),
+    ('roundtrip_cycles_total', '_cycles', ('model', 'outcome'), int),
+)
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def _unescape_label_value(value):
+    return re.sub(r'\\(.)', lambda match: '\n' if match.group(1) == 'n' else match.group(1), value)
+
+class OpenMetricsWriter:
+    """
+    Aggregates stage latencies, token counts and cycle outcomes per model and
+    rewrites the metrics file (atomically) after every trial. The counts of
+    an existing file are carried over, so writers in successive or concurrent
+    processes (e.g. one run_cycle_test_syntactic.py per trial) add up instead
+    of overwriting each other.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Counts not yet merged into the file.
+        self._stage_seconds = defaultdict(float)
+        self._stage_count = defaultdict(int)
+        self._tokens = defaultdict(int)
+        self._server_seconds = defaultdict(float)
+        self._cycles = defaultdict(int)
+
+    def write_trial(self, trial, result):
+        with self._lock:
+            for record in cycle_records(trial, result):
+                model = record['model']
+                self._cycles[(model, 'success' if record['success'] else 'failure')] += 1
+                if record['shared_prefix']:
+                    # Reused from another run: no time or tokens were spent on it.
+                    continue
+                for stage in STAGES:
+                    if stage in record:
+                        self._stage_seconds[(model, stage)] += record[stage]
+                        self._stage_count[(model, stage)] += 1
+                for step in ('step1', 'step2'):
+                    for field in TOKEN_FIELDS:
+                        self._tokens[(model, field.replace('_count', ''))] += record.get(f'{step}_{field}', 0)
+                    for field in SERVER_FIELDS:
+                        self._server_seconds[(model, field.replace('_duration', ''))] += record.get(f'{step}_{field}', 0.0)
+            self._flush()
+
+    def _read_totals(self):
+        """Returns {counter attribute: {labels: value}} from the current metrics file."""
+        totals = {attribute: {} for _, attribute, _, _ in OPENMETRICS_SERIES}
+        series = {name: (attribute, label_names, value_type) for name, attribute, label_names, value_type in OPENMETRICS_SERIES}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return totals
+        for line in lines:
+            match = _SAMPLE.match(line)
+            if match is None or match.group(1) not in series:
+                continue
+            attribute, label_names, value_type = series[match.group(1)]
+            labels = {name: _unescape_label_value(value) for name, value in _LABEL.findall(match.group(2))}
+            key = tuple(labels.get(name, '') for name in label_names)
+            totals[attribute][key] = value_type(float(match.group(3)))
+        return totals
+
+    def _flush(self):
+        with _file_lock(self.path + '.lock'):
+            totals = self._read_totals()
+            for _, attribute, _, _ in OPENMETRICS_SERIES:
+                for key, value in getattr(self, attribute).items():
+                    totals[attribute][key] = totals[attribute].get(key, 0) + value
+            self._write(totals)
+        self._reset()
+
+    def _write(self, totals):
+        lines = [
+            '# HELP roundtrip_stage_seconds Wall time of each cycle stage.',
+            '# TYPE roundtrip_stage_seconds summary',
+        ]
+        for (model, stage), total in sorted(totals['_stage_seconds'].items()):
+            labels = f'model="{_label_value(model)}",stage="{stage}"'
+            lines.append(f'roundtrip_stage_seconds_sum{{{labels}}} {total}')
+            lines.append(f'roundtrip_stage_seconds_count{{{labels}}} {totals["_stage_count"].get((model, stage), 0)}')
+        lines += ['# HELP roundtrip_tokens Tokens reported by Ollama.', '# TYPE roundtrip_tokens counter']
+        for (model, kind), total in sorted(totals['_tokens'].items()):
+            lines.append(f'roundtrip_tokens_total{{model="{_label_value(model)}",kind="{kind}"}} {total}')
+        lines += ['# HELP roundtrip_server_seconds Durations reported by Ollama.', '# TYPE roundtrip_server_seconds counter']
+        for (model, phase), total in sorted(totals['_server_seconds'].items()):
+            lines.append(f'roundtrip_server_seconds_total{{model="{_label_value(model)}",phase="{phase}"}} {total}')
+        lines += ['# HELP roundtrip_cycles Finished cycles by outcome.', '# TYPE roundtrip_cycles counter']
+        for (model, outcome), total in sorted(totals['_cycles'].items()):
+            lines.append(f'roundtrip_cycles_total{{model="{_label_value(model)}",outcome="{outcome}"}} {total}')
+        lines.append('# EOF')
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+@contextmanager
+def _file_lock(lock_path):
+    """Exclusive lock between processes (a no-op where fcntl is unavailable)."""
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def open_trace_writer(path, trace_format='jsonl'):
+    if trace_format == 'openmetrics':
+        return OpenMetricsWriter(path)
+    return JsonlTraceWriter(path)
+
+def summarize_trace(trace_paths):
+    """
+    Builds a per-model table from JSONL traces: cycles, successful cycles,
+    generated tokens/sec and the tokens and wall seconds spent per successful
+    cycle. Cycles reused from a shared prefix count as outcomes but not as cost.
+    """
+    import pandas as pd
+
+    records = []
+    for path in trace_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+
+    for column in STAGES + tuple(f'{step}_{field}' for step in ('step1', 'step2') for field in TOKEN_FIELDS + SERVER_FIELDS):
+        if column not in df:
+            df[column] = 0.0
+    df = df.fillna(0)
+    spent = ~df['shared_prefix'].astype(bool)
+    df['wall_seconds'] = df[list(STAGES)].sum(axis=1) * spent
+    df['tokens'] = (df['step1_prompt_eval_count'] + df['step1_eval_count']
+                    + df['step2_prompt_eval_count'] + df['step2_eval_count']) * spent
+    df['eval_tokens'] = (df['step1_eval_count'] + df['step2_eval_count']) * spent
+    df['eval_seconds'] = (df['step1_eval_duration'] + df['step2_eval_duration']) * spent
+
+    summary = df.groupby('model').agg(
+        cycles=('cycle', 'count'),
+        successful_cycles=('success', 'sum'),
+        tokens=('tokens', 'sum'),
+        eval_tokens=('eval_tokens', 'sum'),
+        eval_seconds=('eval_seconds', 'sum'),
+        wall_seconds=('wall_seconds', 'sum'),
+    ).reset_index()
+    summary['tokens_per_second'] = summary['eval_tokens'] / summary['eval_seconds'].where(summary['eval_seconds'] > 0)
+    successful = summary['successful_cycles'].where(summary['successful_cycles'] > 0)
+    summary['tokens_per_successful_cycle'] = summary['tokens'] / successful
+    summary['seconds_per_successful_cycle'] = summary['wall_seconds'] / successful
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize per-cycle traces written with --trace.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = subparsers.add_parser("summarize", help="Per-model tokens/sec and cost per successful cycle.")
+    summarize_parser.add_argument("traces", nargs='+', help="JSONL trace files.")
+    summarize_parser.add_argument("--output", default=None, help="Also save the table as CSV.")
+
+    args = parser.parse_args()
+
+    if args.command == "summarize":
+        summary = summarize_trace(args.traces)
+        if summary.empty:
+            print("No trace records found.")
+            return
+        print(summary.to_string(index=False))
+        if args.output:
+            summary.to_csv(args.output, index=False)
+            print(f"Saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
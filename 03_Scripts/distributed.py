@@ -0,0 +1,328 @@
+# distributed.py
+#
+# Runs one sweep across several Ollama hosts.
+#
+# The coordinator holds the trial matrix: it plans every trial into the
+# sweep's durable work queue (<results_dir>/work_queue.sqlite, see
+# work_queue.py), requeues trials whose worker died (expired lease) and exits
+# once every trial is done. Workers are separate processes on the same machine
+# (or sharing the results directory) that claim pending trials from the queue
+# and write result.json into the usual per-trial layout, so
+# 05_Reports/analyze_with_ci.py works unchanged.
+#
+# Each worker is bound to a list of endpoints (EndpointPool) with a
+# concurrency limit per endpoint. Every model call goes to the healthy
+# endpoint with the lowest expected wait, (active calls + 1) x smoothed
+# seconds per call, so slow hosts get less work. A failed call marks its
+# endpoint unhealthy and is retried on another one; a background health check
+# (GET /api/tags) brings endpoints back once they answer again.
+#
+# Usage:
+#   python3 03_Scripts/distributed.py coordinator --models gemma3:4b falcon3:3b \
+#       --test-cases fizzbuzz --num-runs 30 --results-dir 04_RawData/sweep_forgiving_n30_multi &
+#   python3 03_Scripts/distributed.py worker --results-dir 04_RawData/sweep_forgiving_n30_multi \
+#       --endpoints http://hostA:11434 http://hostB:11434 --per-endpoint-limit 2 &
+#   python3 03_Scripts/distributed.py worker --results-dir 04_RawData/sweep_forgiving_n30_multi \
+#       --endpoints http://hostC:11434 --endpoint-limit http://hostC:11434=4 &
+#   wait
+#
+import argparse
+import os
+import socket
+import threading
+import time
+
+import requests
+
+from model_affinity import ollama_base_url
+from run_cycle_test_syntactic import (
+    call_ollama_api, call_ollama_api_stream, add_generation_arguments, add_chat_argument, add_suite_report_argument,
+    generation_options
+)
+from run_sweep import (
+    SweepScheduler, build_trial_matrix, add_matrix_arguments, default_results_dir, parse_model_limits
+)
+from work_queue import WorkQueue, QUEUE_FILE_NAME
+
+class _Endpoint:
+    def __init__(self, url, limit):
+        self.url = url
+        self.limit = limit
+        self.active = 0
+        self.healthy = True
+        self.latency = None  # smoothed seconds per successful call
+        self.calls = 0
+        self.failures = 0
+
+class EndpointPool:
+    """
+    A set of Ollama endpoints with per-endpoint concurrency limits and health
+    checks. generate() blocks until a healthy endpoint has a free slot.
+    """
+
+    def __init__(self, endpoint_limits, health_interval=10.0, smoothing=0.3, health_timeout=5):
+        self._endpoints = [_Endpoint(url, max(1, limit)) for url, limit in endpoint_limits.items()]
+        self.health_interval = health_interval
+        self.smoothing = smoothing
+        self.health_timeout = health_timeout
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def urls(self):
+        return [endpoint.url for endpoint in self._endpoints]
+
+    @property
+    def capacity(self):
+        return sum(endpoint.limit for endpoint in self._endpoints)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _is_up(self, endpoint):
+        try:
+            response = requests.get(ollama_base_url(endpoint.url) + '/api/tags', timeout=self.health_timeout)
+            return response.status_code < 500
+        except requests.exceptions.RequestException:
+            return False
+
+    def check_health(self):
+        """Probes every endpoint once and updates its health."""
+        results = {endpoint.url: self._is_up(endpoint) for endpoint in self._endpoints}
+        with self._cond:
+            for endpoint in self._endpoints:
+                if endpoint.healthy != results[endpoint.url]:
+                    print(f"Endpoint {endpoint.url} is {'back up' if results[endpoint.url] else 'down'}.")
+                endpoint.healthy = results[endpoint.url]
+            self._cond.notify_all()
+
+    def start(self):
+        """Checks all endpoints and starts the background health checks."""
+        self.check_health()
+        self._thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def _expected_wait(self, endpoint):
+        known = [e.latency for e in self._endpoints if e.latency is not None]
+        # Endpoints without a measurement yet are assumed to be as fast as the fastest one.
+        latency = endpoint.latency if endpoint.latency is not None else (min(known) if known else 1.0)
+        return (endpoint.active + 1) * latency
+
+    def _acquire(self, exclude):
+        with self._cond:
+            while True:
+                healthy = [e for e in self._endpoints if e.healthy and e.url not in exclude]
+                if not healthy and exclude:
+                    return None
+                free = [e for e in healthy if e.active < e.limit]
+                if free:
+                    endpoint = min(free, key=self._expected_wait)
+                    endpoint.active += 1
+                    return endpoint
+                # Wait for a slot, or for the health check to bring an endpoint back.
+                self._cond.wait(timeout=self.health_interval)
+
+    def _release(self, endpoint, elapsed, ok):
+        with self._cond:
+            endpoint.active -= 1
+            if ok:
+                endpoint.calls += 1
+                if endpoint.latency is None:
+                    endpoint.latency = elapsed
+                else:
+                    endpoint.latency += self.smoothing * (elapsed - endpoint.latency)
+            else:
+                endpoint.failures += 1
+                if endpoint.healthy:
+                    print(f"Endpoint {endpoint.url} failed a call; moving work to the other endpoints.")
+                endpoint.healthy = False
+            self._cond.notify_all()
+
+    def generate(self, model, prompt, stream=False, strict_mode=False, options=None, keep_alive=None, chat=False):
+        """
+        Calls the model on the best available endpoint and retries a failed
+        call on the others. Returns the response (with the endpoint recorded in
+        its stats) or None once every healthy endpoint has failed it.
+        """
+        tried = set()
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                return None
+            start = time.monotonic()
+            response = None
+            try:
+                if stream:
+                    response = call_ollama_api_stream(endpoint.url, model, prompt, strict_mode=strict_mode,
+                                                      options=options, keep_alive=keep_alive, chat=chat)
+                else:
+                    response = call_ollama_api(endpoint.url, model, prompt, options=options, keep_alive=keep_alive,
+                                               chat=chat)
+            finally:
+                self._release(endpoint, time.monotonic() - start, response is not None)
+            if response is not None:
+                response.stats['endpoint'] = endpoint.url
+                return response
+            tried.add(endpoint.url)
+
+    def summary(self):
+        lines = []
+        with self._cond:
+            for endpoint in self._endpoints:
+                latency = f"{endpoint.latency:.2f}s/call" if endpoint.latency is not None else "no calls"
+                lines.append(f"  {endpoint.url}: {endpoint.calls} calls, {endpoint.failures} failures, {latency}, "
+                             f"{'healthy' if endpoint.healthy else 'down'}")
+        return "Endpoints:\n" + "\n".join(lines)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def parse_endpoint_limits(endpoints, per_endpoint_limit, overrides):
+    """Returns {url: concurrency limit} for --endpoints, applying URL=N overrides."""
+    limits = {url: per_endpoint_limit for url in endpoints}
+    for url, limit in parse_model_limits(overrides).items():
+        limits[url] = limit
+    return limits
+
+def run_coordinator(args, parser, base_dir):
+    results_dir = args.results_dir or default_results_dir(base_dir, args.mode, args.num_runs)
+    if args.resume and not os.path.exists(os.path.join(results_dir, QUEUE_FILE_NAME)):
+        parser.error(f"--resume: no work queue found in {results_dir}")
+    os.makedirs(results_dir, exist_ok=True)
+
+    with WorkQueue.for_results_dir(results_dir) as queue:
+        config = {'mode': args.mode, 'max_cycles': args.max_cycles, 'adaptive': False,
+                  'options': generation_options(args)}
+        if args.chat:
+            config['chat'] = True
+        if args.suite_report:
+            config['suite_report'] = True
+        try:
+            queue.check_config(config, args.resume)
+        except ValueError as e:
+            parser.error(f"{results_dir} {e}")
+        planned = queue.plan(build_trial_matrix(args.models, args.test_cases, args.langs, args.spec_langs,
+                                                args.prompt_styles, args.num_runs))
+        if args.resume:
+            # Running trials belong to live workers or expire on their own.
+            queue.requeue_unfinished(states=('failed',))
+        print(f"Coordinator: planned {planned} new trials in {results_dir}")
+        print(queue.summary())
+        if args.plan_only:
+            return
+
+        last = None
+        while True:
+            requeued = queue.requeue_expired()
+            if requeued:
+                print(f"Requeued {requeued} trials whose worker stopped renewing its lease.")
+            summary = queue.summary()
+            if summary != last:
+                print(summary)
+                last = summary
+            counts = queue.counts()
+            if not counts.get('pending') and not counts.get('running'):
+                break
+            time.sleep(args.check_interval)
+    print(f"Results are in: {results_dir}")
+
+def run_worker(args, parser, base_dir):
+    if not os.path.exists(os.path.join(args.results_dir, QUEUE_FILE_NAME)):
+        parser.error(f"No work queue found in {args.results_dir}; start the coordinator first.")
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    try:
+        endpoint_limits = parse_endpoint_limits(args.endpoints, args.per_endpoint_limit, args.endpoint_limit)
+        model_limits = parse_model_limits(args.model_limit)
+    except ValueError as e:
+        parser.error(str(e))
+
+    queue = WorkQueue.for_results_dir(args.results_dir)
+    config = queue.get_meta('config')
+    pool = EndpointPool(endpoint_limits, health_interval=args.health_interval)
+
+    sandbox = None
+    if args.sandbox_workers > 0:
+        from sandbox_pool import SandboxPool
+        sandbox = SandboxPool(size=args.sandbox_workers, max_tasks=args.sandbox_max_tasks)
+
+    validation_cache = None
+    if args.validation_cache:
+        from validation_cache import ValidationCache
+        validation_cache = ValidationCache(args.validation_cache)
+
+    print(f"Worker {worker_id}: {len(endpoint_limits)} endpoints, {pool.capacity} concurrent trials")
+    scheduler = SweepScheduler(
+        pool.urls[0], args.results_dir, os.path.join(base_dir, '02_Prompts'), os.path.join(base_dir, '01_TestDefinitions'),
+        mode=config['mode'], max_cycles=config['max_cycles'], max_workers=pool.capacity,
+        per_model_limit=args.per_model_limit or pool.capacity, model_limits=model_limits,
+        stream=args.stream, sandbox=sandbox, validation_cache=validation_cache,
+        options=config['options'], keep_alive=args.keep_alive, work_queue=queue, endpoints=pool,
+        chat=config.get('chat', False), suite_report=config.get('suite_report', False)
+    )
+
+    start = time.monotonic()
+    try:
+        with pool:
+            completed = scheduler.run_worker(worker_id, lease=args.lease, poll_interval=args.check_interval)
+            print(pool.summary())
+    finally:
+        if sandbox is not None:
+            sandbox.close()
+        if validation_cache is not None:
+            validation_cache.close()
+        queue.close()
+    successes = sum(1 for _, result in completed if "SUCCESS" in result['status'])
+    print(f"Worker {worker_id} finished in {time.monotonic() - start:.1f}s. {successes}/{len(completed)} trials succeeded.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a sweep across several Ollama hosts with a coordinator and workers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Plan the trial matrix and watch over the workers.")
+    add_matrix_arguments(coordinator_parser)
+    add_generation_arguments(coordinator_parser)
+    add_chat_argument(coordinator_parser)
+    add_suite_report_argument(coordinator_parser)
+    coordinator_parser.add_argument("--results-dir", default=None, help="Output directory (defaults to 04_RawData/sweep_<mode>_n<runs>_<timestamp>).")
+    coordinator_parser.add_argument("--resume", action='store_true', help="Continue the sweep already planned in --results-dir.")
+    coordinator_parser.add_argument("--plan-only", action='store_true', help="Plan the trials and exit without waiting for the workers.")
+    coordinator_parser.add_argument("--check-interval", type=float, default=5.0, help="Seconds between checks for expired leases.")
+
+    worker_parser = subparsers.add_parser("worker", help="Claim trials from a planned sweep and run them on a set of endpoints.")
+    worker_parser.add_argument("--results-dir", required=True, help="Results directory of the sweep planned by the coordinator.")
+    worker_parser.add_argument("--endpoints", nargs='+', required=True, help="Ollama endpoint URLs this worker may use.")
+    worker_parser.add_argument("--per-endpoint-limit", type=int, default=1, help="Maximum number of concurrent calls per endpoint.")
+    worker_parser.add_argument("--endpoint-limit", action='append', default=[], metavar="URL=N", help="Per-endpoint concurrency override; may be repeated.")
+    worker_parser.add_argument("--per-model-limit", type=int, default=None, help="Maximum number of concurrent trials per model (defaults to the total endpoint capacity).")
+    worker_parser.add_argument("--model-limit", action='append', default=[], metavar="MODEL=N", help="Per-model concurrency override; may be repeated.")
+    worker_parser.add_argument("--health-interval", type=float, default=10.0, help="Seconds between endpoint health checks.")
+    worker_parser.add_argument("--lease", type=float, default=120.0, help="Seconds a claimed trial stays reserved without a lease renewal.")
+    worker_parser.add_argument("--check-interval", type=float, default=5.0, help="Seconds between checks for trials freed by other workers.")
+    worker_parser.add_argument("--worker-id", default=None, help="Name of this worker in the queue (defaults to <hostname>-<pid>).")
+    worker_parser.add_argument("--keep-alive", default=None, help="How long the model stays loaded after a request, e.g. '30m' or -1 for indefinitely.")
+    worker_parser.add_argument("--stream", action='store_true', help="Stream responses and stop generation once a usable code block has closed.")
+    worker_parser.add_argument("--sandbox-workers", type=int, default=0, help="Validate code in a pool of N pre-warmed sandbox workers (0 = disabled).")
+    worker_parser.add_argument("--sandbox-max-tasks", type=int, default=200, help="Recycle each sandbox worker after this many validations.")
+    worker_parser.add_argument("--validation-cache", default=None, help="Path of a SQLite file caching validation results.")
+
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    if args.command == "coordinator":
+        run_coordinator(args, parser, base_dir)
+    elif args.command == "worker":
+        run_worker(args, parser, base_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# model_affinity.py
+#
+# Model-affinity scheduling for run_sweep.py --model-affinity.
+#
+# On a memory-constrained Ollama server every change of model may evict the
+# previous weights and load new ones, which takes seconds to minutes. The
+# ModelAffinityQueue hands out pending trials grouped by model:
+#
+#   1. more trials of a model that already has trials running,
+#   2. then trials of a model the server reports as loaded (GET /api/ps),
+#   3. and only then a new model, and only if it fits into --server-memory-gb
+#      next to the models still in use (without a budget: only once no other
+#      model is in use).
+#
+# Model sizes come from /api/ps for loaded models and /api/tags otherwise.
+# Both endpoints are optional: a server (or stub) without them simply gives
+# no residency information and the queue relies on its own bookkeeping.
+#
+# Swaps are counted when a trial starts on a model that is neither in use nor
+# reported as loaded; load_duration reported by the server is summed as swap
+# time and the rest of total_duration as generation time.
+#
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+def ollama_base_url(api_url):
+    """Strips a trailing /api/generate (or /api/...) so other endpoints can be reached."""
+    api_url = api_url.rstrip('/')
+    index = api_url.find('/api/')
+    return api_url[:index] if index != -1 else api_url
+
+def canonical_model_name(name):
+    """Ollama reports untagged models with their implicit ':latest' tag."""
+    return name if ':' in name else name + ':latest'
+
+def fetch_loaded_models(api_url, timeout=5):
+    """Returns {model: size_in_bytes} of the models currently loaded by the server, or None."""
+    try:
+        response = requests.get(ollama_base_url(api_url) + '/api/ps', timeout=timeout)
+        response.raise_for_status()
+        return {canonical_model_name(entry.get('name') or entry.get('model')): entry.get('size_vram') or entry.get('size') or 0
+                for entry in response.json().get('models', [])}
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+def fetch_model_sizes(api_url, timeout=5):
+    """Returns {model: size_in_bytes} of the models available on the server, or {}."""
+    try:
+        response = requests.get(ollama_base_url(api_url) + '/api/tags', timeout=timeout)
+        response.raise_for_status()
+        return {canonical_model_name(entry.get('name') or entry.get('model')): entry.get('size') or 0
+                for entry in response.json().get('models', [])}
+    except (requests.exceptions.RequestException, ValueError):
+        return {}
+
+def server_time_split(result):
+    """Returns (swap_seconds, generation_seconds) summed over the step stats of one trial result."""
+    swap = generation = 0.0
+    for cycle_log in result.get('logs', []):
+        for key in ('step1_stats', 'step2_stats'):
+            stats = cycle_log.get(key) or {}
+            load = stats.get('load_duration') or 0.0
+            swap += load
+            generation += max(0.0, (stats.get('total_duration') or 0.0) - load)
+    return swap, generation
+
+class ModelAffinityQueue:
+    """Pending trials grouped by model, handed out so that loaded models are reused."""
+
+    def __init__(self, api_url, memory_budget_bytes=None, ps_interval=5.0):
+        self.api_url = api_url
+        self.memory_budget_bytes = memory_budget_bytes
+        self.ps_interval = ps_interval
+        self.swaps = 0
+        self.swap_time = 0.0
+        self.generation_time = 0.0
+        self._pending = OrderedDict()
+        self._active = {}
+        self._resident = set()
+        self._sizes = fetch_model_sizes(api_url) if memory_budget_bytes else {}
+        self._last_ps = None
+        self._ps_available = False
+        self._lock = threading.Lock()
+
+    def extend(self, trials):
+        with self._lock:
+            for trial in trials:
+                self._pending.setdefault(canonical_model_name(trial['model']), deque()).append(trial)
+
+    def _refresh_resident(self):
+        if self._last_ps is not None and time.monotonic() - self._last_ps < self.ps_interval:
+            return
+        self._last_ps = time.monotonic()
+        loaded = fetch_loaded_models(self.api_url)
+        self._ps_available = loaded is not None
+        if loaded is None:
+            return
+        self._resident = set(loaded)
+        self._sizes.update({model: size for model, size in loaded.items() if size})
+
+    def _fits(self, model):
+        in_use = [m for m, count in self._active.items() if count > 0 and m != model]
+        if not in_use:
+            return True
+        if self.memory_budget_bytes is None:
+            return False
+        sizes = [self._sizes.get(m) for m in in_use + [model]]
+        if not all(sizes):
+            return False
+        return sum(sizes) <= self.memory_budget_bytes
+
+    def next_trial(self, has_capacity=lambda model: True):
+        """Returns the next trial to start for a model with capacity, or None."""
+        with self._lock:
+            self._refresh_resident()
+            models = [m for m, queue in self._pending.items() if queue and has_capacity(queue[0]['model'])]
+            in_use = [m for m in models if self._active.get(m, 0) > 0]
+            resident = [m for m in models if m in self._resident and self._fits(m)]
+            new = [m for m in models if self._fits(m)]
+            for candidates in (in_use, resident, new):
+                if candidates:
+                    model = candidates[0]
+                    break
+            else:
+                return None
+
+            if self._active.get(model, 0) == 0 and model not in self._resident:
+                self.swaps += 1
+                if not self._ps_available:
+                    # Without /api/ps, assume loading this model evicts the idle ones.
+                    self._resident = {m for m in self._resident if self._active.get(m, 0) > 0}
+            self._resident.add(model)
+            self._active[model] = self._active.get(model, 0) + 1
+            trial = self._pending[model].popleft()
+            if not self._pending[model]:
+                del self._pending[model]
+            return trial
+
+    def record(self, trial, result):
+        """Marks a trial as finished (result is None if it raised) and adds up its server timings."""
+        with self._lock:
+            self._active[canonical_model_name(trial['model'])] -= 1
+            if result is not None:
+                swap, generation = server_time_split(result)
+                self.swap_time += swap
+                self.generation_time += generation
+
+    def summary(self):
+        return (f"Model affinity: {self.swaps} model swaps; server time {self.swap_time:.1f}s loading models "
+                f"vs {self.generation_time:.1f}s generating")
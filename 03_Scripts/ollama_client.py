@@ -0,0 +1,201 @@
+# ollama_client.py
+#
+# An asyncio-based Ollama client for running many round-trip cycles at once.
+# All requests share one pooled, keep-alive HTTP transport with a per-host
+# connection limit, so hundreds of concurrent cycles reuse a handful of
+# sockets instead of opening a new TCP connection (and blocking a whole
+# thread) for every step. Transient failures (HTTP 5xx, timeouts, dropped
+# connections) are retried with exponential backoff.
+#
+# Prerequisite: pip install aiohttp
+#
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+
+from run_cycle_test_syntactic import (
+    response_with_stats, server_stats, ollama_generate_url, ollama_chat_url, build_generate_payload, iter_cycle,
+    FencedBlockWatcher, ModelResponse, chunk_text, chat_prefix_savings, prompt_cache_summary
+)
+
+class AsyncOllamaClient:
+    """
+    Pooled async client for the Ollama /api/generate endpoint (or /api/chat
+    with chat=True, see run_cycle_test_syntactic.build_generate_payload()).
+
+    Use as an async context manager so the connection pool is closed cleanly:
+
+        async with AsyncOllamaClient(api_url, limit_per_host=4) as client:
+            text = await client.generate("gemma3:4b", prompt)
+    """
+
+    def __init__(self, api_url, limit=64, limit_per_host=8, timeout=60,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, keepalive_timeout=60, chat=False):
+        self.api_url = ollama_chat_url(api_url) if chat else ollama_generate_url(api_url)
+        self.chat = chat
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Content-Type": "application/json"},
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    async def generate_json(self, model, prompt, options=None, keep_alive=None):
+        """
+        Sends one non-streaming generate request and returns the decoded JSON body,
+        or None if the request failed after all retries.
+        """
+        await self.open()
+        payload = build_generate_payload(model, prompt, False, options, keep_alive, self.chat)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._session.post(self.api_url, data=payload) as response:
+                    if response.status >= 500:
+                        # Transient server-side error: read the body so the connection is reusable, then retry.
+                        error = f"HTTP {response.status}: {(await response.text())[:200]}"
+                    else:
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+            except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError, aiohttp.ClientConnectionError) as e:
+                error = f"{type(e).__name__}: {e}"
+            except (aiohttp.ClientError, json.JSONDecodeError) as e:
+                # Client-side errors (4xx, malformed bodies) are not retried.
+                print(f"Error calling Ollama API: {e}")
+                return None
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt))
+
+        print(f"Error calling Ollama API after {self.max_retries + 1} attempts: {error}")
+        return None
+
+    async def generate(self, model, prompt, options=None, keep_alive=None):
+        """Returns the generated text for a prompt, or None if the call failed."""
+        data = await self.generate_json(model, prompt, options, keep_alive)
+        if data is None:
+            return None
+        result = response_with_stats(data)
+        if self.chat:
+            chat_prefix_savings.record(model, prompt, getattr(result, 'stats', None))
+        return result
+
+    async def generate_stream(self, model, prompt, strict_mode=False, options=None, keep_alive=None):
+        """
+        Streaming counterpart of generate(): reads Ollama's NDJSON stream and
+        closes the connection as soon as a usable fenced code block has closed.
+        Returns a ModelResponse with time-to-first-token/valid-block stats.
+        """
+        await self.open()
+        payload = build_generate_payload(model, prompt, True, options, keep_alive, self.chat)
+        # Like the sync client, time out between chunks rather than on the whole generation.
+        stream_timeout = aiohttp.ClientTimeout(total=None, sock_read=self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            watcher = FencedBlockWatcher(strict_mode=strict_mode)
+            stats = {"stream": True, "time_to_first_token": None, "time_to_first_valid_block": None, "cut_off": False}
+            start = time.monotonic()
+            try:
+                async with self._session.post(self.api_url, data=payload, timeout=stream_timeout) as response:
+                    if response.status >= 500:
+                        error = f"HTTP {response.status}: {(await response.text())[:200]}"
+                    else:
+                        response.raise_for_status()
+                        async for line in response.content:
+                            if not line.strip():
+                                continue
+                            chunk = json.loads(line)
+                            if "error" in chunk:
+                                print(f"Error from Ollama API: {chunk['error']}")
+                                return None
+                            token = chunk_text(chunk)
+                            if token and stats["time_to_first_token"] is None:
+                                stats["time_to_first_token"] = time.monotonic() - start
+                            if chunk.get("done"):
+                                stats.update(server_stats(chunk))
+                            if watcher.feed(token):
+                                stats["time_to_first_valid_block"] = time.monotonic() - start
+                                stats["cut_off"] = not chunk.get("done", False)
+                                # Dropping the connection makes the server stop generating.
+                                response.close()
+                                break
+                            if chunk.get("done"):
+                                break
+                        stats["total_time"] = time.monotonic() - start
+                        if self.chat:
+                            chat_prefix_savings.record(model, prompt, stats)
+                        return ModelResponse(watcher.text.strip(), stats)
+            except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError, aiohttp.ClientConnectionError) as e:
+                error = f"{type(e).__name__}: {e}"
+            except (aiohttp.ClientError, json.JSONDecodeError) as e:
+                print(f"Error calling Ollama API: {e}")
+                return None
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt))
+
+        print(f"Error calling Ollama API after {self.max_retries + 1} attempts: {error}")
+        return None
+
+def _advance(steps, value):
+    """Resumes an iter_cycle() generator; returns (finished, prompt_or_result)."""
+    try:
+        return False, steps.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+async def run_cycle_async(client, max_cycles, model, test_case, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir, lang, mode, stream=False, sandbox=None, validation_cache=None, options=None, keep_alive=None, suite_report=False):
+    """
+    Async counterpart of run_cycle(). Model calls are awaited on the shared
+    client; cleaning and validation (which block on a subprocess) run in the
+    default thread pool so the event loop stays free for other cycles.
+    """
+    steps = iter_cycle(max_cycles, test_case, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir, lang, mode, sandbox=sandbox, validation_cache=validation_cache, suite_report=suite_report)
+    # StopIteration cannot cross a Future boundary, so the generator is resumed via _advance().
+    finished, value = await asyncio.to_thread(_advance, steps, None)
+    while not finished:
+        if stream:
+            response = await client.generate_stream(model, value, strict_mode=(mode == 'strict'),
+                                                    options=options, keep_alive=keep_alive)
+        else:
+            response = await client.generate(model, value, options=options, keep_alive=keep_alive)
+        finished, value = await asyncio.to_thread(_advance, steps, response)
+    if options:
+        value["generation_options"] = options
+    if client.chat:
+        value["prompt_cache"] = prompt_cache_summary(value)
+    return value
@@ -0,0 +1,214 @@
+# prompt_registry.py
+#
+# Per-process registry of the files a trial needs: the 02_Prompts templates,
+# initial_code.py, the ground-truth specs, the test_runner.py templates
+# (whose split around {generated_code} is cached as well) and the parsed
+# test_cases.json suites.
+#
+# Every file is read from disk once per process and kept, so a long-running
+# scheduler serving thousands of trials does no per-trial filesystem reads.
+# Edits to these files therefore only take effect in new processes.
+#
+# Prompt templates are compiled into a slot list: the literal text around the
+# {source_code} / {specification} placeholders. Rendering is a join, and every
+# other brace in a template is literal text, so a few-shot example containing
+# code such as `{"id": 1}` or `f"{name}"` needs no escaping (str.format would
+# raise on it). For the existing templates the output is identical to
+# str.format.
+#
+# Usage:
+#   # Check that every template and test definition loads and has its placeholder
+#   python3 03_Scripts/prompt_registry.py check
+#
+import argparse
+import os
+import re
+import threading
+from functools import lru_cache
+
+from test_suite import SUITE_FILE_NAME, parse_test_suite
+
+# Placeholders filled in by the pipeline; any other brace is literal text.
+SLOT_PATTERN = re.compile(r'\{(source_code|specification)\}')
+
+# Placeholder that a template must contain, by file name prefix.
+REQUIRED_SLOTS = {'code_to_spec_': 'source_code', 'spec_to_code_': 'specification'}
+
+class TemplatePrompt(str):
+    """A rendered prompt that also carries its template's fixed preamble (the text before the first slot) in .prefix."""
+
+    def __new__(cls, text, prefix=''):
+        obj = super().__new__(cls, text)
+        obj.prefix = prefix
+        return obj
+
+class PromptTemplate:
+    """A template compiled into literal parts and slot names."""
+
+    __slots__ = ('text', 'literals', 'slots')
+
+    def __init__(self, text):
+        self.text = text
+        self.literals = []
+        self.slots = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(text):
+            self.literals.append(text[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.literals.append(text[position:])
+
+    def format(self, **values):
+        """Fills in the slots; a drop-in replacement for str.format on these templates. Returns a TemplatePrompt."""
+        pieces = [self.literals[0]]
+        for slot, literal in zip(self.slots, self.literals[1:]):
+            pieces.append(values[slot])
+            pieces.append(literal)
+        return TemplatePrompt(''.join(pieces), self.literals[0])
+
+    def __len__(self):
+        return len(self.text)
+
+@lru_cache(maxsize=None)
+def split_test_runner(test_runner_script):
+    """Returns the (before, after) parts of a test_runner.py around its {generated_code} placeholder, or None."""
+    parts = test_runner_script.split('{generated_code}', 1)
+    return tuple(parts) if len(parts) == 2 else None
+
+# Loaded files by path, shared by all registries of the process; None marks a missing file.
+_files = {}
+_files_lock = threading.Lock()
+
+def _load(path, build, report_missing=True):
+    try:
+        return _files[path]
+    except KeyError:
+        pass
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            value = build(f.read())
+    except FileNotFoundError:
+        if report_missing:
+            print(f"Error: File not found at {path}")
+        value = None
+    with _files_lock:
+        return _files.setdefault(path, value)
+
+def load_text(path):
+    """Returns the content of a file, or None if it does not exist."""
+    return _load(path, str)
+
+def load_template(path):
+    """Returns the compiled PromptTemplate of a .prompt file, or None if it does not exist."""
+    return _load(path, PromptTemplate)
+
+def load_test_runner(test_def_dir):
+    """Returns the test_runner.py template of a test case, or None if it has none (legacy check)."""
+    return _load(os.path.join(test_def_dir, 'test_runner.py'), str, report_missing=False)
+
+def load_test_suite(test_def_dir):
+    """
+    Returns the parsed test_cases.json of a test case (see test_suite.py), or
+    None if it has none. Raises ValueError if the file is malformed.
+    """
+    return _load(os.path.join(test_def_dir, SUITE_FILE_NAME), parse_test_suite, report_missing=False)
+
+class PromptRegistry:
+    """Resolves the files of a trial configuration under a pair of base directories."""
+
+    def __init__(self, base_prompt_dir, base_test_def_dir):
+        self.base_prompt_dir = base_prompt_dir
+        self.base_test_def_dir = base_test_def_dir
+
+    def prompt_templates(self, test_case, lang, spec_lang, prompt_style):
+        """Returns the (code_to_spec, spec_to_code) templates of a trial configuration."""
+        prompt_dir = os.path.join(self.base_prompt_dir, test_case, lang, spec_lang)
+        return (load_template(os.path.join(prompt_dir, f'code_to_spec_{prompt_style}.prompt')),
+                load_template(os.path.join(prompt_dir, f'spec_to_code_{prompt_style}.prompt')))
+
+    def test_def_dir(self, test_case):
+        return os.path.join(self.base_test_def_dir, test_case, 'python')
+
+    def initial_code(self, test_case):
+        return load_text(os.path.join(self.test_def_dir(test_case), 'initial_code.py'))
+
+    def ground_truth_spec(self, test_case, lang, spec_lang):
+        return load_text(os.path.join(self.test_def_dir(test_case), f'ground_truth_{lang}_{spec_lang}.txt'))
+
+    def check_trial(self, test_case, lang, spec_lang, prompt_style):
+        """Returns a list of problems with the files of one trial configuration (empty if it is usable)."""
+        problems = []
+        prompt_dir = os.path.join(self.base_prompt_dir, test_case, lang, spec_lang)
+        for prefix, slot in REQUIRED_SLOTS.items():
+            path = os.path.join(prompt_dir, f'{prefix}{prompt_style}.prompt')
+            template = _load(path, PromptTemplate, report_missing=False)
+            if template is None:
+                problems.append(f"missing template {path}")
+            elif slot not in template.slots:
+                problems.append(f"{path} has no {{{slot}}} placeholder")
+        if self.initial_code(test_case) is None:
+            problems.append(f"missing initial_code.py for {test_case}")
+        if self.ground_truth_spec(test_case, lang, spec_lang) is None:
+            problems.append(f"missing ground truth for {test_case} ({lang}, {spec_lang})")
+        runner = load_test_runner(self.test_def_dir(test_case))
+        if runner is not None and split_test_runner(runner) is None:
+            problems.append(f"test_runner.py of {test_case} has no {{generated_code}} placeholder")
+        try:
+            load_test_suite(self.test_def_dir(test_case))
+        except ValueError as e:
+            problems.append(f"{SUITE_FILE_NAME} of {test_case} is invalid: {e}")
+        return problems
+
+    def load_all(self):
+        """
+        Loads every template under the prompt directory and every test
+        definition, and returns the list of problems found.
+        """
+        problems = []
+        for test_case in sorted(os.listdir(self.base_prompt_dir)):
+            case_dir = os.path.join(self.base_prompt_dir, test_case)
+            if not os.path.isdir(case_dir):
+                continue
+            for lang in sorted(os.listdir(case_dir)):
+                lang_dir = os.path.join(case_dir, lang)
+                if not os.path.isdir(lang_dir):
+                    continue
+                for spec_lang in sorted(os.listdir(lang_dir)):
+                    spec_dir = os.path.join(lang_dir, spec_lang)
+                    if not os.path.isdir(spec_dir):
+                        continue
+                    styles = sorted({name[len(prefix):-len('.prompt')]
+                                     for name in os.listdir(spec_dir) if name.endswith('.prompt')
+                                     for prefix in REQUIRED_SLOTS if name.startswith(prefix)})
+                    for prompt_style in styles:
+                        problems.extend(self.check_trial(test_case, lang, spec_lang, prompt_style))
+        return problems
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry(base_prompt_dir, base_test_def_dir):
+    """Returns the process-wide PromptRegistry for a pair of base directories."""
+    key = (os.path.abspath(base_prompt_dir), os.path.abspath(base_test_def_dir))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = PromptRegistry(*key)
+        return _registries[key]
+
+def main():
+    parser = argparse.ArgumentParser(description="Load and validate all prompt templates and test definitions.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("check", help="Report missing files and templates without their placeholder.")
+
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    registry = get_registry(os.path.join(base_dir, '02_Prompts'), os.path.join(base_dir, '01_TestDefinitions'))
+    if args.command == "check":
+        problems = registry.load_all()
+        for problem in problems:
+            print(f"  {problem}")
+        print(f"Loaded {len(_files)} files; {len(problems)} problems found.")
+
+if __name__ == "__main__":
+    main()
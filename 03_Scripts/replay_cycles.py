@@ -0,0 +1,233 @@
+# replay_cycles.py
+#
+# Offline replay engine: re-runs the cleaning and validation pipeline of
+# archived trials without calling any model.
+#
+# result.json logs do not store prompts, but every prompt of a trial can be
+# reconstructed from the prompt templates and the recorded outputs of the
+# previous step (step1 is formatted with the previous cycle's cleaned code,
+# step2 with the cleaned spec). Each recorded response is therefore indexed by
+# the prompt that produced it, and run_cycle is driven by prompt lookups: as
+# long as the current pipeline produces the same prompts, the original model
+# responses are served; if a changed cleaner produces a prompt the model never
+# saw, the step fails with a replay miss instead of guessing.
+#
+# Example:
+#   python3 03_Scripts/replay_cycles.py 04_RawData --output-dir /tmp/replayed \
+#       --max-workers 8 --sandbox-workers 8
+#
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from run_cycle_test_syntactic import (
+    iter_cycle, drive_cycle, save_result, CallFailure, ModelResponse, add_suite_report_argument
+)
+from run_sweep import parse_trial_dir_name, parse_batch_mode
+from prompt_registry import get_registry
+from result_pack import find_result_files, load_result
+
+def load_prompt_templates(test_case, lang, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir):
+    """Returns (initial_code, code_to_spec_template, spec_to_code_template) for a trial configuration."""
+    registry = get_registry(base_prompt_dir, base_test_def_dir)
+    code_to_spec, spec_to_code = registry.prompt_templates(test_case, lang, spec_lang, prompt_style)
+    return registry.initial_code(test_case), code_to_spec, spec_to_code
+
+def recorded_responses(result, initial_code, code_to_spec_template, spec_to_code_template):
+    """
+    Reconstructs the (prompt, response) pairs of a recorded trial, in call
+    order. For a single-pass composite result the other branch's own calls are
+    included as well: both branches advance one step per call round, and a step
+    whose prompt was the same in both branches was a single shared call.
+    """
+    branch_logs = [branch['logs'] for branch in result.get('branches', {}).values() if 'logs' in branch]
+    selected, *others = [_log_pairs(logs, initial_code, code_to_spec_template, spec_to_code_template)
+                         for logs in [result.get('logs', [])] + branch_logs]
+    if not others:
+        return selected
+    pairs = []
+    for step in range(max(len(branch) for branch in [selected] + others)):
+        if step < len(selected):
+            pairs.append(selected[step])
+        for branch in others:
+            if step < len(branch) and (step >= len(selected) or branch[step][0] != selected[step][0]):
+                pairs.append(branch[step])
+    return pairs
+
+def _log_pairs(logs, initial_code, code_to_spec_template, spec_to_code_template):
+    """The (prompt, response) pairs of one list of cycle logs, one per step."""
+    pairs = []
+    current_code = initial_code
+    for cycle_log in logs:
+        if 'step1_raw_spec' not in cycle_log:
+            break
+        pairs.append((code_to_spec_template.format(source_code=current_code), cycle_log['step1_raw_spec']))
+
+        if 'step1_generated_spec' not in cycle_log or 'step2_generated_code_raw' not in cycle_log:
+            break
+        pairs.append((spec_to_code_template.format(specification=cycle_log['step1_generated_spec']),
+                      cycle_log['step2_generated_code_raw']))
+
+        if 'step2_generated_code_clean' not in cycle_log:
+            break
+        current_code = cycle_log['step2_generated_code_clean']
+    return pairs
+
+class RecordedResponses:
+    """
+    A generate(prompt) callable that serves the responses recorded for one
+    trial. A prompt asked several times (e.g. a cycle that reached a fixed
+    point asks again from the same code) gets its responses in recorded order.
+    """
+
+    def __init__(self, pairs):
+        self.responses = {}
+        for prompt, response in pairs:
+            self.responses.setdefault(prompt, deque()).append(response)
+        self.misses = 0
+
+    def __call__(self, prompt):
+        queued = self.responses.get(prompt)
+        if not queued:
+            self.misses += 1
+            return CallFailure("No recorded response for this prompt (replay miss)")
+        return ModelResponse(queued.popleft(), {"replayed": True})
+
+def replay_trial(result_path, base_prompt_dir, base_test_def_dir, mode=None, max_cycles=10,
+                 sandbox=None, validation_cache=None, suite_report=False):
+    """
+    Replays one archived trial through the current pipeline.
+    Returns (trial, original_result, replayed_result), or None if the trial
+    directory or its batch mode cannot be recognised.
+    """
+    trial_dir = os.path.dirname(result_path)
+    trial = parse_trial_dir_name(os.path.basename(trial_dir))
+    if trial is None:
+        return None
+    mode = mode or parse_batch_mode(os.path.basename(os.path.dirname(trial_dir)))
+    if mode is None:
+        return None
+
+    original = load_result(result_path)
+
+    initial_code, code_to_spec, spec_to_code = load_prompt_templates(
+        trial['test_case'], trial['lang'], trial['spec_lang'], trial['prompt_style'],
+        base_prompt_dir, base_test_def_dir
+    )
+    if not all([initial_code, code_to_spec, spec_to_code]):
+        return None
+    responses = RecordedResponses(recorded_responses(original, initial_code, code_to_spec, spec_to_code))
+
+    # Composite mode runs both cleanings on the recorded responses in one pass;
+    # for archives of the two-run composite mode only the final run's responses exist.
+    steps = iter_cycle(max_cycles, trial['test_case'], trial['spec_lang'], trial['prompt_style'],
+                       base_prompt_dir, base_test_def_dir, trial['lang'], mode,
+                       sandbox=sandbox, validation_cache=validation_cache, suite_report=suite_report)
+    replayed = drive_cycle(steps, responses)
+
+    replayed['replay'] = {"source": result_path, "mode": mode, "misses": responses.misses}
+    return trial, original, replayed
+
+def export_to_response_cache(result_paths, cache, base_prompt_dir, base_test_def_dir):
+    """
+    Seeds a ResponseCache with every recorded (model, prompt) -> response pair,
+    keyed as run_cycle() keys the calls of that run (not streamed), with
+    repeated prompts in call order. Returns the count.
+    """
+    count = 0
+    for result_path in result_paths:
+        trial = parse_trial_dir_name(os.path.basename(os.path.dirname(result_path)))
+        if trial is None:
+            continue
+        result = load_result(result_path)
+        templates = load_prompt_templates(trial['test_case'], trial['lang'], trial['spec_lang'],
+                                          trial['prompt_style'], base_prompt_dir, base_test_def_dir)
+        if not all(templates):
+            continue
+        pairs = recorded_responses(result, *templates)
+        options = cache.key_options(result.get('generation_options'), run=trial['run'], chat='prompt_cache' in result)
+        asked = {}
+        entries = []
+        for prompt, response in pairs:
+            entries.append((trial['model'], prompt, response, options, asked.get(prompt, 0)))
+            asked[prompt] = asked.get(prompt, 0) + 1
+        cache.put_many(entries)
+        count += len(pairs)
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay archived trials through the current cleaning/validation pipeline without calling any model.")
+    parser.add_argument("data_dirs", nargs='+', help="Directories containing archived result.json files (e.g., 04_RawData).")
+    parser.add_argument("--output-dir", default=None, help="Write replayed result.json files here, mirroring the input layout.")
+    parser.add_argument("--mode", default=None, choices=['strict', 'forgiving', 'composite'], help="Override the mode inferred from each batch directory name.")
+    parser.add_argument("--max-cycles", type=int, default=10, help="Maximum number of cycles (the archived runs used 10).")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Number of trials replayed concurrently.")
+    parser.add_argument("--sandbox-workers", type=int, default=0, help="Validate code in a pool of N pre-warmed sandbox workers (0 = one python3 process per validation).")
+    parser.add_argument("--validation-cache", default=None, help="Path of a SQLite validation result cache.")
+    add_suite_report_argument(parser)
+    parser.add_argument("--export-cache", default=None, help="Also write all recorded responses into this response cache for --offline runs.")
+
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    base_dir = os.path.abspath(os.path.join(script_dir, '..'))
+    base_prompt_dir = os.path.join(base_dir, '02_Prompts')
+    base_test_def_dir = os.path.join(base_dir, '01_TestDefinitions')
+
+    result_paths = list(find_result_files(args.data_dirs))
+    print(f"Replaying {len(result_paths)} archived trials...")
+
+    if args.export_cache:
+        from response_cache import ResponseCache
+        with ResponseCache(args.export_cache) as cache:
+            count = export_to_response_cache(result_paths, cache, base_prompt_dir, base_test_def_dir)
+        print(f"Exported {count} recorded responses to {args.export_cache}")
+
+    sandbox = None
+    if args.sandbox_workers > 0:
+        from sandbox_pool import SandboxPool
+        sandbox = SandboxPool(size=args.sandbox_workers)
+    validation_cache = None
+    if args.validation_cache:
+        from validation_cache import ValidationCache
+        validation_cache = ValidationCache(args.validation_cache)
+
+    def replay_one(result_path):
+        replayed = replay_trial(result_path, base_prompt_dir, base_test_def_dir, mode=args.mode,
+                                max_cycles=args.max_cycles, sandbox=sandbox, validation_cache=validation_cache,
+                                suite_report=args.suite_report)
+        if replayed is not None and args.output_dir:
+            relative_dir = os.path.relpath(os.path.dirname(result_path), os.path.commonpath(args.data_dirs))
+            save_result(replayed[2], os.path.join(args.output_dir, relative_dir))
+        return result_path, replayed
+
+    start = time.monotonic()
+    replayed_count = skipped = changed = misses = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+            for result_path, replayed in executor.map(replay_one, result_paths):
+                if replayed is None:
+                    skipped += 1
+                    print(f"Skipping unrecognized trial: {result_path}")
+                    continue
+                _, original, result = replayed
+                replayed_count += 1
+                misses += result['replay']['misses']
+                if ("SUCCESS" in original.get('status', '')) != ("SUCCESS" in result['status']) \
+                        or original.get('cycles_completed') != result['cycles_completed']:
+                    changed += 1
+    finally:
+        if sandbox is not None:
+            sandbox.close()
+
+    elapsed = time.monotonic() - start
+    print(f"Replayed {replayed_count} trials in {elapsed:.1f}s ({skipped} skipped).")
+    print(f"Trials whose outcome changed: {changed}. Replay misses: {misses}.")
+    if validation_cache is not None:
+        print(validation_cache.summary())
+        validation_cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# rescore.py
+#
+# Offline re-scoring of the archived corpus after a change to a
+# test_runner.py or to clean_generated_code(), without calling any model.
+#
+# Every recorded step2_generated_code_raw is cleaned again with the current
+# clean_generated_code() and validated with the current validate_code(); the
+# trial's status and cycles_completed are recomputed from the new step-2
+# outcomes with the same rules as iter_cycle(). Trials are spread over a
+# process pool (in chunks, streamed back in order), so the corpus scales with
+# the number of cores; identical code is validated once per process, and once
+# overall with a shared --validation-cache. With --sandbox and a structured
+# test_cases.json that decides the verdict, all recorded cycles of a trial are
+# validated in one sandbox worker call; only the verdict is needed here, so
+# other suites are not run.
+#
+# Re-scoring takes the recorded responses as they are. When the new cleaner
+# extracts different code, the next cycle's prompt would have been different
+# too; replay_cycles.py replays trials exactly (and reports such replay
+# misses). A trial that failed at cycle k but now passes it has no recorded
+# cycle k+1; it is reported as "needs_rerun" rather than guessed.
+#
+# Example:
+#   python3 03_Scripts/rescore.py 04_RawData --workers 8 \
+#       --report 05_Reports/rescore_diff.csv --validation-cache 05_Reports/validation_cache.sqlite
+#
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from run_cycle_test_syntactic import clean_generated_code, validate_many
+from run_sweep import parse_trial_dir_name, parse_batch_mode
+from result_pack import find_result_files, load_result
+
+REPORT_COLUMNS = ('source', 'model', 'test_case', 'lang', 'spec_lang', 'prompt_style', 'run', 'mode',
+                  'change', 'old_status', 'new_status', 'old_cycles_completed', 'new_cycles_completed')
+
+# Per-process state, set up by _init_worker().
+_worker = {}
+
+def _init_worker(base_test_def_dir, validation_cache_path, sandbox):
+    _worker['base_test_def_dir'] = base_test_def_dir
+    _worker['memo'] = {}
+    _worker['cache'] = None
+    _worker['sandbox'] = None
+    if validation_cache_path:
+        from validation_cache import ValidationCache
+        _worker['cache'] = ValidationCache(validation_cache_path)
+    if sandbox:
+        from multiprocessing.util import Finalize
+        from sandbox_pool import SandboxPool
+        _worker['sandbox'] = SandboxPool(size=1)
+        Finalize(None, _worker['sandbox'].close, exitpriority=10)
+
+def _validate_all(codes, test_def_dir):
+    """Returns the (output, error) of every program, validating the ones not seen before in one batch."""
+    memo = _worker['memo']
+    missing = list(dict.fromkeys(code for code in codes if (code, test_def_dir) not in memo))
+    if missing:
+        outcomes = validate_many(missing, test_def_dir, sandbox=_worker['sandbox'], cache=_worker['cache'])
+        for code, (output, error, _) in zip(missing, outcomes):
+            memo[(code, test_def_dir)] = (output, error)
+    return [memo[(code, test_def_dir)] for code in codes]
+
+def rescore_logs(logs, test_def_dir, mode):
+    """
+    Re-evaluates the recorded step-2 responses of one trial in `mode`.
+    Returns (status, cycles_completed).
+    """
+    is_strict = (mode == 'strict')
+    # A recorded trial stops at its first failed cycle, so validating every
+    # recorded cycle up front wastes little and lets them share one batch.
+    raw_codes = []
+    for cycle_log in logs:
+        raw_code = cycle_log.get('step2_generated_code_raw')
+        if raw_code is None:
+            break
+        raw_codes.append(raw_code)
+    outcomes = _validate_all([clean_generated_code(raw_code, strict_mode=is_strict) for raw_code in raw_codes], test_def_dir)
+    for index, (output, error) in enumerate(outcomes):
+        if error or not (output and "SUCCESS" in output):
+            return f"FAIL: Cycle {index + 1} failed.", index
+    if len(raw_codes) < len(logs):
+        # The model call itself failed; nothing to re-evaluate.
+        return f"FAIL: Cycle {len(raw_codes) + 1} failed.", len(raw_codes)
+    return "SUCCESS: All cycles completed.", len(logs)
+
+def rescore_trial(result_path, mode=None, max_cycles=10):
+    """
+    Re-scores one archived trial. Returns a report row (dict), or None if the
+    trial directory or its mode cannot be recognised.
+    """
+    trial_dir = os.path.dirname(result_path)
+    trial = parse_trial_dir_name(os.path.basename(trial_dir))
+    if trial is None:
+        return None
+    mode = mode or parse_batch_mode(os.path.basename(os.path.dirname(trial_dir)))
+    if mode is None:
+        return None
+    try:
+        original = load_result(result_path)
+    except (json.JSONDecodeError, IOError):
+        return None
+
+    test_def_dir = os.path.join(_worker['base_test_def_dir'], trial['test_case'], 'python')
+    logs = original.get('logs', [])
+    old_status = original.get('status', '')
+    if not logs:
+        # The trial never got to a model call (e.g. missing test files).
+        status, cycles = old_status, original.get('cycles_completed')
+    elif mode == 'composite':
+        # Strict first, forgiving on failure. A single-pass composite result keeps
+        # each branch's own responses; a two-run one only has the final run's.
+        branch_logs = {branch: entry['logs'] for branch, entry in original.get('branches', {}).items() if 'logs' in entry}
+        branch_logs.setdefault(original.get('selected_branch'), logs)
+        status, cycles = rescore_logs(branch_logs.get('strict', logs), test_def_dir, 'strict')
+        if "SUCCESS" not in status:
+            status, cycles = rescore_logs(branch_logs.get('forgiving', logs), test_def_dir, 'forgiving')
+    else:
+        status, cycles = rescore_logs(logs, test_def_dir, mode)
+
+    old_success = "SUCCESS" in old_status
+    new_success = "SUCCESS" in status
+    if new_success and len(logs) < max_cycles:
+        # Every recorded cycle passes now, but the trial originally stopped early.
+        change = 'needs_rerun'
+        status = f"INCOMPLETE: all {len(logs)} recorded cycles pass; later cycles were never generated."
+    elif old_success != new_success:
+        change = 'FAIL->SUCCESS' if new_success else 'SUCCESS->FAIL'
+    elif original.get('cycles_completed') != cycles:
+        change = 'cycles_changed'
+    else:
+        change = ''
+    return dict(trial, source=result_path, mode=mode, change=change, old_status=old_status, new_status=status,
+                old_cycles_completed=original.get('cycles_completed'), new_cycles_completed=cycles)
+
+def _rescore_one(args):
+    result_path, mode, max_cycles = args
+    return rescore_trial(result_path, mode=mode, max_cycles=max_cycles)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score archived trials with the current cleaner and test runners, without calling any model.")
+    parser.add_argument("data_dirs", nargs='+', help="Directories containing archived result.json files (e.g., 04_RawData).")
+    parser.add_argument("--report", default=os.path.join('05_Reports', 'rescore_diff.csv'), help="CSV report of the trials whose outcome changed.")
+    parser.add_argument("--all", action='store_true', help="List every re-scored trial in the report, not only changed ones.")
+    parser.add_argument("--mode", default=None, choices=['strict', 'forgiving', 'composite'], help="Override the mode inferred from each batch directory name.")
+    parser.add_argument("--max-cycles", type=int, default=10, help="Number of cycles of a complete trial (the archived runs used 10).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+    parser.add_argument("--chunk-size", type=int, default=32, help="Trials sent to a worker process at a time.")
+    parser.add_argument("--sandbox", action='store_true', help="Validate in a pre-warmed sandbox worker per process instead of one python3 process per validation.")
+    parser.add_argument("--validation-cache", default=None, help="Path of a SQLite validation result cache shared by all processes.")
+
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    base_test_def_dir = os.path.join(os.path.abspath(os.path.join(script_dir, '..')), '01_TestDefinitions')
+
+    result_paths = list(find_result_files(args.data_dirs))
+    print(f"Re-scoring {len(result_paths)} archived trials on {args.workers} processes...")
+
+    start = time.monotonic()
+    counts = {}
+    skipped = 0
+    success_delta = {}
+    with open(args.report, 'w', newline='', encoding='utf-8') as report_file, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                initargs=(base_test_def_dir, args.validation_cache, args.sandbox)) as executor:
+        writer = csv.DictWriter(report_file, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        tasks = ((path, args.mode, args.max_cycles) for path in result_paths)
+        for done, row in enumerate(executor.map(_rescore_one, tasks, chunksize=args.chunk_size), start=1):
+            if row is None:
+                skipped += 1
+                continue
+            counts[row['change']] = counts.get(row['change'], 0) + 1
+            if row['change'] in ('FAIL->SUCCESS', 'SUCCESS->FAIL'):
+                delta = 1 if row['change'] == 'FAIL->SUCCESS' else -1
+                success_delta[row['model']] = success_delta.get(row['model'], 0) + delta
+            if row['change'] or args.all:
+                writer.writerow(row)
+            if done % 1000 == 0:
+                print(f"  {done}/{len(result_paths)} trials re-scored")
+
+    elapsed = time.monotonic() - start
+    rescored = sum(counts.values())
+    print(f"Re-scored {rescored} trials in {elapsed:.1f}s ({skipped} skipped).")
+    print(f"  unchanged:      {counts.get('', 0)}")
+    for change in ('FAIL->SUCCESS', 'SUCCESS->FAIL', 'cycles_changed', 'needs_rerun'):
+        print(f"  {change + ':':15} {counts.get(change, 0)}")
+    for model, delta in sorted(success_delta.items(), key=lambda item: -abs(item[1])):
+        print(f"  {model}: {delta:+d} successful trials")
+    print(f"Report saved to {args.report}")
+
+if __name__ == "__main__":
+    main()
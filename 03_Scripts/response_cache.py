@@ -0,0 +1,142 @@
+# response_cache.py
+#
+# A deterministic on-disk cache of model responses keyed by
+# (model, sha256(prompt), sha256(generation options), seq).
+#
+# Live runs can record every response into the cache (--response-cache) and
+# later runs can be replayed from it without an Ollama server (--offline),
+# e.g. after changing clean_generated_code() or a test_runner.py. Live runs
+# never read from the cache: independent runs must each sample the model.
+#
+# The options part of the key (see ResponseCache.key_options()) also holds the
+# run index, so every run is replayed from its own recording, and the stream
+# cut-off mode, since a strict stream stops at a different point than a
+# forgiving one. seq counts how often a trial has asked the same prompt before,
+# so a prompt asked again (e.g. from a fixed-point cycle) replays the response
+# it got the second time.
+#
+import hashlib
+import json
+import sqlite3
+import threading
+
+from run_cycle_test_syntactic import CallFailure, ModelResponse
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def options_hash(options):
+    return hashlib.sha256(json.dumps(options or {}, sort_keys=True).encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """SQLite-backed prompt -> response store shared by threads and processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if columns and 'seq' not in columns:
+            # Caches written before repeated prompts were told apart hold each key's first response.
+            self._conn.execute("ALTER TABLE responses RENAME TO responses_unsequenced")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " model TEXT NOT NULL,"
+            " prompt_hash TEXT NOT NULL,"
+            " options_hash TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " response TEXT NOT NULL,"
+            " PRIMARY KEY (model, prompt_hash, options_hash, seq))"
+        )
+        if columns and 'seq' not in columns:
+            self._conn.execute(
+                "INSERT INTO responses (model, prompt_hash, options_hash, seq, response)"
+                " SELECT model, prompt_hash, options_hash, 0, response FROM responses_unsequenced"
+            )
+            self._conn.execute("DROP TABLE responses_unsequenced")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def key_options(options=None, run=None, chat=False, stream_cutoff=None):
+        """
+        The options part of a cache key: the generation options plus everything
+        else that changes the response to a prompt. run is the trial's run
+        index, stream_cutoff 'strict' or 'forgiving' for streamed calls.
+        """
+        key = dict(options or {})
+        if run is not None:
+            key['run'] = run
+        if chat:
+            # Chat responses are answers to a differently framed request; keep them apart.
+            key['api'] = 'chat'
+        if stream_cutoff is not None:
+            key['stream_cutoff'] = stream_cutoff
+        return key
+
+    def get(self, model, prompt, options=None, seq=0):
+        """Returns the cached response text, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE model = ? AND prompt_hash = ? AND options_hash = ? AND seq = ?",
+                (model, prompt_hash(prompt), options_hash(options), seq)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, prompt, response, options=None, seq=0):
+        self.put_many([(model, prompt, response, options, seq)])
+
+    def put_many(self, entries):
+        """Stores (model, prompt, response, options, seq) tuples, replacing earlier recordings of the same key."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO responses (model, prompt_hash, options_hash, seq, response) VALUES (?, ?, ?, ?, ?)",
+                [(model, prompt_hash(prompt), options_hash(options), seq, str(response))
+                 for model, prompt, response, options, seq in entries]
+            )
+            self._conn.commit()
+            self.recorded += len(entries)
+
+    def wrap(self, generate, model, options=None, offline=False):
+        """
+        Wraps the generate(prompt) callable of one trial. Live (offline=False),
+        every response is recorded and the model is always called. With
+        offline=True responses are served from the cache, in the order the
+        trial recorded them; a miss returns a CallFailure instead of calling
+        the model. options should come from key_options().
+        """
+        asked = {}
+
+        def cached_generate(prompt):
+            seq = asked.get(prompt, 0)
+            asked[prompt] = seq + 1
+            if offline:
+                response = self.get(model, prompt, options, seq)
+                if response is None:
+                    return CallFailure("No cached response for this prompt (offline replay)")
+                return ModelResponse(response, {"response_cache": "hit"})
+            response = generate(prompt)
+            if isinstance(response, str):
+                self.put(model, prompt, response, options, seq)
+            return response
+        return cached_generate
+
+    def summary(self):
+        return f"Response cache: {self.hits} hits, {self.misses} misses, {self.recorded} responses recorded"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,373 @@
+# result_pack.py
+#
+# Compressed, deduplicated storage of archived trial results.
+#
+# 04_RawData holds one pretty-printed result.json per trial, and most of its
+# bytes are repeated text: step1_raw_spec and step1_generated_spec are usually
+# identical, as are step2_generated_code_raw and the cleaned code, and many runs
+# produce byte-identical outputs. On top of that every trial costs a directory
+# and a file, i.e. at least two filesystem blocks.
+#
+# `pack` folds the result.json files under a directory into one pack file,
+# <dir>/result_pack.sqlite, with two tables:
+#   blobs    the texts of the cycle logs, stored once under their SHA-256
+#            digest and zlib-compressed
+#   results  one row per former result.json (by its path relative to the pack):
+#            the scalar header fields as JSON, and the zlib-compressed result
+#            whose cycle-log texts are references {"$blob": "<digest>"}
+# Each result is checked to read back identically before its file is removed.
+# `unpack` writes the result.json files back and removes the pack.
+#
+# Readers do not need to know whether a trial is packed: find_result_files()
+# yields packed results under the path their result.json had, so directory
+# names parse as before, and load_result() / load_result_header() return the
+# same dicts as reading the file. A loose result.json takes precedence over a
+# packed copy of the same path (e.g. a trial rerun after packing).
+#
+# Usage:
+#   python3 03_Scripts/result_pack.py pack 04_RawData
+#   python3 03_Scripts/result_pack.py stats 04_RawData
+#   python3 03_Scripts/result_pack.py unpack 04_RawData
+#
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+PACK_FILE_NAME = 'result_pack.sqlite'
+RESULT_FILE_NAME = 'result.json'
+TEXT_FIELDS = ('step1_raw_spec', 'step1_generated_spec', 'step2_generated_code_raw', 'step2_generated_code_clean')
+BLOB_KEY = '$blob'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS results (
+    source TEXT PRIMARY KEY,
+    header TEXT NOT NULL,
+    record BLOB NOT NULL
+);
+"""
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def _all_logs(result):
+    """The cycle logs of a result, including those of the branches of a composite result."""
+    yield result.get('logs', [])
+    for branch in result.get('branches', {}).values():
+        if isinstance(branch, dict) and 'logs' in branch:
+            yield branch['logs']
+
+def _map_texts(result, replace):
+    """Returns a copy of result whose cycle-log text fields are replaced by replace(value)."""
+    result = dict(result)
+    if 'logs' in result:
+        result['logs'] = [_map_log(cycle_log, replace) for cycle_log in result['logs']]
+    if isinstance(result.get('branches'), dict):
+        result['branches'] = {
+            name: dict(branch, logs=[_map_log(cycle_log, replace) for cycle_log in branch['logs']])
+            if isinstance(branch, dict) and 'logs' in branch else branch
+            for name, branch in result['branches'].items()
+        }
+    return result
+
+def _map_log(cycle_log, replace):
+    if not isinstance(cycle_log, dict):
+        return cycle_log
+    return {key: replace(value) if key in TEXT_FIELDS else value for key, value in cycle_log.items()}
+
+def result_header(result):
+    """The top-level scalar fields of a result, as read_result_header() in 05_Reports returns them."""
+    return {key: value for key, value in result.items() if not isinstance(value, (list, dict))}
+
+class ResultPack:
+    """
+    A pack file of results and their deduplicated, compressed texts. Safe to
+    share between threads.
+    """
+
+    def __init__(self, path, text_cache_size=4096):
+        self.path = path
+        self.text_cache_size = text_cache_size
+        self._texts = OrderedDict()
+        self._sources = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add_result(self, source, result):
+        """Stores a result under source (its path relative to the pack's directory). Call commit() afterwards."""
+        blobs = {}
+
+        def to_reference(value):
+            if not isinstance(value, str):
+                return value
+            digest = text_digest(value)
+            blobs[digest] = value
+            return {BLOB_KEY: digest}
+
+        record = _map_texts(result, to_reference)
+        with self._lock:
+            known = self._known_digests(list(blobs))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)",
+                [(digest, zlib.compress(text.encode('utf-8', 'surrogatepass'), 9))
+                 for digest, text in blobs.items() if digest not in known]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (source, header, record) VALUES (?, ?, ?)",
+                (source, json.dumps(result_header(result)),
+                 zlib.compress(json.dumps(record, separators=(',', ':')).encode('utf-8'), 9))
+            )
+            self._sources = None
+
+    def _known_digests(self, digests):
+        known = set()
+        for start in range(0, len(digests), 500):
+            chunk = digests[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT digest FROM blobs WHERE digest IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            known.update(row[0] for row in rows)
+        return known
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def sources(self):
+        """The sources of all packed results."""
+        with self._lock:
+            if self._sources is None:
+                self._sources = frozenset(row[0] for row in self._conn.execute("SELECT source FROM results"))
+            return self._sources
+
+    def header(self, source):
+        """Returns the scalar header fields of a packed result. Raises KeyError if it is not packed."""
+        with self._lock:
+            row = self._conn.execute("SELECT header FROM results WHERE source = ?", (source,)).fetchone()
+        if row is None:
+            raise KeyError(source)
+        return json.loads(row[0])
+
+    def load(self, source):
+        """Returns a packed result with all its texts. Raises KeyError if it is not packed."""
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM results WHERE source = ?", (source,)).fetchone()
+        if row is None:
+            raise KeyError(source)
+        record = json.loads(zlib.decompress(row[0]))
+        references = set()
+        _map_texts(record, lambda value: references.add(value[BLOB_KEY]) if isinstance(value, dict) else None)
+        texts = self._get_texts(references)
+        return _map_texts(record, lambda value: texts[value[BLOB_KEY]] if isinstance(value, dict) else value)
+
+    def _get_texts(self, digests):
+        texts = {}
+        with self._lock:
+            missing = []
+            for digest in digests:
+                if digest in self._texts:
+                    self._texts.move_to_end(digest)
+                    texts[digest] = self._texts[digest]
+                else:
+                    missing.append(digest)
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                for digest, data in self._conn.execute(
+                        f"SELECT digest, data FROM blobs WHERE digest IN ({','.join('?' * len(chunk))})", chunk):
+                    texts[digest] = self._texts[digest] = zlib.decompress(data).decode('utf-8', 'surrogatepass')
+            while len(self._texts) > self.text_cache_size:
+                self._texts.popitem(last=False)
+        return texts
+
+    def stats(self):
+        with self._lock:
+            results = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            blobs, compressed = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()
+        return {"results": results, "blobs": blobs, "compressed_text_bytes": compressed,
+                "file_bytes": os.path.getsize(self.path)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Packs opened by the read helpers, by path, for the lifetime of the process.
+_packs = {}
+_pack_dirs = {}
+_packs_lock = threading.Lock()
+
+def open_pack(path):
+    """Returns the process-wide ResultPack of a pack file."""
+    path = os.path.abspath(path)
+    with _packs_lock:
+        if path not in _packs:
+            _packs[path] = ResultPack(path)
+        return _packs[path]
+
+def _pack_for(result_path):
+    """Returns (pack, source) for the nearest pack above a result path, or (None, None)."""
+    directory = os.path.dirname(os.path.abspath(result_path))
+    while True:
+        if directory not in _pack_dirs:
+            _pack_dirs[directory] = os.path.exists(os.path.join(directory, PACK_FILE_NAME))
+        if _pack_dirs[directory]:
+            pack = open_pack(os.path.join(directory, PACK_FILE_NAME))
+            source = os.path.relpath(os.path.abspath(result_path), directory)
+            if source in pack.sources():
+                return pack, source
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None, None
+        directory = parent
+
+def find_result_files(data_dirs):
+    """
+    Yields the path of every result under data_dirs in sorted order: loose
+    result.json files, and packed results under the path they had before packing.
+    """
+    for data_dir in data_dirs:
+        paths = set()
+        for root, dirs, files in os.walk(data_dir):
+            if RESULT_FILE_NAME in files:
+                paths.add(os.path.join(root, RESULT_FILE_NAME))
+            if PACK_FILE_NAME in files:
+                paths.update(os.path.join(root, source) for source in open_pack(os.path.join(root, PACK_FILE_NAME)).sources())
+        yield from sorted(paths)
+
+def load_result(result_path):
+    """Returns the result stored at a path from find_result_files(), loose or packed."""
+    try:
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pack, source = _pack_for(result_path)
+        if pack is None:
+            raise
+        return pack.load(source)
+
+def load_result_header(result_path):
+    """Returns the scalar header fields of a packed result, or None if the path is not packed."""
+    pack, source = _pack_for(result_path)
+    return pack.header(source) if pack is not None else None
+
+def result_stat(result_path):
+    """os.stat() of a loose result.json, or of the pack file holding it."""
+    try:
+        return os.stat(result_path)
+    except FileNotFoundError:
+        pack, _ = _pack_for(result_path)
+        if pack is None:
+            raise
+        return os.stat(pack.path)
+
+def _disk_bytes(path):
+    st = os.stat(path)
+    return getattr(st, 'st_blocks', 0) * 512 or st.st_size
+
+def pack_tree(data_dir, verbose=True):
+    """
+    Moves every loose result.json under data_dir into <data_dir>/result_pack.sqlite,
+    removing each file (and its directory, if that is then empty) once it
+    reads back identically. Returns (packed, bytes_before, disk_bytes_before).
+    """
+    packed = size = disk = 0
+    with ResultPack(os.path.join(data_dir, PACK_FILE_NAME)) as pack:
+        for root, dirs, files in os.walk(data_dir):
+            dirs.sort()
+            if RESULT_FILE_NAME not in files:
+                continue
+            result_path = os.path.join(root, RESULT_FILE_NAME)
+            try:
+                with open(result_path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"Could not read or parse {result_path}: {e}; leaving it in place.")
+                continue
+            source = os.path.relpath(result_path, data_dir)
+            pack.add_result(source, result)
+            pack.commit()
+            if pack.load(source) != result:
+                print(f"{result_path} did not read back identically; leaving it in place.")
+                continue
+            size += os.path.getsize(result_path)
+            disk += _disk_bytes(result_path) + _disk_bytes(root)
+            os.remove(result_path)
+            if not os.listdir(root):
+                os.rmdir(root)
+            else:
+                disk -= _disk_bytes(root)
+            packed += 1
+            if verbose and packed % 1000 == 0:
+                print(f"  {packed} results packed...")
+    return packed, size, disk
+
+def unpack_tree(data_dir):
+    """Writes every packed result under data_dir back to its result.json and removes the packs. Returns the count."""
+    from run_cycle_test_syntactic import save_result
+
+    unpacked = 0
+    for root, dirs, files in os.walk(data_dir):
+        if PACK_FILE_NAME not in files:
+            continue
+        pack_path = os.path.join(root, PACK_FILE_NAME)
+        with ResultPack(pack_path) as pack:
+            for source in sorted(pack.sources()):
+                result_path = os.path.join(root, source)
+                if os.path.exists(result_path):
+                    # A newer loose copy wins, as in the read helpers.
+                    continue
+                save_result(pack.load(source), os.path.dirname(result_path))
+                unpacked += 1
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(pack_path + suffix):
+                os.remove(pack_path + suffix)
+    return unpacked
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack archived result.json files into deduplicated, compressed pack files, or unpack them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (("pack", "Move the result.json files under each directory into <dir>/result_pack.sqlite."),
+                               ("unpack", "Write packed results back to result.json files and remove the packs."),
+                               ("stats", "Show the size and deduplication of the packs under each directory.")):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("data_dirs", nargs='+', help="Directories containing results (e.g., 04_RawData).")
+
+    args = parser.parse_args()
+
+    for data_dir in args.data_dirs:
+        if args.command == "pack":
+            start = time.monotonic()
+            packed, size, disk = pack_tree(data_dir)
+            pack_bytes = _disk_bytes(os.path.join(data_dir, PACK_FILE_NAME))
+            print(f"Packed {packed} results from {data_dir} in {time.monotonic() - start:.1f}s: "
+                  f"{size / 1e6:.1f} MB of result.json ({disk / 1e6:.1f} MB on disk) -> "
+                  f"{pack_bytes / 1e6:.1f} MB pack file (all packs under it included).")
+        elif args.command == "unpack":
+            print(f"Unpacked {unpack_tree(data_dir)} results under {data_dir}.")
+        elif args.command == "stats":
+            for root, dirs, files in os.walk(data_dir):
+                if PACK_FILE_NAME in files:
+                    with ResultPack(os.path.join(root, PACK_FILE_NAME)) as pack:
+                        stats = pack.stats()
+                    print(f"{os.path.join(root, PACK_FILE_NAME)}: {stats['results']} results, {stats['blobs']} distinct texts "
+                          f"({stats['compressed_text_bytes'] / 1e6:.1f} MB compressed), {stats['file_bytes'] / 1e6:.1f} MB file")
+
+if __name__ == "__main__":
+    main()
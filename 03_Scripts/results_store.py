@@ -0,0 +1,177 @@
+# results_store.py
+#
+# A single-file SQLite results store that replaces crawling thousands of
+# per-run result.json directories.
+#
+# Tables:
+#   trials       one row per finished trial; model, test_case, lang, spec_lang,
+#                prompt_style, mode, run, ... are explicit columns, so no
+#                directory-name regexes are needed at analysis time.
+#   cycles       one row per cycle with its step statuses (and stats, if any).
+#   cycle_texts  the raw/cleaned spec and code texts, kept apart so that
+#                analysis queries never touch them.
+#
+# Usage:
+#   # One-off import of the existing 04_RawData tree
+#   python3 03_Scripts/results_store.py import 04_RawData --store 05_Reports/results.sqlite
+#
+#   # Append trials as they finish during a sweep
+#   python3 03_Scripts/run_sweep.py ... --results-store 05_Reports/results.sqlite
+#
+#   # Analysis
+#   python3 05_Reports/analyze_with_ci.py --store 05_Reports/results.sqlite
+#
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from result_pack import find_result_files, load_result
+from run_sweep import parse_trial_dir_name, parse_batch_dir_name, parse_batch_mode
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY,
+    source TEXT UNIQUE,
+    batch TEXT,
+    model TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    spec_lang TEXT NOT NULL,
+    prompt_style TEXT NOT NULL,
+    mode TEXT,
+    test_type TEXT,
+    n_runs TEXT,
+    run INTEGER,
+    status TEXT,
+    success INTEGER NOT NULL,
+    cycles_completed INTEGER,
+    recorded_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_trials_model_case ON trials(model, test_case);
+
+CREATE TABLE IF NOT EXISTS cycles (
+    trial_id INTEGER NOT NULL REFERENCES trials(trial_id) ON DELETE CASCADE,
+    cycle INTEGER NOT NULL,
+    step1_status TEXT,
+    step2_status TEXT,
+    stats TEXT,
+    PRIMARY KEY (trial_id, cycle)
+);
+
+CREATE TABLE IF NOT EXISTS cycle_texts (
+    trial_id INTEGER NOT NULL REFERENCES trials(trial_id) ON DELETE CASCADE,
+    cycle INTEGER NOT NULL,
+    step1_raw_spec TEXT,
+    step1_generated_spec TEXT,
+    step2_generated_code_raw TEXT,
+    step2_generated_code_clean TEXT,
+    PRIMARY KEY (trial_id, cycle)
+);
+"""
+
+TEXT_FIELDS = ('step1_raw_spec', 'step1_generated_spec', 'step2_generated_code_raw', 'step2_generated_code_clean')
+
+class ResultsStore:
+    """Append-only SQLite store of trial results, safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _insert(self, trial, result, batch, source, mode, test_type, n_runs):
+        status = result.get('status', '')
+        self._conn.execute("DELETE FROM trials WHERE source = ?", (source,))
+        cursor = self._conn.execute(
+            "INSERT INTO trials (source, batch, model, test_case, lang, spec_lang, prompt_style, mode,"
+            " test_type, n_runs, run, status, success, cycles_completed, recorded_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (source, batch, trial['model'], trial['test_case'], trial['lang'], trial['spec_lang'],
+             trial['prompt_style'], mode, test_type, n_runs, trial.get('run'), status,
+             1 if "SUCCESS" in status else 0, result.get('cycles_completed'), time.time())
+        )
+        trial_id = cursor.lastrowid
+        cycles, texts = [], []
+        for index, cycle_log in enumerate(result.get('logs', [])):
+            cycle = cycle_log.get('cycle', index + 1)
+            stats = {k: v for k, v in cycle_log.items() if k.endswith('_stats') or k == 'timings'}
+            cycles.append((trial_id, cycle, cycle_log.get('step1_status'), cycle_log.get('step2_status'),
+                           json.dumps(stats) if stats else None))
+            texts.append((trial_id, cycle) + tuple(cycle_log.get(field) for field in TEXT_FIELDS))
+        self._conn.executemany("INSERT INTO cycles VALUES (?, ?, ?, ?, ?)", cycles)
+        self._conn.executemany("INSERT INTO cycle_texts VALUES (?, ?, ?, ?, ?, ?)", texts)
+        return trial_id
+
+    def append_trial(self, trial, result, batch=None, source=None, mode=None, test_type=None, n_runs=None):
+        """
+        Stores one finished trial with its per-cycle rows. `trial` is a dict with
+        model, test_case, lang, spec_lang, prompt_style and run. Re-appending the
+        same source replaces the earlier row.
+        """
+        if test_type is None and batch is not None:
+            test_type, batch_n = parse_batch_dir_name(batch)
+            n_runs = n_runs if n_runs is not None else batch_n
+        with self._lock:
+            trial_id = self._insert(trial, result, batch, source, mode, test_type,
+                                    str(n_runs) if n_runs is not None else None)
+            self._conn.commit()
+        return trial_id
+
+    def import_tree(self, data_dir, verbose=True):
+        """One-off import of an existing 04_RawData tree. Returns the number of imported trials."""
+        imported = 0
+        with self._lock:
+            for result_path in find_result_files([data_dir]):
+                root = os.path.dirname(result_path)
+                trial = parse_trial_dir_name(os.path.basename(root))
+                batch = os.path.basename(os.path.dirname(root))
+                test_type, n_runs = parse_batch_dir_name(batch)
+                if trial is None or test_type is None:
+                    if verbose:
+                        print(f"Skipping unrecognized trial directory: {root}")
+                    continue
+                try:
+                    result = load_result(result_path)
+                except (json.JSONDecodeError, IOError) as e:
+                    print(f"Could not read or parse {result_path}: {e}")
+                    continue
+                source = os.path.relpath(result_path, data_dir)
+                self._insert(trial, result, batch, source, parse_batch_mode(batch), test_type, n_runs)
+                imported += 1
+            self._conn.commit()
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the SQLite results store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Import an existing 04_RawData tree.")
+    import_parser.add_argument("data_dirs", nargs='+', help="Directories containing result.json files.")
+    import_parser.add_argument("--store", required=True, help="Path of the SQLite results store.")
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        start = time.monotonic()
+        with ResultsStore(args.store) as store:
+            total = sum(store.import_tree(data_dir) for data_dir in args.data_dirs)
+        print(f"Imported {total} trials into {args.store} in {time.monotonic() - start:.1f}s.")
+
+if __name__ == "__main__":
+    main()
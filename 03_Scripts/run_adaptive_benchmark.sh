@@ -4,12 +4,14 @@
 
 # --- Usage ---
 usage() {
-    echo "Usage: $0 --mode <strict|forgiving|composite> [--test-case <name>] [--num-runs <int>] [model_name...]"
+    echo "Usage: $0 --mode <strict|forgiving|composite> [--test-case <name>] [--num-runs <int>] [--keep-alive <duration>] [--resume <results_dir>] [model_name...]"
     echo ""
     echo "Arguments:"
     echo "  --mode <strict|forgiving|composite> : Set the evaluation mode."
     echo "  --test-case <name>                  : (Optional) Test case to run (default: process_user_list)."
     echo "  --num-runs <int>                    : (Optional) Number of runs per combination (default: 30)."
+    echo "  --keep-alive <duration>             : (Optional) Keep each model loaded between runs, e.g. 30m (default: the server's setting)."
+    echo "  --resume <results_dir>              : (Optional) Continue an interrupted run in <results_dir>, skipping finished runs."
     echo "  [model_name...]                     : (Optional) Space-separated list of models to test."
     exit 1
 }
@@ -18,6 +20,8 @@ usage() {
 MODE=""
 TEST_CASE="process_user_list"
 NUM_RUNS=30
+KEEP_ALIVE=""
+RESUME_DIR=""
 MODELS_CLI=()
 
 while [[ $# -gt 0 ]]; do
@@ -26,6 +30,8 @@ while [[ $# -gt 0 ]]; do
         --mode) MODE="$2"; shift; shift ;;
         --test-case) TEST_CASE="$2"; shift; shift ;;
         --num-runs) NUM_RUNS="$2"; shift; shift ;;
+        --keep-alive) KEEP_ALIVE="$2"; shift; shift ;;
+        --resume) RESUME_DIR="$2"; shift; shift ;;
         *) MODELS_CLI+=("$1"); shift ;;
     esac
 done
@@ -55,7 +61,15 @@ SCRIPT_DIR=$(cd -- "$(dirname -- "${BASH_SOURCE[0]}")" &> /dev/null && pwd)
 BASE_DIR=$(realpath "$SCRIPT_DIR/..")
 PYTHON_SCRIPT="$BASE_DIR/03_Scripts/run_cycle_test_syntactic.py"
 RUN_TYPE="adaptive_${MODE}_n${NUM_RUNS}_${TEST_CASE}"
-RESULTS_DIR="$BASE_DIR/04_RawData/${RUN_TYPE}_$(date +%Y%m%d_%H%M%S)"
+if [[ -n "$RESUME_DIR" ]]; then
+    if [[ ! -d "$RESUME_DIR" ]]; then
+        echo "Error: --resume directory '$RESUME_DIR' does not exist."
+        exit 1
+    fi
+    RESULTS_DIR=$(realpath "$RESUME_DIR")
+else
+    RESULTS_DIR="$BASE_DIR/04_RawData/${RUN_TYPE}_$(date +%Y%m%d_%H%M%S)"
+fi
 
 # --- Configuration Echo ---
 echo "Starting Focused Adaptive Benchmark Run..."
@@ -93,26 +107,25 @@ for model in "${MODELS[@]}"; do
         run_id="${lang}_${spec_lang}_${style}_${TEST_CASE}_run${i}"
         output_dir="$RESULTS_DIR/${model//:/-}_${run_id}"
 
+        # A run is finished once its .done marker exists; interrupted runs are redone.
+        if [[ -f "$output_dir/.done" ]]; then
+            echo "--- SKIPPING (already done): Model=$model, Run=$i ---"
+            continue
+        fi
+
         echo "--- STARTING: [$MODE] Test=$TEST_CASE, Model=$model, Lang=$lang, Spec=$spec_lang, Style=$style, Run=$i ---"
 
         CMD_ARGS=(--model "$model" --test-case "$TEST_CASE" --spec-lang "$spec_lang" --prompt-style "$style" --lang "$lang" --output-dir "$output_dir" --api-url "$OLLAMA_API_URL" --max-cycles 10)
+        if [[ -n "$KEEP_ALIVE" ]]; then
+            CMD_ARGS+=(--keep-alive "$KEEP_ALIVE")
+        fi
+
+        # Composite mode evaluates strict and forgiving cleaning on the same model
+        # responses in one run; result.json records both branches.
+        python3 "$PYTHON_SCRIPT" "${CMD_ARGS[@]}" --mode "$MODE"
 
-        if [[ "$MODE" == "composite" ]]; then
-            # 1. Run with strict mode first
-            echo "  Attempting with mode: strict"
-            python3 "$PYTHON_SCRIPT" "${CMD_ARGS[@]}" --mode "strict"
-            
-            # 2. Check result and fallback to forgiving if failed
-            result_file="$output_dir/result.json"
-            if [[ -f "$result_file" ]] && ! grep -q "SUCCESS" "$result_file"; then
-                echo "  Strict mode failed. Falling back to mode: forgiving"
-                python3 "$PYTHON_SCRIPT" "${CMD_ARGS[@]}" --mode "forgiving"
-            else
-                echo "  Strict mode succeeded. No fallback needed."
-            fi
-        else
-            # Run with the specified mode (strict or forgiving)
-            python3 "$PYTHON_SCRIPT" "${CMD_ARGS[@]}" --mode "$MODE"
+        if [[ -f "$output_dir/result.json" ]]; then
+            touch "$output_dir/.done"
         fi
 
         echo "--- FINISHED: [$MODE] Test=$TEST_CASE, Model=$model, Lang=$lang, Spec=$spec_lang, Style=$style, Run=$i ---"
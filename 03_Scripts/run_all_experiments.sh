@@ -8,8 +8,10 @@
 #
 
 # --- Centralized Configuration ---
-# Set the base URL for the Ollama API server.
-OLLAMA_API_URL="http://192.168.3.213:11434"
+# Set the base URL for the Ollama API server. An OLLAMA_API_URL from the
+# environment takes precedence, e.g. a local stub_ollama.py:
+#   OLLAMA_API_URL=http://localhost:11434 03_Scripts/run_all_experiments.sh
+OLLAMA_API_URL="${OLLAMA_API_URL:-http://192.168.3.213:11434}"
 
 # Set the default number of runs for each test combination.
 # This can be overridden with the --num-runs flag.
@@ -5,8 +5,14 @@ import re
 import requests
 import subprocess
 import tempfile
-import ast
 import sys
+import threading
+import time
+
+from code_extraction import extract_code, iter_fenced_blocks, is_valid_python
+from prompt_registry import get_registry, load_test_runner, load_test_suite, split_test_runner
+from test_suite import SUITE_FILE_NAME, suite_source, with_runner_imports, report_outcome, failed_report, is_conclusive
+from sandbox_pool import is_harness_error
 
 def load_file_content(file_path):
     """Safely loads content from a file."""
@@ -17,123 +23,336 @@ def load_file_content(file_path):
         print(f"Error: File not found at {file_path}")
         return None
 
-def call_ollama_api(api_url, model, prompt):
-    """Calls the Ollama API and returns the generated content."""
-    
-    # Ensure the URL points to the correct endpoint
+# A session keeps HTTP connections to the Ollama server alive between steps
+# and cycles instead of opening a new TCP connection for every call. Each
+# thread gets its own: a single shared session's pool holds only 10
+# connections per host, so a sweep with more workers would keep discarding and
+# reopening them.
+_sessions = threading.local()
+
+def _session():
+    """Returns the calling thread's requests.Session."""
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+def ollama_generate_url(api_url):
+    """Ensures the URL points to the /api/generate endpoint."""
     if not api_url.endswith('/api/generate'):
         api_url = api_url.rstrip('/') + '/api/generate'
+    return api_url
+
+def ollama_chat_url(api_url):
+    """Returns the /api/chat endpoint of the server an API URL points to."""
+    return ollama_generate_url(api_url)[:-len('/api/generate')] + '/api/chat'
+
+def extract_response_text(data):
+    """Extracts the generated text from an Ollama (or OpenAI-compatible) response body."""
+    if "response" in data:
+        return data["response"].strip()
+    elif isinstance(data.get("message"), dict) and "content" in data["message"]:
+        # Ollama /api/chat
+        return data["message"]["content"].strip()
+    elif "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0] and "content" in data["choices"][0]["message"]:
+        return data["choices"][0]["message"]["content"].strip()
+    else:
+        print(f"Error: Unexpected response format from Ollama: {data}")
+        return None
+
+# Ollama generation options that can be set from the command line.
+GENERATION_OPTION_NAMES = ('temperature', 'seed', 'num_predict', 'num_ctx')
+
+def add_generation_arguments(parser):
+    """Adds the --temperature/--seed/--num-predict/--num-ctx/--keep-alive options to a parser."""
+    parser.add_argument("--temperature", type=float, default=None, help="Sampling temperature (Ollama option; server default if omitted).")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for generation (Ollama option).")
+    parser.add_argument("--num-predict", type=int, default=None, help="Maximum number of tokens to generate (Ollama option).")
+    parser.add_argument("--num-ctx", type=int, default=None, help="Context window size (Ollama option).")
+    parser.add_argument("--keep-alive", default=None, help="How long the model stays loaded after a request, e.g. '30m' or -1 for indefinitely.")
+
+def add_chat_argument(parser):
+    """Adds the --chat option to a parser."""
+    parser.add_argument("--chat", action='store_true', help="Use /api/chat with each prompt template's fixed preamble as system message, so the server evaluates it once and reuses it; the prompt-eval tokens saved are logged.")
+
+def add_suite_report_argument(parser):
+    """Adds the --suite-report option to a parser."""
+    parser.add_argument("--suite-report", action='store_true', help="Also run every case of a test case's test_cases.json and log the per-case results as step2_test_results (the verdict still comes from test_runner.py).")
+
+def generation_options(args):
+    """Returns the Ollama options dict selected on the command line, or None."""
+    options = {name: getattr(args, name) for name in GENERATION_OPTION_NAMES if getattr(args, name) is not None}
+    return options or None
+
+def parse_keep_alive(value):
+    """Ollama takes keep_alive as seconds (a number, negative = forever) or a duration string such as '30m'."""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+def build_generate_payload(model, prompt, stream, options=None, keep_alive=None, chat=False):
+    """
+    Returns the JSON body of an /api/generate request, or with chat=True of an
+    /api/chat request whose system message is the prompt's fixed template
+    preamble (TemplatePrompt.prefix) and whose user message is the rest.
+    """
+    if chat:
+        prefix = getattr(prompt, 'prefix', '')
+        messages = [{"role": "system", "content": prefix}] if prefix else []
+        messages.append({"role": "user", "content": prompt[len(prefix):]})
+        payload = {"model": model, "messages": messages, "stream": stream}
+    else:
+        payload = {"model": model, "prompt": prompt, "stream": stream}
+    if options:
+        payload["options"] = options
+    if keep_alive is not None:
+        payload["keep_alive"] = parse_keep_alive(keep_alive)
+    return json.dumps(payload)
+
+# Durations (in nanoseconds) and token counts Ollama reports on its final
+# response object. load_duration is the time spent loading the model, i.e. the
+# cost of a swap.
+SERVER_DURATION_FIELDS = ('load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration')
+SERVER_COUNT_FIELDS = ('prompt_eval_count', 'eval_count')
+
+def server_stats(data):
+    """Returns the server-reported token counts and durations (in seconds) of a response body."""
+    stats = {name: data[name] for name in SERVER_COUNT_FIELDS if isinstance(data.get(name), int)}
+    stats.update({name: data[name] / 1e9 for name in SERVER_DURATION_FIELDS if isinstance(data.get(name), (int, float))})
+    return stats
+
+def response_with_stats(data):
+    """Returns the generated text of a response body, carrying its server stats in .stats if any."""
+    text = extract_response_text(data)
+    stats = server_stats(data)
+    if text is None or not stats:
+        return text
+    return ModelResponse(text, stats)
+
+def call_ollama_api(api_url, model, prompt, options=None, keep_alive=None, chat=False):
+    """
+    Calls the Ollama API and returns the generated content. With chat=True the
+    prompt goes to /api/chat with its template preamble as system message
+    (see build_generate_payload()).
+    """
+    
+    # Ensure the URL points to the correct endpoint
+    api_url = ollama_chat_url(api_url) if chat else ollama_generate_url(api_url)
 
     try:
-        response = requests.post(
+        response = _session().post(
             api_url,
             headers={"Content-Type": "application/json"},
-            data=json.dumps({
-                "model": model,
-                "prompt": prompt,
-                "stream": False
-            }),
+            data=build_generate_payload(model, prompt, False, options, keep_alive, chat),
             timeout=60  # 60-second timeout
         )
         response.raise_for_status()
-        data = response.json()
-        if "response" in data:
-            return data["response"].strip()
-        elif "choices" in data and len(data["choices"]) > 0 and "message" in data["choices"][0] and "content" in data["choices"][0]["message"]:
-            return data["choices"][0]["message"]["content"].strip()
-        else:
-            print(f"Error: Unexpected response format from Ollama: {data}")
-            return None
+        result = response_with_stats(response.json())
+        if chat:
+            chat_prefix_savings.record(model, prompt, getattr(result, 'stats', None))
+        return result
     except requests.exceptions.RequestException as e:
         print(f"Error calling Ollama API: {e}")
         return None
 
+class ModelResponse(str):
+    """A model response text that also carries call metadata (timings, token counts) in .stats."""
+
+    def __new__(cls, text, stats=None):
+        obj = super().__new__(cls, text)
+        obj.stats = stats or {}
+        return obj
+
+class CallFailure:
+    """
+    Returned instead of a response when a model call fails for a specific,
+    known reason; iter_cycle() logs "FAIL: <reason>" for it. A plain None is
+    logged as "FAIL: API call failed".
+    """
+
+    def __init__(self, reason):
+        self.reason = reason
+
+class ChatPrefixSavings:
+    """
+    Estimates the prompt-eval tokens saved by sending the template preamble as
+    a fixed /api/chat system message, which the server evaluates once and then
+    reuses from its cache. Ollama only reports the tokens it actually
+    evaluated, so the cost of a full evaluation is estimated from the highest
+    tokens-per-character ratio seen for the same model and preamble (normally
+    its first, uncached call). The estimate is conservative when even that
+    call was served from the server's cache.
+    """
+
+    def __init__(self):
+        self._ratios = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, prompt, stats):
+        """Adds prompt_eval_tokens_saved to the stats of a chat response."""
+        count = (stats or {}).get('prompt_eval_count')
+        if not isinstance(count, int) or not prompt:
+            return
+        key = (model, getattr(prompt, 'prefix', ''))
+        with self._lock:
+            ratio = self._ratios[key] = max(self._ratios.get(key, 0.0), count / len(prompt))
+        stats['prompt_eval_tokens_saved'] = max(0, round(ratio * len(prompt)) - count)
+
+chat_prefix_savings = ChatPrefixSavings()
+
+def prompt_cache_summary(result):
+    """Totals of the prompt-eval tokens evaluated and saved over the cycle logs of a chat-mode trial."""
+    evaluated = saved = 0
+    for cycle_log in result.get('logs', []):
+        if cycle_log.get('shared_prefix'):
+            continue
+        for key in ('step1_stats', 'step2_stats'):
+            stats = cycle_log.get(key) or {}
+            evaluated += stats.get('prompt_eval_count', 0)
+            saved += stats.get('prompt_eval_tokens_saved', 0)
+    return {"mode": "chat", "prompt_eval_tokens": evaluated, "prompt_eval_tokens_saved": saved}
+
+def chunk_text(chunk):
+    """The generated text of one streamed /api/generate or /api/chat chunk."""
+    if "response" in chunk:
+        return chunk["response"]
+    return (chunk.get("message") or {}).get("content", "")
+
+class FencedBlockWatcher:
+    """
+    Accumulates a streamed response and reports when it already contains the
+    code block that clean_generated_code() would pick: the first closed fenced
+    block in strict mode, or the first one that passes ast.parse in forgiving
+    mode. Everything generated after that point cannot change the result.
+    """
+
+    def __init__(self, strict_mode=False):
+        self.strict_mode = strict_mode
+        self.parts = []
+        self.fence_count = 0
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    def feed(self, chunk):
+        """Adds a chunk of generated text; returns True once a usable block is closed."""
+        self.parts.append(chunk)
+        if '`' not in chunk:
+            return False
+        text = self.text
+        fence_count = text.count('```')
+        if fence_count < 2 or fence_count == self.fence_count:
+            return False
+        self.fence_count = fence_count
+
+        if next(iter_fenced_blocks(text), None) is None:
+            return False
+        if self.strict_mode:
+            return True
+        return is_valid_python(clean_generated_code(text, strict_mode=False))
+
+def call_ollama_api_stream(api_url, model, prompt, strict_mode=False, options=None, keep_alive=None, chat=False):
+    """
+    Calls the Ollama API in streaming mode and stops reading (closing the
+    connection, which aborts generation on the server) as soon as the response
+    contains a usable fenced code block. Returns a ModelResponse whose .stats
+    record time-to-first-token and time-to-first-valid-block.
+    """
+    api_url = ollama_chat_url(api_url) if chat else ollama_generate_url(api_url)
+    watcher = FencedBlockWatcher(strict_mode=strict_mode)
+    stats = {"stream": True, "time_to_first_token": None, "time_to_first_valid_block": None, "cut_off": False}
+    start = time.monotonic()
+
+    try:
+        with _session().post(
+            api_url,
+            headers={"Content-Type": "application/json"},
+            data=build_generate_payload(model, prompt, True, options, keep_alive, chat),
+            stream=True,
+            timeout=60  # 60-second timeout between streamed chunks
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    print(f"Error from Ollama API: {chunk['error']}")
+                    return None
+                token = chunk_text(chunk)
+                if token and stats["time_to_first_token"] is None:
+                    stats["time_to_first_token"] = time.monotonic() - start
+                if chunk.get("done"):
+                    stats.update(server_stats(chunk))
+                if watcher.feed(token):
+                    stats["time_to_first_valid_block"] = time.monotonic() - start
+                    stats["cut_off"] = not chunk.get("done", False)
+                    break
+                if chunk.get("done"):
+                    break
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        print(f"Error calling Ollama API: {e}")
+        return None
+
+    stats["total_time"] = time.monotonic() - start
+    if chat:
+        chat_prefix_savings.record(model, prompt, stats)
+    return ModelResponse(watcher.text.strip(), stats)
+
 def clean_generated_code(raw_code, strict_mode=False):
-    full_text = raw_code.strip()
-    matches = re.findall(r"```(?:\w+)?\n(.*?)\n```", full_text, re.DOTALL)
-
-    def dedent_block(block_content):
-        # Calculate minimum indentation of non-empty lines
-        lines = block_content.splitlines()
-        min_indent = float('inf')
-        for line in lines:
-            if line.strip(): # Only consider non-empty lines
-                indent = len(line) - len(line.lstrip())
-                min_indent = min(min_indent, indent)
-        
-        if min_indent == float('inf') or min_indent == 0: # Block was all empty lines or no common indent
-            return block_content
-            
-        dedented_lines = [line[min_indent:] if len(line) >= min_indent else line for line in lines]
-        return "\n".join(dedented_lines)
-
-    if not matches:
-        # Fallback for non-markdown blocks, strip outer backticks if present
-        if full_text.startswith('`') and full_text.endswith('`'):
-            code_content = full_text[1:-1].strip()
-            return dedent_block(code_content) # Apply dedent even to single line or non-markdown code
-        return dedent_block(full_text) # Raw text, apply dedent as well
-
-    if strict_mode:
-        return dedent_block(matches[0].strip())
-    else: # Syntactic Forgiving Mode
-        for block in matches:
-            code_candidate = dedent_block(block.strip()) # strip()で前後の空白を除去してからdedent
-            try:
-                ast.parse(code_candidate)
-                return code_candidate
-            except SyntaxError:
-                continue
-    
-    # Fallback if no valid block found in forgiving mode
-    return dedent_block(matches[0].strip()) if matches else dedent_block(full_text)
+    """
+    Extracts the code to evaluate from a model response: the first fenced
+    block in strict mode, the first fenced block that parses in forgiving mode
+    (see code_extraction.py).
+    """
+    return extract_code(raw_code, strict_mode)
+
+LEGACY_CHECK_SUFFIX = "\n\nprint(get_magic_number())"
+
+def read_test_runner(test_def_dir):
+    """Returns the test_runner.py template of a test case, or None if it has none (legacy check). Read once per process."""
+    return load_test_runner(test_def_dir)
 
-def validate_code(code_string, test_def_dir):
+def read_test_suite(test_def_dir):
+    """Returns the parsed test_cases.json of a test case, or None if it has none. Raises ValueError if it is malformed."""
+    return load_test_suite(test_def_dir)
+
+def build_validation_script(code_string, test_def_dir, test_runner_script=None):
     """
-    Executes the generated code against a test runner script.
-    Falls back to the legacy get_magic_number check if the runner doesn't exist.
+    Builds the script that validates the generated code.
+    Returns (script, is_legacy, error); is_legacy is True for the get_magic_number
+    check used when the test case has no test_runner.py.
     """
-    test_runner_path = os.path.join(test_def_dir, 'test_runner.py')
+    if test_runner_script is None:
+        test_runner_script = read_test_runner(test_def_dir)
 
     # Fallback to legacy check for get_magic_number if no test_runner.py is found
-    if not os.path.exists(test_runner_path):
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.py', delete=False) as temp_f:
-            temp_f.write(code_string)
-            temp_f.write("\n\nprint(get_magic_number())")
-            temp_file_name = temp_f.name
-        
-        try:
-            result = subprocess.run(
-                ['python3', temp_file_name], capture_output=True, text=True, timeout=10
-            )
-            # Legacy check expects "42" as output
-            if result.returncode == 0 and result.stdout.strip() == "42":
-                return "SUCCESS", None
-            else:
-                error_message = result.stderr.strip() if result.returncode != 0 else f"Output was: '{result.stdout.strip()}'"
-                return None, error_message
-        finally:
-            os.remove(temp_file_name)
-
-    # New test runner logic
-    with open(test_runner_path, 'r', encoding='utf-8') as f:
-        test_runner_script = f.read()
-
-    # Split the test_runner_script into parts around '{generated_code}'
-    parts = test_runner_script.split('{generated_code}', 1)
-    if len(parts) != 2:
-        return None, "Error: '{generated_code}' placeholder not found or duplicated in test_runner.py"
+    if test_runner_script is None:
+        return code_string + LEGACY_CHECK_SUFFIX, True, None
+
+    # Split the test_runner_script into parts around '{generated_code}' (cached per template)
+    parts = split_test_runner(test_runner_script)
+    if parts is None:
+        return None, False, "Error: '{generated_code}' placeholder not found or duplicated in test_runner.py"
 
     generated_code_lines = code_string.splitlines()
     
     # Manually assemble the script, inserting generated code between the parts
     # Add blank lines around the inserted code for better readability and to prevent implicit indentation issues
     full_script = parts[0] + "\n\n" + "\n".join(generated_code_lines) + "\n\n" + parts[1]
+    return full_script, False, None
 
-
-    
+def run_script_subprocess(script, timeout=10):
+    """Runs a script in a fresh python3 interpreter; returns (returncode, stdout, stderr)."""
     with tempfile.NamedTemporaryFile(mode='w+', suffix='.py', delete=False) as temp_f:
-        temp_f.write(full_script)
+        temp_f.write(script)
         temp_file_name = temp_f.name
 
     try:
@@ -141,91 +360,438 @@ def validate_code(code_string, test_def_dir):
             ['python3', temp_file_name],
             capture_output=True,
             text=True,
-            timeout=10
+            timeout=timeout
         )
-        if result.returncode == 0:
-            return result.stdout.strip(), None
-        else:
-            return None, result.stderr.strip()
+        return result.returncode, result.stdout, result.stderr
     finally:
         os.remove(temp_file_name)
 
-def run_cycle(max_cycles, api_url, model, test_case, spec_lang, prompt_style, output_dir, base_prompt_dir, base_test_def_dir, lang, mode):
-    """Runs the semantic round-trip cycle test."""
-    
-    is_strict = (mode == 'strict')
+TEST_SUITE_SCRIPT = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_suite.py')
 
-    initial_code_path = os.path.join(base_test_def_dir, test_case, 'python', 'initial_code.py')
-    ground_truth_spec_path = os.path.join(base_test_def_dir, test_case, 'python', f'ground_truth_{lang}_{spec_lang}.txt')
-    
-    prompt_dir = os.path.join(base_prompt_dir, test_case, lang, spec_lang)
-    code_to_spec_prompt_template = load_file_content(os.path.join(prompt_dir, f'code_to_spec_{prompt_style}.prompt'))
-    spec_to_code_prompt_template = load_file_content(os.path.join(prompt_dir, f'spec_to_code_{prompt_style}.prompt'))
-    
-    initial_code = load_file_content(initial_code_path)
-    ground_truth_spec = load_file_content(ground_truth_spec_path)
+def run_suite_subprocess(code_string, suite, timeout=10):
+    """Evaluates a structured test suite in a fresh python3 interpreter (test_suite.py); returns its report."""
+    request = json.dumps({"code": code_string, "suite": suite, "timeout": timeout})
+    try:
+        result = subprocess.run(['python3', TEST_SUITE_SCRIPT], input=request, capture_output=True, text=True,
+                                timeout=timeout + 2)
+    except subprocess.TimeoutExpired:
+        return failed_report(suite, "TimeoutError", f"Validation exceeded {timeout} seconds.")
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        # The code killed its interpreter (e.g. os._exit()) before the report was written.
+        return failed_report(suite, "Error", result.stderr.strip()[-200:] or f"Validation exited with code {result.returncode}.")
+
+def validate_code(code_string, test_def_dir, sandbox=None, cache=None):
+    """
+    Executes the generated code against the test case's test runner script,
+    or its structured test_cases.json where that decides the verdict (see
+    validate_many()). Falls back to the legacy get_magic_number check if
+    neither exists.
+    If a sandbox (sandbox_pool.SandboxPool) is given, the code runs in one of
+    its pre-warmed workers instead of a new python3 subprocess. If a cache
+    (validation_cache.ValidationCache) is given, previously seen code is not
+    executed again. Returns (output, error).
+    """
+    output, error, _ = validate_code_with_results(code_string, test_def_dir, sandbox=sandbox, cache=cache)
+    return output, error
+
+def validate_code_with_results(code_string, test_def_dir, sandbox=None, cache=None, suite_report=False):
+    """
+    Same as validate_code(), but returns (output, error, test_results), where
+    test_results is the per-case report of test_suite.run_suite() if the test
+    case's test_cases.json was run (see validate_many()), else None.
+    """
+    return validate_many([code_string], test_def_dir, sandbox=sandbox, cache=cache, suite_report=suite_report)[0]
+
+def validate_many(code_strings, test_def_dir, sandbox=None, cache=None, suite_report=False):
+    """
+    Validates several programs against one test case and returns a list of
+    (output, error, test_results). The verdict comes from test_runner.py. A
+    test_cases.json decides it instead if it sets "decides_verdict": true or
+    there is no test_runner.py; with suite_report=True it is also run next to
+    the runner and only supplies test_results. Otherwise it is not run, so
+    every program is executed once. With a sandbox, all suite runs that are
+    not cached are evaluated in a single worker call.
+    """
+    test_runner_script = read_test_runner(test_def_dir)
+    try:
+        suite = read_test_suite(test_def_dir)
+    except ValueError as e:
+        suite = None
+        if test_runner_script is None:
+            return [(None, f"Error: invalid {SUITE_FILE_NAME}: {e}", None) for _ in code_strings]
+    reports = [None] * len(code_strings)
+    if suite is not None and test_runner_script is None:
+        return [report_outcome(report) + (report,) for report in _run_suites(code_strings, suite, sandbox, cache)]
+    if suite is not None and (suite['decides_verdict'] or suite_report):
+        reports = _run_suites(code_strings, with_runner_imports(suite, test_runner_script), sandbox, cache)
+        if suite['decides_verdict']:
+            return [report_outcome(report) + (report,) for report in reports]
+
+    outcomes = []
+    for code_string, report in zip(code_strings, reports):
+        if cache is not None:
+            cache_key = cache.make_key(code_string, test_runner_script if test_runner_script is not None else LEGACY_CHECK_SUFFIX)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                outcomes.append(cached[:2] + (report,))
+                continue
+            output, error = _execute_validation(code_string, test_def_dir, test_runner_script, sandbox)
+            if not is_harness_error(error):
+                cache.put(cache_key, output, error)
+        else:
+            output, error = _execute_validation(code_string, test_def_dir, test_runner_script, sandbox)
+        outcomes.append((output, error, report))
+    return outcomes
+
+def _run_suites(code_strings, suite, sandbox, cache):
+    """Returns the run_suite() report of every program, from the cache where possible."""
+    reports = [None] * len(code_strings)
+    keys = []
+    if cache is not None:
+        source = f"{SUITE_FILE_NAME}:{suite_source(suite)}"
+        for index, code_string in enumerate(code_strings):
+            keys.append(cache.make_key(code_string, source))
+            cached = cache.get(keys[index])
+            if cached is not None and cached[2] is not None:
+                reports[index] = cached[2]
+
+    missing = [index for index, report in enumerate(reports) if report is None]
+    if sandbox is not None:
+        new_reports = sandbox.run_suites([(code_strings[index], suite) for index in missing], timeout=10)
+    else:
+        new_reports = [run_suite_subprocess(code_strings[index], suite, timeout=10) for index in missing]
+    for index, report in zip(missing, new_reports):
+        reports[index] = report
+        if cache is not None and is_conclusive(report):
+            cache.put(keys[index], *report_outcome(report), results=report)
+    return reports
+
+def _execute_validation(code_string, test_def_dir, test_runner_script, sandbox):
+    script, is_legacy, error = build_validation_script(code_string, test_def_dir, test_runner_script)
+    if error:
+        return None, error
+
+    if sandbox is not None:
+        returncode, stdout, stderr = sandbox.run(script, timeout=10)
+    else:
+        returncode, stdout, stderr = run_script_subprocess(script, timeout=10)
+
+    if is_legacy:
+        # Legacy check expects "42" as output
+        if returncode == 0 and stdout.strip() == "42":
+            return "SUCCESS", None
+        else:
+            error_message = stderr.strip() if returncode != 0 else f"Output was: '{stdout.strip()}'"
+            return None, error_message
+
+    if returncode == 0:
+        return stdout.strip(), None
+    else:
+        return None, stderr.strip()
+
+def iter_cycle(max_cycles, test_case, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir, lang, mode, sandbox=None, validation_cache=None, checkpoints=None, suite_report=False):
+    """
+    Runs the semantic round-trip cycle test as a generator, independent of how
+    the model is called. Each model prompt is yielded and the model's response
+    (or None if the call failed) must be sent back. The final result dict is
+    returned through StopIteration.value; use drive_cycle() to run it.
+    With checkpoints (a checkpoint_tree.CheckpointTree scope), cycles already
+    computed from the same code by another run are reused instead of calling
+    the model again.
+    In 'composite' mode the strict and forgiving cleanings are evaluated on the
+    same responses in a single pass (see _iter_composite()); checkpoints are
+    not used then.
+    With suite_report=True the per-case results of the test case's
+    test_cases.json are logged as step2_test_results (see validate_many()).
+    """
+    # Templates and test files are read and compiled once per process.
+    registry = get_registry(base_prompt_dir, base_test_def_dir)
+    code_to_spec_prompt_template, spec_to_code_prompt_template = registry.prompt_templates(test_case, lang, spec_lang, prompt_style)
+
+    initial_code = registry.initial_code(test_case)
+    ground_truth_spec = registry.ground_truth_spec(test_case, lang, spec_lang)
 
     if not all([initial_code, ground_truth_spec, code_to_spec_prompt_template, spec_to_code_prompt_template]):
         return {"status": "ERROR: Failed to load necessary test files.", "cycles_completed": 0, "logs": []}
 
+    test_def_dir = os.path.join(base_test_def_dir, test_case, 'python')
+    templates = (code_to_spec_prompt_template, spec_to_code_prompt_template)
+    if mode == 'composite':
+        return (yield from _iter_composite(max_cycles, initial_code, templates, test_def_dir, sandbox, validation_cache, suite_report))
+    return (yield from _iter_branch(max_cycles, initial_code, templates, test_def_dir, mode == 'strict',
+                                    sandbox, validation_cache, checkpoints, suite_report))
+
+def _iter_branch(max_cycles, initial_code, templates, test_def_dir, is_strict, sandbox, validation_cache, checkpoints, suite_report=False):
+    """Runs the cycles of one cleaning mode from initial_code; a sub-generator of iter_cycle()."""
+    code_to_spec_prompt_template, spec_to_code_prompt_template = templates
     current_code = initial_code
     logs = []
     
     for i in range(max_cycles):
-        cycle_log = {"cycle": i + 1}
-
-        # Step 1: Code to Spec
-        prompt = code_to_spec_prompt_template.format(source_code=current_code)
-        raw_spec = call_ollama_api(api_url, model, prompt)
-        
-        if raw_spec is None:
-            cycle_log["step1_status"] = "FAIL: API call failed"
-            logs.append(cycle_log)
-            break
-        
-        generated_spec = clean_generated_code(raw_spec, strict_mode=is_strict)
-        cycle_log["step1_raw_spec"] = raw_spec
-        cycle_log["step1_generated_spec"] = generated_spec
-        
-        # Temporarily bypassing the strict spec-to-spec check to evaluate code generation.
-        # The check is too brittle and fails on minor semantic differences.
-        # if re.sub(r'\s+', ' ', generated_spec).strip() != re.sub(r'\s+', ' ', ground_truth_spec).strip():
-        #     cycle_log["step1_status"] = f"FAIL: Generated spec did not match ground truth."
-        #     logs.append(cycle_log)
-        #     break
-        cycle_log["step1_status"] = "SUCCESS"
-
-        # Step 2: Spec to Code
-        prompt = spec_to_code_prompt_template.format(specification=generated_spec)
-        generated_code_raw = call_ollama_api(api_url, model, prompt)
-
-        if generated_code_raw is None:
-            cycle_log["step2_status"] = "FAIL: API call failed"
-            logs.append(cycle_log)
-            break
-            
-        generated_code = clean_generated_code(generated_code_raw, strict_mode=is_strict)
-        cycle_log["step2_generated_code_raw"] = generated_code_raw
-        cycle_log["step2_generated_code_clean"] = generated_code
-
-        test_def_dir = os.path.join(base_test_def_dir, test_case, 'python')
-        output, error = validate_code(generated_code, test_def_dir)
-        
-        # The test runner script should print "SUCCESS" on stdout for a pass.
-        if error or not (output and "SUCCESS" in output):
-            cycle_log["step2_status"] = f"FAIL: Code validation failed. Error: {error}, Output: {output}"
-            logs.append(cycle_log)
+        shared = checkpoints.acquire(current_code) if checkpoints is not None else None
+        if shared is not None:
+            cycle_log = {"cycle": i + 1, **shared, "shared_prefix": True}
+        else:
+            cycle_log = {"cycle": i + 1}
+            timings = {}
+            completed = False
+            try:
+                completed = yield from _iter_one_cycle(
+                    cycle_log, timings, current_code, code_to_spec_prompt_template, spec_to_code_prompt_template,
+                    test_def_dir, is_strict, sandbox, validation_cache, suite_report
+                )
+                cycle_log["timings"] = timings
+            finally:
+                if checkpoints is not None:
+                    # Failed model calls are not a property of the code, so they are not shared.
+                    shared_log = {k: v for k, v in cycle_log.items() if k != "cycle"} if completed else None
+                    checkpoints.release(current_code, shared_log)
+        logs.append(cycle_log)
+        if cycle_log.get("step2_status") != "SUCCESS":
             break
-        cycle_log["step2_status"] = "SUCCESS"
         
-        current_code = generated_code
-        logs.append(cycle_log)
+        current_code = cycle_log["step2_generated_code_clean"]
         
         if i == max_cycles - 1:
             return {"status": "SUCCESS: All cycles completed.", "cycles_completed": max_cycles, "logs": logs}
     
     return {"status": f"FAIL: Cycle {len(logs)} failed.", "cycles_completed": len(logs) - 1, "logs": logs}
 
+COMPOSITE_BRANCHES = ('strict', 'forgiving')
+
+def _iter_composite(max_cycles, initial_code, templates, test_def_dir, sandbox, validation_cache, suite_report=False):
+    """
+    Composite mode in a single pass: a strict and a forgiving branch run in
+    lockstep on the same model responses. While both branches send the same
+    prompt (their cleaned spec/code agree) the model is called once for both;
+    once the cleanings differ, each branch gets its own calls (and they share
+    again if they converge).
+
+    The result is that of the strict branch if it succeeded, else that of the
+    forgiving branch (the strict-then-forgiving rule of the two-run composite
+    mode), with both outcomes under "branches". The selected branch's cycle
+    logs are the top-level "logs"; the other branch's are in its entry.
+    After the branches diverge, the step*_api_call timing of the forgiving
+    branch includes the strict branch's call made just before it.
+    """
+    branches = {mode: _iter_branch(max_cycles, initial_code, templates, test_def_dir, mode == 'strict',
+                                   sandbox, validation_cache, None, suite_report)
+                for mode in COMPOSITE_BRANCHES}
+    results = {}
+    prompts = {}
+    for mode, steps in branches.items():
+        try:
+            prompts[mode] = next(steps)
+        except StopIteration as stop:
+            results[mode] = stop.value
+
+    model_calls = 0
+    shared_calls = 0
+    diverged_at_cycle = None
+    step = 0
+    while prompts:
+        if len(prompts) > 1 and len(set(prompts.values())) > 1 and diverged_at_cycle is None:
+            diverged_at_cycle = step // 2 + 1
+        responses = {}
+        for mode, prompt in prompts.items():
+            if mode in responses:
+                continue
+            response = yield prompt
+            model_calls += 1
+            sharing = [other for other, other_prompt in prompts.items() if other_prompt == prompt]
+            shared_calls += len(sharing) > 1
+            for other in sharing:
+                responses[other] = response
+        for mode, response in responses.items():
+            try:
+                prompts[mode] = branches[mode].send(response)
+            except StopIteration as stop:
+                del prompts[mode]
+                results[mode] = stop.value
+        step += 1
+
+    selected = 'strict' if "SUCCESS" in results['strict']['status'] else 'forgiving'
+    other = 'forgiving' if selected == 'strict' else 'strict'
+    result = dict(results[selected])
+    result["selected_branch"] = selected
+    result["branches"] = {mode: {"status": results[mode]["status"], "cycles_completed": results[mode]["cycles_completed"]}
+                          for mode in COMPOSITE_BRANCHES}
+    result["branches"][other]["logs"] = results[other]["logs"]
+    result["diverged_at_cycle"] = diverged_at_cycle
+    result["model_calls"] = model_calls
+    result["shared_model_calls"] = shared_calls
+    return result
+
+def _iter_one_cycle(cycle_log, timings, current_code, code_to_spec_prompt_template, spec_to_code_prompt_template, test_def_dir, is_strict, sandbox, validation_cache, suite_report=False):
+    """
+    Runs one code -> spec -> code cycle as a sub-generator of iter_cycle(),
+    filling in cycle_log and the wall time (seconds) of each stage in timings.
+    Returns False if a model call failed, True otherwise (whether or not the
+    generated code passed validation).
+    """
+    # Step 1: Code to Spec
+    prompt = code_to_spec_prompt_template.format(source_code=current_code)
+    start = time.monotonic()
+    raw_spec = yield prompt
+    timings["step1_api_call"] = time.monotonic() - start
+    
+    if raw_spec is None or isinstance(raw_spec, CallFailure):
+        cycle_log["step1_status"] = f"FAIL: {raw_spec.reason}" if raw_spec is not None else "FAIL: API call failed"
+        return False
+    
+    start = time.monotonic()
+    generated_spec = clean_generated_code(raw_spec, strict_mode=is_strict)
+    timings["step1_clean"] = time.monotonic() - start
+    cycle_log["step1_raw_spec"] = raw_spec
+    cycle_log["step1_generated_spec"] = generated_spec
+    if getattr(raw_spec, 'stats', None):
+        cycle_log["step1_stats"] = raw_spec.stats
+    
+    # Temporarily bypassing the strict spec-to-spec check to evaluate code generation.
+    # The check is too brittle and fails on minor semantic differences.
+    # if re.sub(r'\s+', ' ', generated_spec).strip() != re.sub(r'\s+', ' ', ground_truth_spec).strip():
+    #     cycle_log["step1_status"] = f"FAIL: Generated spec did not match ground truth."
+    #     return True
+    cycle_log["step1_status"] = "SUCCESS"
+
+    # Step 2: Spec to Code
+    prompt = spec_to_code_prompt_template.format(specification=generated_spec)
+    start = time.monotonic()
+    generated_code_raw = yield prompt
+    timings["step2_api_call"] = time.monotonic() - start
+
+    if generated_code_raw is None or isinstance(generated_code_raw, CallFailure):
+        cycle_log["step2_status"] = f"FAIL: {generated_code_raw.reason}" if generated_code_raw is not None else "FAIL: API call failed"
+        return False
+        
+    start = time.monotonic()
+    generated_code = clean_generated_code(generated_code_raw, strict_mode=is_strict)
+    timings["step2_clean"] = time.monotonic() - start
+    cycle_log["step2_generated_code_raw"] = generated_code_raw
+    cycle_log["step2_generated_code_clean"] = generated_code
+    if getattr(generated_code_raw, 'stats', None):
+        cycle_log["step2_stats"] = generated_code_raw.stats
+
+    start = time.monotonic()
+    output, error, test_results = validate_code_with_results(generated_code, test_def_dir, sandbox=sandbox, cache=validation_cache,
+                                                             suite_report=suite_report)
+    timings["step2_validate"] = time.monotonic() - start
+    if test_results is not None:
+        cycle_log["step2_test_results"] = test_results
+    
+    # The test runner script should print "SUCCESS" on stdout for a pass.
+    if error or not (output and "SUCCESS" in output):
+        cycle_log["step2_status"] = f"FAIL: Code validation failed. Error: {error}, Output: {output}"
+        return True
+    cycle_log["step2_status"] = "SUCCESS"
+    return True
+
+def drive_cycle(steps, generate):
+    """Drives an iter_cycle() generator with a synchronous generate(prompt) callable."""
+    try:
+        prompt = next(steps)
+        while True:
+            prompt = steps.send(generate(prompt))
+    except StopIteration as stop:
+        return stop.value
+
+def first_prompt(test_case, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir, lang, mode):
+    """Returns the first (cycle-1 code-to-spec) prompt of a trial, or None if its files cannot be loaded."""
+    steps = iter_cycle(1, test_case, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir, lang, mode)
+    try:
+        return next(steps)
+    except StopIteration:
+        return None
+    finally:
+        steps.close()
+
+def with_prefetched(generate, prefetched):
+    """
+    Wraps a generate(prompt) callable so that responses already obtained for
+    some prompts (e.g. a batched first step) are used once before the model
+    is called.
+    """
+    def prefetched_generate(prompt):
+        response = prefetched.pop(prompt, None)
+        if isinstance(response, str):
+            stats = dict(getattr(response, 'stats', None) or {}, batched=True)
+            return ModelResponse(response, stats)
+        # Not prefetched, or the prefetch failed: call the model now.
+        return generate(prompt)
+    return prefetched_generate
+
+def _in_call_slot(generate, call_slot):
+    """Wraps a generate(prompt) callable so that every model call holds call_slot()."""
+    def slotted_generate(prompt):
+        with call_slot():
+            return generate(prompt)
+    return slotted_generate
+
+def run_cycle(max_cycles, api_url, model, test_case, spec_lang, prompt_style, output_dir, base_prompt_dir, base_test_def_dir, lang, mode, stream=False, sandbox=None, validation_cache=None, response_cache=None, offline=False, checkpoints=None, options=None, keep_alive=None, prefetched=None, endpoints=None, chat=False, run=None, call_slot=None, suite_report=False):
+    """
+    Runs the semantic round-trip cycle test.
+    With a response_cache (response_cache.ResponseCache), model responses are
+    recorded into the cache under the run index `run`; with offline=True they
+    are served from it instead, the model is never called and a cache miss
+    fails the step.
+    options (temperature, seed, num_predict, num_ctx) and keep_alive are sent
+    with every request; the options are recorded in the result.
+    prefetched maps prompts to responses that were already generated.
+    With endpoints (distributed.EndpointPool), every model call goes to the
+    best healthy endpoint of the pool instead of api_url.
+    With chat=True every call goes to /api/chat with the prompt template's
+    fixed preamble as system message, so the server can reuse its evaluation;
+    the prompt-eval tokens saved are recorded in the result's "prompt_cache".
+    call_slot() returns a context manager held around every model call
+    (run_sweep.py uses it to enforce its concurrency limits).
+    suite_report is passed on to iter_cycle().
+    """
+    steps = iter_cycle(max_cycles, test_case, spec_lang, prompt_style, base_prompt_dir, base_test_def_dir, lang, mode, sandbox=sandbox, validation_cache=validation_cache, checkpoints=checkpoints, suite_report=suite_report)
+    if endpoints is not None:
+        generate = lambda prompt: endpoints.generate(model, prompt, stream=stream, strict_mode=(mode == 'strict'), options=options, keep_alive=keep_alive, chat=chat)
+    elif stream:
+        is_strict = (mode == 'strict')
+        generate = lambda prompt: call_ollama_api_stream(api_url, model, prompt, strict_mode=is_strict, options=options, keep_alive=keep_alive, chat=chat)
+    else:
+        generate = lambda prompt: call_ollama_api(api_url, model, prompt, options=options, keep_alive=keep_alive, chat=chat)
+    if call_slot is not None:
+        generate = _in_call_slot(generate, call_slot)
+    if response_cache is not None:
+        stream_cutoff = ('strict' if mode == 'strict' else 'forgiving') if stream else None
+        cache_options = response_cache.key_options(options, run=run, chat=chat, stream_cutoff=stream_cutoff)
+        generate = response_cache.wrap(generate, model, options=cache_options, offline=offline)
+    if prefetched:
+        generate = with_prefetched(generate, prefetched)
+    result = drive_cycle(steps, generate)
+    if options:
+        result["generation_options"] = options
+    if chat:
+        result["prompt_cache"] = prompt_cache_summary(result)
+    return result
+
+def save_result(result, output_dir):
+    """
+    Writes a trial result to <output_dir>/result.json and returns the file path.
+    Scalar fields such as status and cycles_completed are written before the
+    cycle logs so that analysis can read them without decoding the logs.
+
+    The file is written to a temporary name, flushed to disk and renamed into
+    place, so a crash never leaves a truncated result.json behind.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    result_file_path = os.path.join(output_dir, "result.json")
+    ordered = {k: v for k, v in result.items() if not isinstance(v, (list, dict))}
+    ordered.update((k, v) for k, v in result.items() if isinstance(v, (list, dict)))
+    tmp_path = result_file_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(ordered, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, result_file_path)
+    return result_file_path
+
 def main():
     parser = argparse.ArgumentParser(description="Run a semantic round-trip code conversion test.")
     parser.add_argument("--model", required=True, help="Name of the Ollama model to test.")
@@ -234,11 +800,25 @@ def main():
     parser.add_argument("--prompt-style", required=True, help="Prompt style (e.g., zeroshot, fewshot).")
     parser.add_argument("--lang", default='en', help="Language of the prompt to use (e.g., en, ja). Defaults to 'en'.")
     parser.add_argument("--output-dir", required=True, dest="output_dir", help="Directory to save the results.")
-    parser.add_argument("--api-url", required=True, dest="api_url", help="URL of the Ollama API endpoint.")
+    parser.add_argument("--api-url", default=None, dest="api_url", help="URL of the Ollama API endpoint (required unless --offline).")
     parser.add_argument("--max-cycles", type=int, default=10, help="Maximum number of cycles to run.")
-    parser.add_argument("--mode", default='forgiving', choices=['strict', 'forgiving'], help="Evaluation mode: 'strict' or 'forgiving'.")
+    parser.add_argument("--mode", default='forgiving', choices=['strict', 'forgiving', 'composite'], help="Evaluation mode: 'strict', 'forgiving' or 'composite' (both on the same responses; strict result if it succeeds, else forgiving).")
+    add_generation_arguments(parser)
+    parser.add_argument("--stream", action='store_true', help="Stream the response and stop generation once a usable code block has closed.")
+    add_chat_argument(parser)
+    add_suite_report_argument(parser)
+    parser.add_argument("--trace", default=None, help="Append per-cycle stage latencies and token counts to this file.")
+    parser.add_argument("--trace-format", default='jsonl', choices=['jsonl', 'openmetrics'], help="Trace format (see cycle_metrics.py).")
+    parser.add_argument("--validation-cache", default=None, help="Path of a SQLite file caching validation results across runs.")
+    parser.add_argument("--response-cache", default=None, help="Path of a SQLite file recording model responses keyed by (model, prompt, options, run).")
+    parser.add_argument("--offline", action='store_true', help="Serve model responses only from --response-cache; never call the API.")
+    parser.add_argument("--run", type=int, default=None, help="Run index of this trial in the --response-cache key (default: N if --output-dir ends in _runN).")
     
     args = parser.parse_args()
+    if args.offline and not args.response_cache:
+        parser.error("--offline requires --response-cache.")
+    if not args.api_url and not args.offline:
+        parser.error("--api-url is required unless --offline is set.")
 
     script_dir = os.path.dirname(os.path.realpath(__file__))
     base_dir = os.path.abspath(os.path.join(script_dir, '..'))
@@ -246,6 +826,19 @@ def main():
     base_test_def_dir = os.path.join(base_dir, '01_TestDefinitions')
     
     os.makedirs(args.output_dir, exist_ok=True)
+
+    validation_cache = None
+    if args.validation_cache:
+        from validation_cache import ValidationCache
+        validation_cache = ValidationCache(args.validation_cache)
+
+    response_cache = None
+    if args.response_cache:
+        from response_cache import ResponseCache
+        response_cache = ResponseCache(args.response_cache)
+        if args.run is None:
+            run_match = re.search(r'_run(\d+)$', os.path.basename(os.path.normpath(args.output_dir)))
+            args.run = int(run_match.group(1)) if run_match else None
     
     result = run_cycle(
         args.max_cycles,
@@ -258,15 +851,42 @@ def main():
         base_prompt_dir,
         base_test_def_dir,
         args.lang,
-        args.mode
+        args.mode,
+        stream=args.stream,
+        validation_cache=validation_cache,
+        response_cache=response_cache,
+        offline=args.offline,
+        options=generation_options(args),
+        keep_alive=args.keep_alive,
+        chat=args.chat,
+        run=args.run,
+        suite_report=args.suite_report
     )
 
-    result_file_path = os.path.join(args.output_dir, "result.json")
-    with open(result_file_path, 'w') as f:
-        json.dump(result, f, indent=4)
+    result_file_path = save_result(result, args.output_dir)
+
+    if args.trace:
+        from cycle_metrics import open_trace_writer
+        trace_writer = open_trace_writer(args.trace, args.trace_format)
+        trial = {'model': args.model, 'test_case': args.test_name, 'lang': args.lang,
+                 'spec_lang': args.spec_lang, 'prompt_style': args.prompt_style}
+        trace_writer.write_trial(trial, result)
+        trace_writer.close()
 
     print(f"Test finished. Status: {result['status']}. Cycles completed: {result['cycles_completed']}.")
     print(f"Full results saved to {result_file_path}")
+    if "prompt_cache" in result:
+        print(f"Prompt eval: {result['prompt_cache']['prompt_eval_tokens']} tokens evaluated, "
+              f"~{result['prompt_cache']['prompt_eval_tokens_saved']} saved by the chat prefix cache.")
+    if validation_cache is not None:
+        print(validation_cache.summary())
+        validation_cache.close()
+    if response_cache is not None:
+        print(response_cache.summary())
+        response_cache.close()
 
 if __name__ == "__main__":
-    main()
+    # Run the importable module, so that CallFailure/ModelResponse are the same classes
+    # as those seen by the modules that import it (e.g. response_cache.py).
+    import run_cycle_test_syntactic
+    run_cycle_test_syntactic.main()
@@ -3,7 +3,7 @@
 # Configuration
 MODEL_NAME="llama3:8b"
 OLLAMA_SERVER_IP="192.168.3.213"
-OLLAMA_API_URL="http://${OLLAMA_SERVER_IP}:11434"
+OLLAMA_API_URL="${OLLAMA_API_URL:-http://${OLLAMA_SERVER_IP}:11434}"
 NUM_RUNS=30
 SPEC_LANG="pseudocode"
 PROMPT_STYLE="hyper_guided"
@@ -0,0 +1,736 @@
+# run_sweep.py
+#
+# Runs a whole experiment matrix (models x test cases x lang x spec_lang x
+# prompt_style x runs) concurrently instead of one `run_cycle_test_syntactic.py`
+# process at a time. Concurrency is bounded both for the whole sweep and for
+# each individual model, so a single Ollama server can serve several trials in
+# parallel without being flooded by one model.
+#
+# Results are written in the same layout as the bash runners:
+#   <results_dir>/<model>_<lang>_<spec>_<style>_<case>_runN/result.json
+# so `05_Reports/analyze_with_ci.py` keeps working unchanged.
+#
+# The state of every planned trial is kept in <results_dir>/work_queue.sqlite
+# (see work_queue.py): after a crash, rerun the same command with the same
+# --results-dir and --resume to skip finished trials and retry interrupted ones.
+#
+# Example:
+#   python3 03_Scripts/run_sweep.py --api-url "$OLLAMA_API_URL" --mode forgiving \
+#       --models gemma3:4b falcon3:3b --test-cases fizzbuzz --num-runs 30 \
+#       --max-workers 8 --per-model-limit 2
+#
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+from run_cycle_test_syntactic import (
+    run_cycle, save_result, first_prompt, call_ollama_api, call_ollama_api_stream,
+    add_generation_arguments, add_chat_argument, add_suite_report_argument, generation_options
+)
+from work_queue import WorkQueue, QUEUE_FILE_NAME
+from prompt_registry import get_registry
+
+def build_trial_matrix(models, test_cases, langs, spec_langs, prompt_styles, num_runs):
+    """Expands the experiment dimensions into a flat list of trial dicts."""
+    trials = []
+    for model in models:
+        for test_case in test_cases:
+            for lang in langs:
+                for spec_lang in spec_langs:
+                    for prompt_style in prompt_styles:
+                        for run in range(1, num_runs + 1):
+                            trials.append({
+                                'model': model,
+                                'test_case': test_case,
+                                'lang': lang,
+                                'spec_lang': spec_lang,
+                                'prompt_style': prompt_style,
+                                'run': run,
+                            })
+    return trials
+
+def trial_dir_name(trial):
+    """Returns the per-trial directory name used by the bash runners."""
+    model_name = trial['model'].replace(':', '-')
+    return f"{model_name}_{trial['lang']}_{trial['spec_lang']}_{trial['prompt_style']}_{trial['test_case']}_run{trial['run']}"
+
+TRIAL_DIR_PATTERN = re.compile(
+    r'^(?P<model>.+?)_(?P<lang>en|ja)_(?P<spec_lang>[a-z_]+?)_(?P<prompt_style>[a-z]+shot|hyper_guided)'
+    r'_(?P<test_case>[a-z_]+)_run(?P<run>\d+)$'
+)
+
+def parse_trial_dir_name(dir_name):
+    """
+    Inverse of trial_dir_name(). Returns a trial dict or None. The model name
+    keeps the '-' that replaced ':' when the directory was created.
+    """
+    match = TRIAL_DIR_PATTERN.match(dir_name)
+    if not match:
+        return None
+    trial = match.groupdict()
+    trial['run'] = int(trial['run'])
+    return trial
+
+def parse_batch_dir_name(batch_dir_name):
+    """
+    Returns (test_type, n_runs) for a 04_RawData batch directory name, or
+    (None, None). The one parser of batch names: parse_batch_mode(), the
+    results store and 05_Reports/analyze_with_ci.py all go through it.
+    """
+    parts = batch_dir_name.split('_')
+    # e.g. adaptive_composite_n30_process_user_list_20260101_100830, sweep_forgiving_n30_20260105_101500
+    if batch_dir_name.startswith(("adaptive_", "sweep_")):
+        if len(parts) >= 3:
+            return parts[1], parts[2][1:]
+    # e.g. run_fizzbuzz_forgiving_20251231_104355 (all with N=30)
+    elif batch_dir_name.startswith("run_fizzbuzz"):
+        if "forgiving" in batch_dir_name:
+            return "forgiving", "30"
+        if "strict" in batch_dir_name:
+            return "strict", "30"
+    # e.g. run_high_rep_strict_n3_20260103_145801
+    elif batch_dir_name.startswith("run_high_rep_"):
+        if len(parts) >= 5:
+            return parts[3], parts[4][1:]
+    # e.g. llm_test_llama3-8b_20260101_231634, no strict/forgiving distinction
+    elif batch_dir_name.startswith("llm_test_"):
+        return "standard", "30"
+    # e.g. forgiving_n_30_20251229_183244
+    elif "_n_" in batch_dir_name:
+        if len(parts) >= 3:
+            return parts[0], parts[2]
+    return None, None
+
+def parse_batch_mode(batch_dir_name):
+    """Returns the evaluation mode encoded in a 04_RawData batch directory name, or None."""
+    test_type, _ = parse_batch_dir_name(batch_dir_name)
+    if test_type == 'standard':
+        return 'forgiving' # run_llama3_8b_tests.sh used the default mode
+    return test_type
+
+def parse_model_limits(items):
+    """Parses MODEL=N overrides (e.g. 'llama3:8b=1') into a dict."""
+    limits = {}
+    for item in items or []:
+        model, sep, value = item.rpartition('=')
+        if not sep or not model:
+            raise ValueError(f"Invalid model limit '{item}', expected MODEL=N")
+        limits[model] = int(value)
+    return limits
+
+class SweepScheduler:
+    """
+    Dispatches trials onto a thread pool while respecting a global concurrency
+    limit and a per-model concurrency limit. Trials of a model that is already
+    at its limit stay queued (in their original order) until a slot frees up.
+    """
+
+    def __init__(self, api_url, results_dir, base_prompt_dir, base_test_def_dir,
+                 mode='forgiving', max_cycles=10, max_workers=4, per_model_limit=1,
+                 model_limits=None, stream=False, sandbox=None, validation_cache=None, results_store=None,
+                 checkpoint_tree=None, options=None, keep_alive=None, batch_first_step=False,
+                 model_affinity=None, trace_writer=None, work_queue=None, endpoints=None, chat=False,
+                 suite_report=False):
+        self.api_url = api_url
+        self.results_dir = results_dir
+        self.base_prompt_dir = base_prompt_dir
+        self.base_test_def_dir = base_test_def_dir
+        self.mode = mode
+        self.max_cycles = max_cycles
+        self.max_workers = max_workers
+        self.per_model_limit = per_model_limit
+        self.model_limits = model_limits or {}
+        self.stream = stream
+        self.sandbox = sandbox
+        self.validation_cache = validation_cache
+        self.results_store = results_store
+        self.checkpoint_tree = checkpoint_tree
+        self.options = options
+        self.keep_alive = keep_alive
+        self.batch_first_step = batch_first_step
+        self.model_affinity = model_affinity
+        self.trace_writer = trace_writer
+        self.work_queue = work_queue
+        self.endpoints = endpoints
+        self.chat = chat
+        self.suite_report = suite_report
+        self.num_runs = None
+        self._cell_trials = {}
+        self._first_step_batches = {}
+        self._batch_lock = threading.Lock()
+        self._model_call_slots = {}
+        self._global_call_slots = threading.BoundedSemaphore(max_workers)
+
+    def model_limit(self, model):
+        return max(1, self.model_limits.get(model, self.per_model_limit))
+
+    @contextmanager
+    def call_slot(self, model):
+        """
+        Held for the duration of every model call. A trial makes one call at a
+        time, so this only limits the extra calls of a batched first step to the
+        same per-model and global limits as the trials.
+        """
+        with self._batch_lock:
+            slots = self._model_call_slots.get(model)
+            if slots is None:
+                slots = self._model_call_slots[model] = threading.BoundedSemaphore(self.model_limit(model))
+        with slots, self._global_call_slots:
+            yield
+
+    def trial_options(self, trial):
+        """
+        Generation options of one trial. A base seed S is turned into S + run - 1
+        so runs stay independent but each one is reproducible from its result.
+        """
+        if not self.options:
+            return None
+        options = dict(self.options)
+        if 'seed' in options:
+            options['seed'] += trial['run'] - 1
+        return options
+
+    def _generate(self, trial, prompt, mode):
+        with self.call_slot(trial['model']):
+            return self._generate_unlimited(trial, prompt, mode)
+
+    def _generate_unlimited(self, trial, prompt, mode):
+        options = self.trial_options(trial)
+        if self.endpoints is not None:
+            return self.endpoints.generate(trial['model'], prompt, stream=self.stream, strict_mode=(mode == 'strict'),
+                                           options=options, keep_alive=self.keep_alive, chat=self.chat)
+        if self.stream:
+            return call_ollama_api_stream(self.api_url, trial['model'], prompt, strict_mode=(mode == 'strict'),
+                                          options=options, keep_alive=self.keep_alive, chat=self.chat)
+        return call_ollama_api(self.api_url, trial['model'], prompt, options=options, keep_alive=self.keep_alive,
+                               chat=self.chat)
+
+    def _first_step_batch(self, trial, mode):
+        """
+        Returns {first_prompt: response} for a trial. The first trial of a cell
+        to get here sends the identical first-step prompts of all the cell's runs
+        at once (each with its own seed) so the server can batch them, as many at
+        a time as the model's concurrency limit allows; the other runs pick up
+        their response when they start.
+        """
+        cell = tuple(trial[key] for key in ('model', 'test_case', 'lang', 'spec_lang', 'prompt_style'))
+        with self._batch_lock:
+            batch = self._first_step_batches.get((cell, mode))
+            owner = batch is None
+            if owner:
+                batch = self._first_step_batches[(cell, mode)] = Future()
+        if owner:
+            try:
+                prompt = first_prompt(trial['test_case'], trial['spec_lang'], trial['prompt_style'],
+                                      self.base_prompt_dir, self.base_test_def_dir, trial['lang'], mode)
+                cell_trials = self._cell_trials.get(cell, [trial])
+                responses = {}
+                if prompt is not None:
+                    batch_size = min(len(cell_trials), self.model_limit(trial['model']), self.max_workers)
+                    with ThreadPoolExecutor(max_workers=batch_size) as executor:
+                        futures = {t['run']: executor.submit(self._generate, t, prompt, mode) for t in cell_trials}
+                    responses = {run: future.result() for run, future in futures.items()}
+                batch.set_result((prompt, responses))
+            except Exception as e:
+                batch.set_exception(e)
+        prompt, responses = batch.result()
+        with self._batch_lock:
+            response = responses.pop(trial['run'], None)
+        return {prompt: response} if prompt is not None and response is not None else None
+
+    def _run_cycle(self, trial, output_dir, mode, prefetched=None):
+        options = self.trial_options(trial)
+        checkpoints = None
+        if self.checkpoint_tree is not None:
+            # --share-prefixes requires temperature 0, where decoding is greedy and the per-run seed has
+            # no effect, so runs share cycles regardless of their seeds.
+            shared_options = {name: value for name, value in options.items() if name != 'seed'} if options else None
+            checkpoints = self.checkpoint_tree.scope(trial['model'], mode, trial['test_case'], trial['lang'],
+                                                     trial['spec_lang'], trial['prompt_style'], options=shared_options)
+        return run_cycle(
+            self.max_cycles,
+            self.api_url,
+            trial['model'],
+            trial['test_case'],
+            trial['spec_lang'],
+            trial['prompt_style'],
+            output_dir,
+            self.base_prompt_dir,
+            self.base_test_def_dir,
+            trial['lang'],
+            mode,
+            stream=self.stream,
+            sandbox=self.sandbox,
+            validation_cache=self.validation_cache,
+            checkpoints=checkpoints,
+            options=options,
+            keep_alive=self.keep_alive,
+            prefetched=prefetched,
+            endpoints=self.endpoints,
+            chat=self.chat,
+            call_slot=lambda: self.call_slot(trial['model']),
+            suite_report=self.suite_report
+        )
+
+    def record(self, trial, result):
+        """Appends a finished trial to the trace and the results store, if configured."""
+        if self.trace_writer is not None:
+            self.trace_writer.write_trial(trial, result)
+        if self.results_store is None:
+            return
+        batch = os.path.basename(os.path.normpath(self.results_dir))
+        source = os.path.join(batch, trial_dir_name(trial), 'result.json')
+        test_type, n_runs = parse_batch_dir_name(batch)
+        if test_type is None:
+            # Custom --results-dir name: fall back to the sweep's own settings.
+            test_type, n_runs = self.mode, self.num_runs
+        # Store the model as it appears in directory names, matching imported trials.
+        stored_trial = dict(trial, model=trial['model'].replace(':', '-'))
+        self.results_store.append_trial(stored_trial, result, batch=batch, source=source, mode=self.mode,
+                                        test_type=test_type, n_runs=n_runs)
+
+    def run_trial(self, trial):
+        """Runs a single trial and writes its result.json. Returns (trial, result)."""
+        if self.work_queue is None:
+            return self._run_trial(trial)
+        self.work_queue.plan([trial])
+        self.work_queue.mark_running(trial)
+        try:
+            trial, result = self._run_trial(trial)
+        except Exception as e:
+            self.work_queue.mark_failed(trial, e)
+            raise
+        self.work_queue.mark_done(trial, result['status'])
+        return trial, result
+
+    def _run_trial(self, trial):
+        output_dir = os.path.join(self.results_dir, trial_dir_name(trial))
+        os.makedirs(output_dir, exist_ok=True)
+
+        prefetched = self._first_step_batch(trial, self.mode) if self.batch_first_step else None
+        # Composite mode evaluates strict and forgiving cleaning in one pass over the same responses.
+        result = self._run_cycle(trial, output_dir, self.mode, prefetched=prefetched)
+
+        save_result(result, output_dir)
+        self.record(trial, result)
+        return trial, result
+
+    def run(self, trials):
+        """Runs all trials and returns a list of (trial, result) in completion order."""
+        if self.num_runs is None:
+            self.num_runs = max((trial['run'] for trial in trials), default=None)
+        self._cell_trials = {}
+        for trial in trials:
+            cell = tuple(trial[key] for key in ('model', 'test_case', 'lang', 'spec_lang', 'prompt_style'))
+            self._cell_trials.setdefault(cell, []).append(trial)
+        if self.model_affinity is not None:
+            self.model_affinity.extend(trials)
+            return self._dispatch(self.model_affinity.next_trial, on_result=self.model_affinity.record,
+                                  total=len(trials))
+
+        pending = list(trials)
+
+        def next_trial(has_capacity):
+            # The first queued trial of a model that has capacity; the rest keep their order.
+            for index, trial in enumerate(pending):
+                if has_capacity(trial['model']):
+                    return pending.pop(index)
+            return None
+
+        return self._dispatch(next_trial, total=len(trials))
+
+    def run_adaptive(self, allocator, retry=()):
+        """
+        Runs trials handed out by an AdaptiveAllocator until every cell is
+        settled or the budget is spent. Trials in `retry` (interrupted trials of
+        a resumed sweep, already restored into the allocator) run first.
+        Returns (trial, result) pairs.
+        """
+        self.num_runs = allocator.max_runs
+        retry = list(retry)
+
+        def next_trial(has_capacity):
+            for index, trial in enumerate(retry):
+                if has_capacity(trial['model']):
+                    return retry.pop(index)
+            return allocator.next_trial(has_capacity)
+
+        def on_result(trial, result):
+            if result is not None:
+                allocator.record(trial, "SUCCESS" in result['status'])
+
+        return self._dispatch(next_trial, on_result=on_result, total=allocator.budget)
+
+    def run_worker(self, worker_id, lease=120.0, poll_interval=5.0):
+        """
+        Runs trials claimed from the shared work queue of a distributed sweep
+        (see distributed.py) until no trial is pending or running anywhere.
+        The leases of running trials are renewed in the background, so the
+        coordinator only requeues trials of workers that died.
+        Returns the (trial, result) pairs this worker completed.
+        """
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(lease / 3):
+                self.work_queue.renew_leases(worker_id, lease)
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        completed = []
+        try:
+            while True:
+                total = sum(self.work_queue.counts().values())
+                completed += self._dispatch(lambda has_capacity: self.work_queue.claim(worker_id, lease, has_capacity),
+                                            total=total)
+                counts = self.work_queue.counts()
+                if not counts.get('pending') and not counts.get('running'):
+                    break
+                # Other workers still hold trials; pick them up if their leases expire.
+                time.sleep(poll_interval)
+        finally:
+            stop.set()
+        return completed
+
+    def _dispatch(self, next_trial, on_result=None, total=None):
+        """
+        Core dispatch loop. next_trial(has_capacity) returns the next trial to
+        start for a model with a free slot, or None; on_result(trial, result)
+        is called as trials finish.
+        """
+        running = {}
+        active_per_model = {}
+        completed = []
+
+        def has_capacity(model):
+            return active_per_model.get(model, 0) < self.model_limit(model)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # Fill free slots with the next trial of a model that has capacity.
+                while len(running) < self.max_workers:
+                    trial = next_trial(has_capacity)
+                    if trial is None:
+                        break
+                    model = trial['model']
+                    active_per_model[model] = active_per_model.get(model, 0) + 1
+                    running[executor.submit(self.run_trial, trial)] = trial
+
+                if not running:
+                    break
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial = running.pop(future)
+                    active_per_model[trial['model']] -= 1
+                    try:
+                        _, result = future.result()
+                    except Exception as e:
+                        print(f"Error: Trial {trial_dir_name(trial)} raised an exception: {e}")
+                        if on_result is not None:
+                            on_result(trial, None)
+                        continue
+                    completed.append((trial, result))
+                    if on_result is not None:
+                        on_result(trial, result)
+                    print(f"[{len(completed)}/{total}] {trial_dir_name(trial)}: "
+                          f"{result['status']} (cycles completed: {result['cycles_completed']})")
+
+        return completed
+
+    async def _run_trial_async(self, client, trial):
+        if self.work_queue is None:
+            return await self._run_trial_async_unqueued(client, trial)
+        await asyncio.to_thread(self.work_queue.plan, [trial])
+        await asyncio.to_thread(self.work_queue.mark_running, trial)
+        try:
+            result = await self._run_trial_async_unqueued(client, trial)
+        except Exception as e:
+            await asyncio.to_thread(self.work_queue.mark_failed, trial, e)
+            raise
+        await asyncio.to_thread(self.work_queue.mark_done, trial, result['status'])
+        return result
+
+    async def _run_trial_async_unqueued(self, client, trial):
+        from ollama_client import run_cycle_async
+
+        output_dir = os.path.join(self.results_dir, trial_dir_name(trial))
+
+        result = await run_cycle_async(
+            client, self.max_cycles, trial['model'], trial['test_case'], trial['spec_lang'],
+            trial['prompt_style'], self.base_prompt_dir, self.base_test_def_dir, trial['lang'], self.mode,
+            stream=self.stream, sandbox=self.sandbox, validation_cache=self.validation_cache,
+            options=self.trial_options(trial), keep_alive=self.keep_alive, suite_report=self.suite_report
+        )
+
+        await asyncio.to_thread(save_result, result, output_dir)
+        await asyncio.to_thread(self.record, trial, result)
+        return result
+
+    async def run_async(self, trials, connections_per_host=4):
+        """
+        Same as run(), but every trial is a coroutine on one event loop sharing a
+        single pooled AsyncOllamaClient, so waiting on the model costs no thread.
+        """
+        from ollama_client import AsyncOllamaClient
+
+        if self.num_runs is None:
+            self.num_runs = max((trial['run'] for trial in trials), default=None)
+        global_slots = asyncio.Semaphore(self.max_workers)
+        model_slots = {}
+        completed = []
+        total = len(trials)
+
+        async def guarded(trial):
+            model = trial['model']
+            if model not in model_slots:
+                model_slots[model] = asyncio.Semaphore(self.model_limit(model))
+            async with model_slots[model], global_slots:
+                try:
+                    result = await self._run_trial_async(client, trial)
+                except Exception as e:
+                    print(f"Error: Trial {trial_dir_name(trial)} raised an exception: {e}")
+                    return
+            completed.append((trial, result))
+            print(f"[{len(completed)}/{total}] {trial_dir_name(trial)}: "
+                  f"{result['status']} (cycles completed: {result['cycles_completed']})")
+
+        async with AsyncOllamaClient(self.api_url, limit=self.max_workers,
+                                     limit_per_host=connections_per_host, chat=self.chat) as client:
+            await asyncio.gather(*(guarded(trial) for trial in trials))
+
+        return completed
+
+def add_matrix_arguments(parser):
+    """Adds the experiment matrix options (--models ... --mode) shared by run_sweep.py and distributed.py."""
+    parser.add_argument("--models", nargs='+', required=True, help="Ollama models to test.")
+    parser.add_argument("--test-cases", nargs='+', default=['process_user_list'], help="Test cases to run.")
+    parser.add_argument("--langs", nargs='+', default=['en'], help="Prompt languages (e.g., en ja).")
+    parser.add_argument("--spec-langs", nargs='+', default=['pseudocode'], help="Specification languages.")
+    parser.add_argument("--prompt-styles", nargs='+', default=['hyper_guided'], help="Prompt styles.")
+    parser.add_argument("--num-runs", type=int, default=30, help="Number of runs per combination.")
+    parser.add_argument("--max-cycles", type=int, default=10, help="Maximum number of cycles per trial.")
+    parser.add_argument("--mode", default='forgiving', choices=['strict', 'forgiving', 'composite'], help="Evaluation mode; 'composite' evaluates strict and forgiving cleaning on the same responses.")
+
+def default_results_dir(base_dir, mode, num_runs):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(base_dir, '04_RawData', f"sweep_{mode}_n{num_runs}_{timestamp}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a full semantic round-trip experiment matrix concurrently.")
+    add_matrix_arguments(parser)
+    parser.add_argument("--api-url", default=os.environ.get('OLLAMA_API_URL'), dest="api_url", help="URL of the Ollama API endpoint (defaults to $OLLAMA_API_URL).")
+    parser.add_argument("--max-workers", type=int, default=4, help="Maximum number of trials running at once across the sweep.")
+    parser.add_argument("--per-model-limit", type=int, default=1, help="Maximum number of concurrent trials per model.")
+    parser.add_argument("--model-limit", action='append', default=[], metavar="MODEL=N", help="Per-model concurrency override; may be repeated.")
+    add_generation_arguments(parser)
+    add_chat_argument(parser)
+    add_suite_report_argument(parser)
+    parser.add_argument("--batch-first-step", action='store_true', help="Send the identical first-step prompts of all runs of a combination together (each with its own seed) so the server can batch them.")
+    parser.add_argument("--stream", action='store_true', help="Stream responses and stop generation once a usable code block has closed.")
+    parser.add_argument("--async-client", action='store_true', help="Run trials as coroutines sharing one pooled async HTTP client (requires aiohttp).")
+    parser.add_argument("--connections-per-host", type=int, default=4, help="Keep-alive connection limit per Ollama host for --async-client.")
+    parser.add_argument("--sandbox-workers", type=int, default=0, help="Validate code in a pool of N pre-warmed sandbox workers instead of one python3 process per validation (0 = disabled).")
+    parser.add_argument("--sandbox-max-tasks", type=int, default=200, help="Recycle each sandbox worker after this many validations.")
+    parser.add_argument("--validation-cache", default=None, help="Path of a SQLite file caching validation results across runs and sweeps.")
+    parser.add_argument("--results-store", default=None, help="Also append every finished trial to this SQLite results store.")
+    parser.add_argument("--model-affinity", action='store_true', help="Group trials by model and prefer models that are already loaded (via /api/ps) to minimize model swaps.")
+    parser.add_argument("--server-memory-gb", type=float, default=None, help="With --model-affinity, memory available for loaded models; without it only one model is used at a time.")
+    parser.add_argument("--share-prefixes", action='store_true', help="Compute cycles reached from identical code once and share them across runs. Requires --temperature 0: with sampling, runs are independent samples and must not share.")
+    parser.add_argument("--adaptive", action='store_true', help="Allocate runs sequentially: stop a cell once its 95%% Wilson CI is narrow enough or clearly separated from --reference-rate, and give the freed runs to uncertain cells.")
+    parser.add_argument("--min-runs", type=int, default=5, help="With --adaptive, runs per cell before it may be stopped.")
+    parser.add_argument("--max-runs-per-cell", type=int, default=None, help="With --adaptive, cap on the runs of one cell (defaults to 2 x --num-runs).")
+    parser.add_argument("--target-ci-width", type=float, default=0.3, help="With --adaptive, stop a cell once its Wilson CI is at most this wide (as a proportion).")
+    parser.add_argument("--reference-rate", type=float, default=None, help="With --adaptive, also stop a cell once its CI lies entirely above or below this success rate.")
+    parser.add_argument("--trial-budget", type=int, default=None, help="With --adaptive, total number of trials (defaults to the fixed design's cells x --num-runs).")
+    parser.add_argument("--trace", default=None, help="Write per-cycle stage latencies and token counts to this file.")
+    parser.add_argument("--trace-format", default='jsonl', choices=['jsonl', 'openmetrics'], help="Trace format: one JSON line per cycle, or OpenMetrics/Prometheus text aggregated per model.")
+    parser.add_argument("--results-dir", default=None, help="Output directory (defaults to 04_RawData/sweep_<mode>_n<runs>_<timestamp>).")
+    parser.add_argument("--resume", action='store_true', help="Resume the interrupted sweep in --results-dir: skip finished trials and retry interrupted or failed ones.")
+
+    args = parser.parse_args()
+
+    if not args.api_url:
+        parser.error("--api-url is required when OLLAMA_API_URL is not set.")
+    if args.adaptive and args.async_client:
+        parser.error("--adaptive is not supported with --async-client.")
+    if args.batch_first_step and (args.adaptive or args.async_client):
+        parser.error("--batch-first-step is not supported with --adaptive or --async-client.")
+    if args.model_affinity and (args.adaptive or args.async_client):
+        parser.error("--model-affinity is not supported with --adaptive or --async-client.")
+    if args.share_prefixes and args.async_client:
+        parser.error("--share-prefixes is not supported with --async-client.")
+    if args.share_prefixes and args.mode == 'composite':
+        parser.error("--share-prefixes is not supported with --mode composite.")
+    if args.share_prefixes and args.temperature != 0:
+        parser.error("--share-prefixes requires --temperature 0.")
+    if args.resume and not args.results_dir:
+        parser.error("--resume requires the --results-dir of the sweep to resume.")
+
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    base_dir = os.path.abspath(os.path.join(script_dir, '..'))
+    base_prompt_dir = os.path.join(base_dir, '02_Prompts')
+    base_test_def_dir = os.path.join(base_dir, '01_TestDefinitions')
+
+    results_dir = args.results_dir
+    if results_dir is None:
+        results_dir = default_results_dir(base_dir, args.mode, args.num_runs)
+    if args.resume and not os.path.exists(os.path.join(results_dir, QUEUE_FILE_NAME)):
+        parser.error(f"--resume: no work queue found in {results_dir}")
+    os.makedirs(results_dir, exist_ok=True)
+
+    trials = build_trial_matrix(args.models, args.test_cases, args.langs, args.spec_langs,
+                                args.prompt_styles, args.num_runs)
+
+    # Load and compile every template of the matrix up front, so problems show before any model call.
+    registry = get_registry(base_prompt_dir, base_test_def_dir)
+    configurations = sorted({(t['test_case'], t['lang'], t['spec_lang'], t['prompt_style']) for t in trials})
+    problems = [problem for configuration in configurations for problem in registry.check_trial(*configuration)]
+    if problems:
+        print(f"Warning: {len(problems)} template problems; the affected trials will be recorded as errors:")
+        for problem in problems:
+            print(f"  {problem}")
+
+    work_queue = WorkQueue.for_results_dir(results_dir)
+    sweep_config = {'mode': args.mode, 'max_cycles': args.max_cycles, 'adaptive': args.adaptive,
+                    'options': generation_options(args)}
+    if args.chat:
+        sweep_config['chat'] = True
+    if args.suite_report:
+        sweep_config['suite_report'] = True
+    try:
+        work_queue.check_config(sweep_config, args.resume)
+    except ValueError as e:
+        parser.error(f"{results_dir} {e}")
+    requeued = work_queue.requeue_unfinished() if args.resume else 0
+    done_trials = work_queue.done_trials() if args.resume else []
+
+    allocator = None
+    if args.adaptive:
+        from adaptive_allocator import AdaptiveAllocator
+        cells = [trial for trial in trials if trial['run'] == 1]
+        allocator = AdaptiveAllocator(
+            cells, min_runs=args.min_runs, max_runs=args.max_runs_per_cell or 2 * args.num_runs,
+            budget=args.trial_budget or len(trials), target_width=args.target_ci_width,
+            reference=args.reference_rate
+        )
+        retry = work_queue.pending_trials()
+        for trial, status in done_trials:
+            allocator.restore(trial, "SUCCESS" in (status or ''))
+        for trial in retry:
+            allocator.restore(trial)
+    else:
+        work_queue.plan(trials)
+        trials = work_queue.pending_trials()
+
+    print("Starting Concurrent Sweep...")
+    print("====================================================")
+    print(f"Models:             {' '.join(args.models)}")
+    print(f"Test Cases:         {' '.join(args.test_cases)}")
+    print(f"Mode:               {args.mode}")
+    if allocator is not None:
+        print(f"Trials:             adaptive, at most {allocator.budget} over {len(allocator.cells)} cells")
+    else:
+        print(f"Trials:             {len(trials)}")
+    print(f"Max workers:        {args.max_workers} (per model: {args.per_model_limit})")
+    print(f"Results will be in: {results_dir}")
+    if args.resume:
+        print(f"Resuming:           {len(done_trials)} trials already done, {requeued} interrupted or failed trials retried")
+    print("====================================================")
+
+    sandbox = None
+    if args.sandbox_workers > 0:
+        from sandbox_pool import SandboxPool
+        sandbox = SandboxPool(size=args.sandbox_workers, max_tasks=args.sandbox_max_tasks)
+
+    validation_cache = None
+    if args.validation_cache:
+        from validation_cache import ValidationCache
+        validation_cache = ValidationCache(args.validation_cache)
+
+    results_store = None
+    if args.results_store:
+        from results_store import ResultsStore
+        results_store = ResultsStore(args.results_store)
+
+    checkpoint_tree = None
+    if args.share_prefixes:
+        from checkpoint_tree import CheckpointTree
+        checkpoint_tree = CheckpointTree()
+
+    trace_writer = None
+    if args.trace:
+        from cycle_metrics import open_trace_writer
+        trace_writer = open_trace_writer(args.trace, args.trace_format)
+
+    model_affinity = None
+    if args.model_affinity:
+        from model_affinity import ModelAffinityQueue
+        memory_budget = int(args.server_memory_gb * 1024 ** 3) if args.server_memory_gb else None
+        model_affinity = ModelAffinityQueue(args.api_url, memory_budget_bytes=memory_budget)
+
+    scheduler = SweepScheduler(
+        args.api_url, results_dir, base_prompt_dir, base_test_def_dir,
+        mode=args.mode, max_cycles=args.max_cycles, max_workers=args.max_workers,
+        per_model_limit=args.per_model_limit, model_limits=parse_model_limits(args.model_limit),
+        stream=args.stream, sandbox=sandbox, validation_cache=validation_cache,
+        results_store=results_store, checkpoint_tree=checkpoint_tree,
+        options=generation_options(args), keep_alive=args.keep_alive, batch_first_step=args.batch_first_step,
+        model_affinity=model_affinity, trace_writer=trace_writer, work_queue=work_queue, chat=args.chat,
+        suite_report=args.suite_report
+    )
+    scheduler.num_runs = args.num_runs
+
+    start = time.monotonic()
+    try:
+        if allocator is not None:
+            completed = scheduler.run_adaptive(allocator, retry=retry)
+        elif args.async_client:
+            completed = asyncio.run(scheduler.run_async(trials, connections_per_host=args.connections_per_host))
+        else:
+            completed = scheduler.run(trials)
+    finally:
+        if sandbox is not None:
+            sandbox.close()
+        if results_store is not None:
+            results_store.close()
+        if trace_writer is not None:
+            trace_writer.close()
+        print(work_queue.summary())
+        work_queue.close()
+    elapsed = time.monotonic() - start
+
+    successes = sum(1 for _, result in completed if "SUCCESS" in result['status'])
+    print(f"Sweep finished in {elapsed:.1f}s. {successes}/{len(completed)} trials succeeded.")
+    if allocator is not None:
+        allocation = allocator.summary()
+        with open(os.path.join(results_dir, 'allocation.json'), 'w') as f:
+            json.dump(allocation, f, indent=4)
+        print(f"Adaptive allocation: {sum(row['runs'] for row in allocation)} trials instead of {len(trials)}; per-cell runs and stop reasons are in allocation.json.")
+    if model_affinity is not None:
+        print(model_affinity.summary())
+    else:
+        from model_affinity import server_time_split
+        swap_time = generation_time = 0.0
+        for _, result in completed:
+            swap, generation = server_time_split(result)
+            swap_time += swap
+            generation_time += generation
+        if swap_time or generation_time:
+            print(f"Server time: {swap_time:.1f}s loading models vs {generation_time:.1f}s generating")
+    if checkpoint_tree is not None:
+        print(checkpoint_tree.summary())
+    if validation_cache is not None:
+        print(validation_cache.summary())
+        validation_cache.close()
+    print(f"Results are in: {results_dir}")
+
+if __name__ == "__main__":
+    main()
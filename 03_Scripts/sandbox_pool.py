@@ -0,0 +1,261 @@
+# sandbox_pool.py
+#
+# A pool of pre-warmed worker processes for validating generated code without
+# paying interpreter startup and temp-file I/O on every validation.
+#
+# Each worker receives a complete test script (the test_runner.py template with
+# the generated code spliced in) over a pipe and executes it in a fresh
+# namespace with __name__ == "__main__". stdout/stderr are captured and the
+# outcome is reported as (returncode, stdout, stderr), exactly like the
+# `python3 <tempfile>` subprocess it replaces: sys.exit(n) becomes returncode n
+# and an uncaught exception becomes returncode 1 with its traceback on stderr.
+#
+# Workers also evaluate structured test suites (test_suite.py) in-process,
+# several candidate programs per call: run_suites() sends a batch of
+# (code, suite) pairs and gets one per-case report back for each.
+#
+# Limits applied inside each worker:
+#   - time:   a per-script interval timer, backed by a hard kill from the parent
+#   - memory: RLIMIT_AS (where the platform supports it)
+#   - fork:   RLIMIT_NPROC = 0 and os.fork/os.system/subprocess disabled
+#
+# Workers are recycled after `max_tasks` executions (generated code can leave
+# global state behind, e.g. monkeypatched builtins) and after any crash or
+# timeout.
+#
+import io
+import linecache
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import traceback
+
+from test_suite import run_suite, failed_report
+
+# Errors of validations stopped by the harness rather than failed by the code.
+TIMEOUT_ERROR_PREFIX = "TimeoutError: script exceeded"
+CRASH_ERROR = "Error: Validation worker crashed."
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+class SandboxTimeout(BaseException):
+    """Raised inside a worker when a script exceeds its time limit.
+
+    Derives from BaseException so the `except Exception` blocks in the test
+    runners cannot swallow it.
+    """
+
+def is_harness_error(error):
+    """True if a validation error is a time limit or a worker crash; those depend on machine load, not only on the code."""
+    return bool(error) and (error.startswith(TIMEOUT_ERROR_PREFIX) or error == CRASH_ERROR)
+
+def _forbidden(*args, **kwargs):
+    raise PermissionError("Process creation is not allowed in the validation sandbox.")
+
+def _apply_limits(memory_limit_mb):
+    if resource is not None:
+        if memory_limit_mb:
+            limit = memory_limit_mb * 1024 * 1024
+            try:
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            except (ValueError, OSError):
+                pass
+        try:
+            resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+        except (ValueError, OSError, AttributeError):
+            pass
+
+    import subprocess
+    for name in ('fork', 'forkpty', 'system', 'posix_spawn', 'posix_spawnp', 'execv', 'execve'):
+        if hasattr(os, name):
+            setattr(os, name, _forbidden)
+    subprocess.Popen = _forbidden
+
+def _on_timeout(signum, frame):
+    raise SandboxTimeout()
+
+def execute_script(script, timeout):
+    """Executes a script in a fresh __main__ namespace; returns (returncode, stdout, stderr)."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    saved = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = stdout, stderr
+    returncode = 0
+    namespace = {'__name__': '__main__', '__file__': '<generated>', '__builtins__': __builtins__}
+    # Register the source so tracebacks show the offending lines, as they would for a file.
+    linecache.cache['<generated>'] = (len(script), None, script.splitlines(True), '<generated>')
+    try:
+        if timeout and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        exec(compile(script, '<generated>', 'exec', dont_inherit=True), namespace)
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=stderr)
+            returncode = 1
+    except SandboxTimeout:
+        print(f"{TIMEOUT_ERROR_PREFIX} {timeout} seconds", file=stderr)
+        returncode = 1
+    except BaseException as e:
+        if isinstance(e, SyntaxError):
+            lines = traceback.format_exception_only(type(e), e)
+        else:
+            # Drop this function's own frame so the traceback starts in the script.
+            lines = ["Traceback (most recent call last):\n"]
+            lines += traceback.format_list(traceback.extract_tb(e.__traceback__.tb_next))
+            lines += traceback.format_exception_only(type(e), e)
+        stderr.write("".join(lines))
+        returncode = 1
+    finally:
+        if timeout and hasattr(signal, 'setitimer'):
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        sys.stdout, sys.stderr = saved
+    return returncode, stdout.getvalue(), stderr.getvalue()
+
+def _worker_main(conn, memory_limit_mb):
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _on_timeout)
+    _apply_limits(memory_limit_mb)
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if message is None:
+            break
+        kind, payload, timeout = message
+        try:
+            if kind == 'suites':
+                conn.send([run_suite(code_string, suite, timeout) for code_string, suite in payload])
+            else:
+                conn.send(execute_script(payload, timeout))
+        except MemoryError:
+            # The pipe itself may be unusable now; let the parent recycle us.
+            os._exit(1)
+
+class _Worker:
+    def __init__(self, context, memory_limit_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self, force=False):
+        if not force:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                force = True
+        if force and self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+class SandboxPool:
+    """
+    Thread-safe pool of validation workers. run() blocks until a worker is
+    free, so it can be shared by all trials of a concurrent sweep.
+    """
+
+    def __init__(self, size=None, max_tasks=200, memory_limit_mb=1024, grace_period=2.0):
+        self.size = size or os.cpu_count() or 1
+        self.max_tasks = max_tasks
+        self.memory_limit_mb = memory_limit_mb
+        self.grace_period = grace_period
+        # Spawned (not forked) workers start from a small, clean interpreter, so the
+        # address-space limit is not eaten up by the parent's threads and imports.
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._closed = False
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _spawn(self):
+        worker = _Worker(self._context, self.memory_limit_mb)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _retire(self, worker, force):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.stop(force=force)
+
+    def _call(self, message, timeout):
+        """
+        Sends one task to a free worker and waits up to timeout (plus the grace
+        period) for its answer. Returns (result, None), or (None, 'timeout') /
+        (None, 'crash') if the worker had to be killed or died.
+        """
+        if self._closed:
+            raise RuntimeError("SandboxPool is closed.")
+        worker = self._idle.get()
+        result = failure = None
+        try:
+            worker.conn.send(message)
+            if worker.conn.poll(timeout + self.grace_period):
+                result = worker.conn.recv()
+            else:
+                failure = 'timeout'
+        except (EOFError, OSError, BrokenPipeError):
+            failure = 'crash'
+
+        worker.tasks += 1
+        if failure is None and worker.tasks < self.max_tasks and worker.process.is_alive():
+            self._idle.put(worker)
+        else:
+            self._retire(worker, force=failure is not None)
+            self._idle.put(self._spawn())
+        return result, failure
+
+    def run(self, script, timeout=10):
+        """Executes a script in a worker and returns (returncode, stdout, stderr)."""
+        result, failure = self._call(('script', script, timeout), timeout)
+        if failure == 'timeout':
+            return 1, "", f"{TIMEOUT_ERROR_PREFIX} {timeout} seconds"
+        if failure == 'crash':
+            return 1, "", CRASH_ERROR
+        return result
+
+    def run_suites(self, items, timeout=10):
+        """
+        Evaluates (code_string, suite) pairs in one worker call and returns
+        their test_suite.run_suite() reports. Each program has timeout
+        seconds; if the worker still has to be killed, every report of the
+        batch fails.
+        """
+        if not items:
+            return []
+        reports, failure = self._call(('suites', items, timeout), timeout * len(items))
+        if failure == 'timeout':
+            return [failed_report(suite, "TimeoutError", f"Validation batch exceeded {timeout * len(items)} seconds.")
+                    for _, suite in items]
+        if failure == 'crash':
+            return [failed_report(suite, "WorkerCrash", "Validation worker crashed.") for _, suite in items]
+        return reports
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
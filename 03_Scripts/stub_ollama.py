@@ -0,0 +1,342 @@
+# stub_ollama.py
+#
+# A local stand-in for an Ollama server, for measuring and testing the
+# harness without a GPU box. It speaks POST /api/generate and /api/chat
+# (streaming and non-streaming) and GET /api/tags and /api/ps, and answers
+# with responses recorded in 04_RawData.
+#
+# Every archived trial is turned back into its (prompt, response) pairs (the
+# same reconstruction as replay_cycles.py), so a prompt the benchmark has seen
+# before gets one of its recorded responses, in the model's own words. Other
+# prompts get a recorded response of the same model and step (code-to-spec or
+# spec-to-code), picked with a seeded RNG.
+#
+# Latency, token rate, error rate and concurrency are configurable:
+#   --latency       seconds before the first token (prompt evaluation)
+#   --token-rate    generated tokens per second (0 = all at once); a response
+#                   is counted as len(text) / 4 tokens
+#   --error-rate    fraction of requests answered with HTTP 500
+#   --num-parallel  requests generated at the same time (OLLAMA_NUM_PARALLEL);
+#                   further requests wait for a slot
+#   --max-queue     waiting requests beyond which HTTP 503 is returned
+#                   (OLLAMA_MAX_QUEUE; 0 = unlimited)
+#   --load-latency  seconds added when the requested model differs from the
+#                   last one (a model swap), reported as load_duration
+# /api/chat imitates the server's prompt cache: a system message already seen
+# for the loaded model is not evaluated again, which shortens the latency and
+# prompt_eval_count in proportion. A model swap empties the cache.
+# GET /stub/stats returns the request counters.
+#
+# Usage:
+#   python3 03_Scripts/stub_ollama.py --port 11434 --latency 0.2 --token-rate 40 --num-parallel 2 &
+#   OLLAMA_API_URL=http://localhost:11434 03_Scripts/run_all_experiments.sh --num-runs 3
+#
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prompt_registry import get_registry
+from replay_cycles import recorded_responses
+from result_pack import find_result_files, load_result
+from run_sweep import parse_trial_dir_name
+
+CHARS_PER_TOKEN = 4
+ANY_MODEL = '*'
+
+def _digest(prompt):
+    return hashlib.sha1(prompt.encode('utf-8')).digest()
+
+def _model_key(model):
+    """Archived models appear in directory names with ':' replaced by '-'."""
+    model = model[:-len(':latest')] if model.endswith(':latest') else model
+    return model.replace(':', '-')
+
+class RecordedCorpus:
+    """Recorded responses by (model, prompt digest), and by (model, step) for unseen prompts."""
+
+    def __init__(self):
+        self.by_prompt = {}
+        self.by_step = {}
+        self.step_prefixes = {}
+        self.models = set()
+        self.trials = 0
+
+    def _add(self, model, prompt, response, step):
+        for key in (model, ANY_MODEL):
+            self.by_prompt.setdefault((key, _digest(prompt)), []).append(response)
+            self.by_step.setdefault((key, step), []).append(response)
+
+    @classmethod
+    def load(cls, data_dirs, base_prompt_dir, base_test_def_dir, models=None):
+        corpus = cls()
+        registry = get_registry(base_prompt_dir, base_test_def_dir)
+        wanted = {_model_key(model) for model in models} if models else None
+        for result_path in find_result_files(data_dirs):
+            trial = parse_trial_dir_name(os.path.basename(os.path.dirname(result_path)))
+            if trial is None or (wanted is not None and trial['model'] not in wanted):
+                continue
+            code_to_spec, spec_to_code = registry.prompt_templates(trial['test_case'], trial['lang'],
+                                                                    trial['spec_lang'], trial['prompt_style'])
+            initial_code = registry.initial_code(trial['test_case'])
+            if not all([code_to_spec, spec_to_code, initial_code]):
+                continue
+            try:
+                result = load_result(result_path)
+            except (json.JSONDecodeError, IOError):
+                continue
+            corpus.step_prefixes[code_to_spec.literals[0]] = 'step1'
+            corpus.step_prefixes[spec_to_code.literals[0]] = 'step2'
+            corpus.models.add(trial['model'])
+            corpus.trials += 1
+            for prompt, response in recorded_responses(result, initial_code, code_to_spec, spec_to_code):
+                corpus._add(trial['model'], prompt, response, corpus.step_of(prompt))
+        return corpus
+
+    def step_of(self, prompt):
+        """'step1' for a code-to-spec prompt, 'step2' otherwise (by the longest matching template prefix)."""
+        matches = [prefix for prefix in self.step_prefixes if prompt.startswith(prefix)]
+        return self.step_prefixes[max(matches, key=len)] if matches else 'step2'
+
+    def lookup(self, model, prompt, rng):
+        """Returns (response, replayed); replayed is False when the prompt was never recorded."""
+        key = _model_key(model)
+        if key not in self.models:
+            key = ANY_MODEL
+        candidates = self.by_prompt.get((key, _digest(prompt)))
+        if candidates:
+            return rng.choice(candidates), True
+        candidates = self.by_step.get((key, self.step_of(prompt))) or self.by_step.get((ANY_MODEL, self.step_of(prompt)))
+        if candidates:
+            return rng.choice(candidates), False
+        return "```python\npass\n```", False
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, corpus, latency=0.0, token_rate=0.0, error_rate=0.0, num_parallel=1,
+                 max_queue=0, load_latency=0.0, seed=None):
+        super().__init__(address, StubOllamaHandler)
+        self.corpus = corpus
+        self.latency = latency
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.max_queue = max_queue
+        self.load_latency = load_latency
+        self.rng = random.Random(seed)
+        self.slots = threading.Semaphore(num_parallel)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.loaded_model = None
+        self.cached_prefixes = set()
+        self.stats = {'requests': 0, 'replayed': 0, 'unseen_prompts': 0, 'errors': 0, 'busy': 0,
+                      'aborted': 0, 'model_loads': 0, 'eval_tokens': 0, 'prompt_eval_tokens': 0,
+                      'prompt_eval_tokens_cached': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def available_models(self):
+        return sorted(self.corpus.models)
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        server = self.server
+        if self.path == '/api/tags':
+            models = [{'name': _tag_name(model), 'model': _tag_name(model), 'size': 0} for model in server.available_models()]
+            self._send_json(200, {'models': models})
+        elif self.path == '/api/ps':
+            loaded = [server.loaded_model] if server.loaded_model else []
+            self._send_json(200, {'models': [{'name': model, 'model': model, 'size': 0} for model in loaded]})
+        elif self.path == '/stub/stats':
+            with server.lock:
+                self._send_json(200, dict(server.stats))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path not in ('/api/generate', '/api/chat'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        chat = self.path == '/api/chat'
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            model = body['model']
+            if chat:
+                messages = body['messages']
+                prompt = ''.join(message['content'] for message in messages)
+                system = ''.join(message['content'] for message in messages if message.get('role') == 'system')
+            else:
+                prompt, system = body['prompt'], None
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': 'invalid request'})
+            return
+        server = self.server
+        server.count('requests')
+
+        with server.lock:
+            if server.max_queue and server.waiting >= server.max_queue:
+                server.stats['busy'] += 1
+                busy = True
+            else:
+                server.waiting += 1
+                busy = False
+        if busy:
+            self._send_json(503, {'error': 'server busy, please try again.  maximum pending requests exceeded'})
+            return
+        server.slots.acquire()
+        with server.lock:
+            server.waiting -= 1
+        try:
+            self._generate(server, model, prompt, bool(body.get('stream', True)), chat, system)
+        finally:
+            server.slots.release()
+
+    def _generate(self, server, model, prompt, stream, chat=False, system=None):
+        start = time.monotonic()
+        load_duration = 0.0
+        with server.lock:
+            swap = server.loaded_model != model
+            server.loaded_model = model
+            if swap:
+                server.cached_prefixes.clear()
+            failed = server.rng.random() < server.error_rate
+            text, replayed = server.corpus.lookup(model, prompt, server.rng)
+            cached = len(system) if system and system in server.cached_prefixes else 0
+            if system:
+                server.cached_prefixes.add(system)
+        if swap:
+            server.count('model_loads')
+            time.sleep(server.load_latency)
+            load_duration = server.load_latency
+        if failed:
+            server.count('errors')
+            self._send_json(500, {'error': 'stub: injected failure'})
+            return
+        server.count('replayed' if replayed else 'unseen_prompts')
+
+        time.sleep(server.latency * (len(prompt) - cached) / max(1, len(prompt)))
+        prompt_eval_done = time.monotonic()
+        prompt_eval_count = max(1, (len(prompt) - cached) // CHARS_PER_TOKEN)
+        server.count('prompt_eval_tokens', prompt_eval_count)
+        server.count('prompt_eval_tokens_cached', cached // CHARS_PER_TOKEN)
+        tokens = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)] or ['']
+        final = dict(_text_body('', chat), model=model, created_at=_now(), done=True, done_reason='stop',
+                     prompt_eval_count=prompt_eval_count, eval_count=len(tokens))
+
+        if not stream:
+            if server.token_rate:
+                time.sleep(len(tokens) / server.token_rate)
+            final.update(_text_body(text, chat))
+            self._send_json(200, _with_durations(final, start, prompt_eval_done, load_duration))
+            server.count('eval_tokens', len(tokens))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        # Send several tokens per chunk at high rates to keep the sleeps coarse.
+        per_chunk = max(1, int(server.token_rate * 0.02)) if server.token_rate else len(tokens)
+        sent = 0
+        try:
+            for i in range(0, len(tokens), per_chunk):
+                chunk = tokens[i:i + per_chunk]
+                if server.token_rate:
+                    time.sleep(len(chunk) / server.token_rate)
+                self._write_chunk(dict(_text_body(''.join(chunk), chat), model=model, created_at=_now(), done=False))
+                sent += len(chunk)
+            self._write_chunk(_with_durations(final, start, prompt_eval_done, load_duration))
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. a usable code block had closed): generation is aborted.
+            server.count('aborted')
+            self.close_connection = True
+        server.count('eval_tokens', sent)
+
+    def _write_chunk(self, body):
+        data = (json.dumps(body) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+def _tag_name(model_key):
+    """Best guess of the Ollama tag of a directory-name model, e.g. gemma3-4b -> gemma3:4b."""
+    name, sep, tag = model_key.rpartition('-')
+    return f'{name}:{tag}' if sep else model_key
+
+def _text_body(text, chat):
+    """The generated-text part of an /api/generate or /api/chat response body."""
+    return {'message': {'role': 'assistant', 'content': text}} if chat else {'response': text}
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _with_durations(final, start, prompt_eval_done, load_duration):
+    now = time.monotonic()
+    return dict(final, load_duration=int(load_duration * 1e9),
+                prompt_eval_duration=int(max(0.0, prompt_eval_done - start - load_duration) * 1e9),
+                eval_duration=int((now - prompt_eval_done) * 1e9), total_duration=int((now - start) * 1e9))
+
+def start_server(corpus, host='127.0.0.1', port=0, **kwargs):
+    """Starts a StubOllamaServer on a background thread and returns it (server.server_address has the port)."""
+    server = StubOllamaServer((host, port), corpus, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Ollama stand-in that replays responses recorded in 04_RawData.")
+    parser.add_argument("--host", default='127.0.0.1', help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=11434, help="Port to listen on (0 picks a free one).")
+    parser.add_argument("--data-dirs", nargs='+', default=None, help="Directories with archived result.json files (default: 04_RawData).")
+    parser.add_argument("--models", nargs='+', default=None, help="Only load the responses of these models.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before the first token of every response.")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Generated tokens per second (0 = no generation delay).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--num-parallel", type=int, default=1, help="Requests generated concurrently; others wait for a slot.")
+    parser.add_argument("--max-queue", type=int, default=0, help="Waiting requests beyond which HTTP 503 is returned (0 = unlimited).")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="Seconds added when the requested model differs from the last one.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for response choice and error injection.")
+
+    args = parser.parse_args()
+
+    base_dir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    data_dirs = args.data_dirs or [os.path.join(base_dir, '04_RawData')]
+    start = time.monotonic()
+    corpus = RecordedCorpus.load(data_dirs, os.path.join(base_dir, '02_Prompts'),
+                                 os.path.join(base_dir, '01_TestDefinitions'), models=args.models)
+    server = StubOllamaServer((args.host, args.port), corpus, latency=args.latency, token_rate=args.token_rate,
+                              error_rate=args.error_rate, num_parallel=args.num_parallel, max_queue=args.max_queue,
+                              load_latency=args.load_latency, seed=args.seed)
+    host, port = server.server_address[:2]
+    print(f"Loaded {corpus.trials} recorded trials of {len(corpus.models)} models in {time.monotonic() - start:.1f}s.")
+    print(f"Stub Ollama server listening on http://{host}:{port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stub server stats: {json.dumps(server.stats)}")
+
+if __name__ == "__main__":
+    main()
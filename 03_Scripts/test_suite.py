@@ -0,0 +1,231 @@
+# test_suite.py
+#
+# Structured test definitions, evaluated in-process with per-case results.
+#
+# A test_runner.py exits on the first mismatch and reports one line of text,
+# so every validation needs its own interpreter and a failed program tells us
+# nothing about how close it came. A test case may instead define its tests as
+# data in test_cases.json next to initial_code.py:
+#
+#   {
+#       "function": "fizzbuzz",
+#       "decides_verdict": false,
+#       "cases": [
+#           {"name": "3 is Fizz", "args": [3], "expected": "Fizz"},
+#           {"args": [15], "kwargs": {}, "expected": "FizzBuzz"}
+#       ]
+#   }
+#
+# run_suite() executes the generated code once in a fresh namespace, calls the
+# function for every case and returns a report:
+#
+#   {"passed": 10, "total": 11, "seconds": 0.0004, "error": null, "error_type": null,
+#    "cases": [{"name": "...", "passed": false, "seconds": 2e-06,
+#               "error_type": "TypeError", "error": "...", "actual": "'3'"}, ...]}
+#
+# "error"/"error_type" at the top level are set when the code cannot be loaded
+# at all (syntax error, exception at import time, missing function); every case
+# then counts as failed. A case passes when the returned value == "expected".
+# The report only holds JSON types, so it can be cached, pickled to a sandbox
+# worker's parent, and stored in result.json.
+#
+# The pass/fail verdict of a cycle comes from test_runner.py. Only a suite
+# with "decides_verdict": true (or a test case without a test_runner.py)
+# decides the verdict itself; otherwise the suite is run only when a report is
+# asked for (--suite-report), since that executes the code a second time. The
+# report is then recorded alongside the runner's verdict. Since the runner
+# executes the generated code in a module that also has the runner's
+# own imports (e.g. math), run_suite() runs the import statements of
+# with_runner_imports() after the code, in the same namespace.
+#
+# Used by validate_code() in run_cycle_test_syntactic.py, in-process by
+# sandbox_pool.py workers, and, without a sandbox, as a subprocess that reads
+# {"code", "suite", "timeout"} as JSON on stdin and writes the report to stdout.
+#
+import ast
+import copy
+import io
+import json
+import signal
+import sys
+import threading
+import time
+
+SUITE_FILE_NAME = 'test_cases.json'
+# Longest repr of a returned value kept in a report.
+MAX_ACTUAL_LENGTH = 200
+# Report error types set by the harness (time limits, crashed sandbox workers) rather than the code.
+HARNESS_ERROR_TYPES = ('TimeoutError', 'WorkerCrash')
+
+class SuiteTimeout(BaseException):
+    """Raised when a suite exceeds its time limit; a BaseException so generated code cannot swallow it."""
+
+def parse_test_suite(text):
+    """
+    Parses and checks a test_cases.json document. Returns the suite as a dict
+    with decides_verdict and every case's name, args, kwargs and expected
+    value filled in. Raises ValueError if it is malformed.
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get('function'), str) or not data['function']:
+        raise ValueError("a test suite needs a 'function' name")
+    if not isinstance(data.get('decides_verdict', False), bool):
+        raise ValueError("'decides_verdict' must be true or false")
+    if not isinstance(data.get('cases'), list) or not data['cases']:
+        raise ValueError("a test suite needs a non-empty 'cases' list")
+    cases = []
+    for index, case in enumerate(data['cases']):
+        if not isinstance(case, dict) or 'expected' not in case:
+            raise ValueError(f"case {index + 1} has no 'expected' value")
+        args, kwargs = case.get('args', []), case.get('kwargs', {})
+        if not isinstance(args, list) or not isinstance(kwargs, dict):
+            raise ValueError(f"case {index + 1}: 'args' must be a list and 'kwargs' an object")
+        cases.append({'name': str(case.get('name', f"case {index + 1}")), 'args': args, 'kwargs': kwargs,
+                      'expected': case['expected']})
+    return {'function': data['function'], 'decides_verdict': data.get('decides_verdict', False), 'cases': cases}
+
+def with_runner_imports(suite, test_runner_script):
+    """
+    Returns the suite with the top-level import statements of a test_runner.py
+    template, which run_suite() executes after the generated code.
+    """
+    try:
+        tree = ast.parse(test_runner_script.replace('{generated_code}', ''))
+    except SyntaxError:
+        return suite
+    imports = [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return dict(suite, imports='\n'.join(imports)) if imports else suite
+
+def suite_source(suite):
+    """Canonical text of a parsed suite, e.g. for cache keys."""
+    return json.dumps(suite, sort_keys=True)
+
+def _short_repr(value):
+    try:
+        text = repr(value)
+    except Exception as e:
+        text = f"<unrepresentable {type(value).__name__}: {e}>"
+    return text if len(text) <= MAX_ACTUAL_LENGTH else text[:MAX_ACTUAL_LENGTH] + '...'
+
+def _case_result(case, passed, seconds, error=None, actual=None):
+    result = {'name': case['name'], 'passed': passed, 'seconds': seconds, 'error_type': None, 'error': None}
+    if error is not None:
+        result['error_type'] = type(error).__name__
+        result['error'] = str(error)[:MAX_ACTUAL_LENGTH]
+    elif not passed:
+        result['actual'] = _short_repr(actual)
+    return result
+
+def _not_run(case):
+    return {'name': case['name'], 'passed': False, 'seconds': 0.0, 'error_type': None, 'error': None}
+
+def _load_function(code_string, suite, report):
+    """Executes the code in a fresh namespace and returns the function under test, or None (with the error in report)."""
+    namespace = {'__name__': '__main__', '__file__': '<generated>', '__builtins__': __builtins__}
+    try:
+        exec(compile(code_string, '<generated>', 'exec', dont_inherit=True), namespace)
+        if suite.get('imports'):
+            exec(compile(suite['imports'], '<test_runner>', 'exec', dont_inherit=True), namespace)
+    except (Exception, SystemExit) as e:
+        report['error_type'], report['error'] = type(e).__name__, str(e)[:MAX_ACTUAL_LENGTH]
+        return None
+    function = namespace.get(suite['function'])
+    if not callable(function):
+        report['error_type'], report['error'] = 'NameError', f"Function '{suite['function']}' not found in generated code."
+        return None
+    return function
+
+def _run_cases(function, suite, report):
+    """Runs every case, appending to report['cases'] as it goes."""
+    for case in suite['cases']:
+        # Copies, so code that mutates its input cannot change the next case or program.
+        args, kwargs = copy.deepcopy(case['args']), copy.deepcopy(case['kwargs'])
+        start = time.perf_counter()
+        try:
+            actual = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            passed = bool(actual == case['expected'])
+        except (Exception, SystemExit) as e:
+            report['cases'].append(_case_result(case, False, time.perf_counter() - start, error=e))
+            continue
+        report['cases'].append(_case_result(case, passed, seconds, actual=actual))
+
+def _on_timeout(signum, frame):
+    raise SuiteTimeout()
+
+def run_suite(code_string, suite, timeout=10):
+    """
+    Runs every case of a parsed suite against the generated code and returns
+    the report (see the top of this file). Output printed by the code is
+    discarded and input() sees an empty stdin. Cases not reached within
+    timeout seconds fail with a TimeoutError.
+    """
+    report = {'passed': 0, 'total': len(suite['cases']), 'seconds': 0.0, 'error': None, 'error_type': None, 'cases': []}
+    saved = sys.stdin, sys.stdout, sys.stderr
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), io.StringIO(), io.StringIO()
+    # Signal handlers can only be set from the main thread; elsewhere the caller enforces the limit.
+    use_alarm = bool(timeout) and hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    function = None
+    try:
+        function = _load_function(code_string, suite, report)
+        if function is not None:
+            _run_cases(function, suite, report)
+    except SuiteTimeout:
+        if function is None:
+            report['error_type'], report['error'] = 'TimeoutError', f"Loading the code exceeded {timeout} seconds."
+        else:
+            timeout_error = TimeoutError(f"Suite exceeded {timeout} seconds.")
+            for case in suite['cases'][len(report['cases']):]:
+                report['cases'].append(_case_result(case, False, 0.0, error=timeout_error))
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        sys.stdin, sys.stdout, sys.stderr = saved
+    report['seconds'] = time.perf_counter() - start
+    if report['error'] is not None:
+        report['cases'] = [_not_run(case) for case in suite['cases']]
+    report['passed'] = sum(1 for case in report['cases'] if case['passed'])
+    return report
+
+def failed_report(suite, error_type, error):
+    """A report for code that could not be evaluated at all (e.g. its worker crashed)."""
+    return {'passed': 0, 'total': len(suite['cases']), 'seconds': 0.0, 'error': error, 'error_type': error_type,
+            'cases': [_not_run(case) for case in suite['cases']]}
+
+def is_conclusive(report):
+    """
+    False if the time limit was hit or the worker crashed anywhere in the
+    report: such an outcome depends on machine load and must not be cached.
+    """
+    if report['error_type'] in HARNESS_ERROR_TYPES:
+        return False
+    return not any(case['error_type'] == 'TimeoutError' for case in report['cases'])
+
+def report_outcome(report):
+    """
+    Maps a report to the (output, error) pair of validate_code(): ("SUCCESS",
+    None) if every case passed, otherwise (None, a one-line summary).
+    """
+    if report['passed'] == report['total']:
+        return "SUCCESS", None
+    if report['error'] is not None:
+        return None, f"FAIL: {report['error_type']}: {report['error']}"
+    first = next(case for case in report['cases'] if not case['passed'])
+    if first['error_type']:
+        detail = f"{first['error_type']}: {first['error']}"
+    else:
+        detail = f"Got {first.get('actual')}"
+    return None, f"FAIL: {report['passed']}/{report['total']} cases passed. First failure: {first['name']}: {detail}"
+
+def main():
+    request = json.load(sys.stdin)
+    report = run_suite(request['code'], request['suite'], request.get('timeout', 10))
+    sys.stdout.write(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
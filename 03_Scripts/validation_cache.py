@@ -0,0 +1,129 @@
+# validation_cache.py
+#
+# A persistent, content-addressed cache of validate_code() results.
+#
+# Small models often regenerate exactly the same function body cycle after
+# cycle and run after run. Results are keyed on a hash of the AST-normalized
+# generated code plus a hash of the test runner it was validated against, so
+# copies that differ only in whitespace or comments hit the same entry, and
+# editing a test_runner.py invalidates everything validated against it.
+# Code that does not parse is keyed on its exact text, since the resulting
+# SyntaxError message depends on it.
+#
+# For a structured test suite (test_suite.py) the per-case report is stored
+# alongside the outcome, as JSON.
+#
+# Only outcomes of the code itself are cached: validations that hit a time
+# limit or crashed a sandbox worker are run again next time.
+#
+# Entries live in a single SQLite file with size-bounded LRU eviction and can
+# be shared by concurrent threads and processes. Counting the entries is a
+# full scan, so the bound is enforced when the cache is opened and then every
+# PRUNE_INTERVAL writes of a process; in between it may be exceeded by that
+# many entries per process.
+#
+import ast
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+PRUNE_INTERVAL = 1000
+
+def normalize_code(code_string):
+    """Returns a canonical form of the code that ignores formatting and comments."""
+    try:
+        return "ast:" + ast.dump(ast.parse(code_string))
+    except (SyntaxError, ValueError):
+        return "raw:" + code_string
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+class ValidationCache:
+    """SQLite-backed LRU cache mapping (normalized code, test runner) to (output, error, test results)."""
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_prune = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS validation_cache ("
+            " key TEXT PRIMARY KEY,"
+            " output TEXT,"
+            " error TEXT,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_validation_cache_last_used ON validation_cache(last_used)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(validation_cache)")}
+        if 'results' not in columns:
+            # Caches written before structured test suites existed.
+            self._conn.execute("ALTER TABLE validation_cache ADD COLUMN results TEXT")
+        self._prune()
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def make_key(code_string, runner_source):
+        return _sha256(normalize_code(code_string)) + ":" + _sha256(runner_source)
+
+    def get(self, key):
+        """Returns the cached (output, error, test results) for a key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT output, error, results FROM validation_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE validation_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0], row[1], (json.loads(row[2]) if row[2] is not None else None)
+
+    def put(self, key, output, error, results=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO validation_cache (key, output, error, results, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, output, error, json.dumps(results) if results is not None else None, time.time())
+            )
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= PRUNE_INTERVAL:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        """Evicts the least recently used entries beyond max_entries. Called with the lock held."""
+        self._puts_since_prune = 0
+        count = self._conn.execute("SELECT COUNT(*) FROM validation_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM validation_cache WHERE key IN ("
+                " SELECT key FROM validation_cache ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return f"Validation cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate'] * 100:.1f}% hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,262 @@
+# work_queue.py
+#
+# Durable work queue for resumable sweeps (run_sweep.py --resume).
+#
+# Every planned trial of a sweep is a row in <results_dir>/work_queue.sqlite
+# (SQLite in WAL mode) with its state:
+#
+#   pending  planned, not started yet
+#   running  started by a sweep process that may since have died
+#   done     result.json written and recorded
+#   failed   raised an exception
+#
+# Starting a sweep plans the whole matrix up front. A sweep restarted with
+# --resume on the same --results-dir plans the matrix again (already known
+# trials are kept as they are), moves running and failed trials back to
+# pending and only runs what is not done, so finished trials are never
+# recomputed. result.json itself is written atomically by save_result(), so an
+# interrupted trial never leaves a truncated file behind.
+#
+# The same queue is shared by the processes of a distributed sweep
+# (distributed.py): workers claim pending trials with a lease they keep
+# renewing, and the coordinator requeues trials whose lease has expired
+# because their worker died.
+#
+# Usage:
+#   python3 03_Scripts/run_sweep.py ... --results-dir 04_RawData/sweep_forgiving_n30_x
+#   # ...crash...
+#   python3 03_Scripts/run_sweep.py ... --results-dir 04_RawData/sweep_forgiving_n30_x --resume
+#
+#   # Progress of a sweep, running or not
+#   python3 03_Scripts/work_queue.py status 04_RawData/sweep_forgiving_n30_x
+#
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+QUEUE_FILE_NAME = 'work_queue.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    key TEXT PRIMARY KEY,
+    trial TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT,
+    error TEXT,
+    planned_at REAL,
+    updated_at REAL,
+    worker TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_trials_state ON trials(state);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added after the first version of the schema, with their types.
+ADDED_COLUMNS = {'worker': 'TEXT', 'lease_until': 'REAL'}
+
+TRIAL_KEYS = ('model', 'test_case', 'lang', 'spec_lang', 'prompt_style', 'run')
+
+def trial_key(trial):
+    return json.dumps([trial[key] for key in TRIAL_KEYS])
+
+class WorkQueue:
+    """Persistent state of every planned trial of one sweep, safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(trials)")}
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE trials ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+    @classmethod
+    def for_results_dir(cls, results_dir):
+        return cls(os.path.join(results_dir, QUEUE_FILE_NAME))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+            self._conn.commit()
+
+    def plan(self, trials):
+        """Adds trials that are not in the queue yet. Returns the number of new trials."""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO trials (key, trial, planned_at, updated_at) VALUES (?, ?, ?, ?)",
+                [(trial_key(trial), json.dumps(trial), now, now) for trial in trials]
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def requeue_unfinished(self, states=('running', 'failed')):
+        """
+        Moves trials left running by a previous process, and failed trials, back
+        to pending. Returns the number of requeued trials.
+        """
+        placeholders = ', '.join('?' for _ in states)
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE trials SET state = 'pending', worker = NULL, lease_until = NULL, updated_at = ?"
+                f" WHERE state IN ({placeholders})",
+                (time.time(),) + tuple(states)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _trials_in(self, states):
+        placeholders = ', '.join('?' for _ in states)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT trial FROM trials WHERE state IN ({placeholders}) ORDER BY rowid", tuple(states)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def check_config(self, config, resume):
+        """
+        Stores the settings of a new sweep, or checks that a resumed sweep uses
+        the stored ones. Raises ValueError otherwise.
+        """
+        stored = self.get_meta('config')
+        if stored is None:
+            self.set_meta('config', config)
+        elif not resume:
+            raise ValueError("already holds a sweep; pass --resume to continue it.")
+        elif stored != config:
+            raise ValueError(f"settings differ from the interrupted sweep ({stored}).")
+
+    def claim(self, worker, lease, has_capacity=lambda model: True):
+        """
+        Atomically moves the first pending trial of a model with capacity to
+        running for `worker`, leased for `lease` seconds. Returns the trial or
+        None. Safe to call from several processes.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                claimed = None
+                cursor = self._conn.execute("SELECT key, trial FROM trials WHERE state = 'pending' ORDER BY rowid")
+                for key, trial_json in cursor:
+                    trial = json.loads(trial_json)
+                    if has_capacity(trial['model']):
+                        claimed = (key, trial)
+                        break
+                cursor.close()
+                if claimed is not None:
+                    self._conn.execute(
+                        "UPDATE trials SET state = 'running', worker = ?, lease_until = ?, updated_at = ? WHERE key = ?",
+                        (worker, now + lease, now, claimed[0])
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return claimed[1] if claimed is not None else None
+
+    def renew_leases(self, worker, lease):
+        """Extends the lease of every trial `worker` is running."""
+        with self._lock:
+            self._conn.execute("UPDATE trials SET lease_until = ? WHERE state = 'running' AND worker = ?",
+                               (time.time() + lease, worker))
+            self._conn.commit()
+
+    def requeue_expired(self):
+        """Moves running trials whose lease has expired back to pending. Returns their number."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE trials SET state = 'pending', worker = NULL, lease_until = NULL, updated_at = ?"
+                " WHERE state = 'running' AND lease_until IS NOT NULL AND lease_until < ?",
+                (now, now)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def pending_trials(self):
+        """Trials still to run, in planning order."""
+        return self._trials_in(('pending',))
+
+    def done_trials(self):
+        """Returns [(trial, status)] of finished trials, in planning order."""
+        with self._lock:
+            rows = self._conn.execute("SELECT trial, status FROM trials WHERE state = 'done' ORDER BY rowid").fetchall()
+        return [(json.loads(trial), status) for trial, status in rows]
+
+    def _set_state(self, trial, state, status=None, error=None, attempt=False):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE trials SET state = ?, status = ?, error = ?, attempts = attempts + ?, updated_at = ?"
+                " WHERE key = ?",
+                (state, status, error, 1 if attempt else 0, time.time(), trial_key(trial))
+            )
+            self._conn.commit()
+
+    def mark_running(self, trial):
+        self._set_state(trial, 'running', attempt=True)
+
+    def mark_done(self, trial, status):
+        self._set_state(trial, 'done', status=status)
+
+    def mark_failed(self, trial, error):
+        self._set_state(trial, 'failed', error=str(error))
+
+    def counts(self):
+        """Returns {state: number of trials}."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM trials GROUP BY state").fetchall())
+
+    def summary(self):
+        counts = self.counts()
+        total = sum(counts.values())
+        return (f"Work queue: {counts.get('done', 0)}/{total} trials done, {counts.get('pending', 0)} pending, "
+                f"{counts.get('running', 0)} running, {counts.get('failed', 0)} failed")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the durable work queue of a sweep.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    status_parser = subparsers.add_parser("status", help="Show how many trials are done, pending, running and failed.")
+    status_parser.add_argument("results_dir", help="Results directory of the sweep.")
+
+    args = parser.parse_args()
+
+    if args.command == "status":
+        path = os.path.join(args.results_dir, QUEUE_FILE_NAME)
+        if not os.path.exists(path):
+            parser.error(f"No work queue found at {path}")
+        with WorkQueue(path) as queue:
+            print(queue.summary())
+
+if __name__ == "__main__":
+    main()
@@ -5,131 +5,241 @@
 # for these rates using the Wilson score interval method.
 #
 # Prerequisite: Install necessary libraries
-# pip install pandas statsmodels
+# pip install pandas numpy
 #
+import argparse
 import os
 import json
+import sqlite3
 import pandas as pd
-from statsmodels.stats.proportion import proportion_confint
-import re
 
-def analyze_results(data_dir):
+from result_header import read_result_header, find_result_files, result_stat
+from run_sweep import parse_batch_dir_name, parse_trial_dir_name  # 03_Scripts, on sys.path via result_header
+from survival_stats import wilson_interval, format_rate_with_ci
+
+GROUP_COLUMNS = ['model', 'test_case', 'n_type', 'test_type', 'lang', 'spec', 'prompt_style']
+
+# Bump whenever extract_row() or the manifest layout changes: manifests of
+# another version are discarded instead of mixing old and new rows.
+MANIFEST_VERSION = 2
+
+def report_spec_columns(spec_lang, prompt_style):
     """
-    Analyzes all result.json files in the data directory, calculates success rates
-    and 95% confidence intervals.
+    Returns the (spec, prompt_style) report columns of a trial. The reports
+    have always split 'pseudocode_hyper_guided' into spec 'pseudocode_hyper'
+    and prompt style 'guided'; both the crawl and the --store path keep that.
     """
-    results = []
+    if prompt_style == 'hyper_guided':
+        return f"{spec_lang}_hyper", 'guided'
+    return spec_lang, prompt_style
 
-    # This regex now captures the test case name (e.g., get_magic_number, fizzbuzz)
-    pattern = re.compile(r'([a-zA-Z0-9_.:-]+)_((?:en|ja))_([a-zA-Z_]+)_([a-zA-Z_]+)_(get_magic_number|fizzbuzz|process_user_list|separate_vowels_and_consonants)_run\d+')
-
-    for root, dirs, files in os.walk(data_dir):
-        if 'result.json' in files:
-            dir_name = os.path.basename(root)
-            parent_dir_name = os.path.basename(os.path.dirname(root))
-
-            test_type_str = None
-            n_str = None
-            parts = parent_dir_name.split('_')
-
-            # Handle the new adaptive format, e.g., adaptive_composite_n30_process_user_list_20260101_100830
-            if parent_dir_name.startswith("adaptive_"):
-                if len(parts) >= 4:
-                    test_type_str = parts[1]
-                    n_str = parts[2][1:] # Remove 'n'
-            # Handle the fizzbuzz format, e.g., run_fizzbuzz_forgiving_20251231_104355
-            elif parent_dir_name.startswith("run_fizzbuzz"):
-                if "forgiving" in parent_dir_name:
-                    test_type_str = "forgiving"
-                elif "strict" in parent_dir_name:
-                    test_type_str = "strict"
-                n_str = "30" # This run was with N=30
-            # Handle high-rep get_magic_number format, e.g., run_high_rep_strict_n3_20260103_145801
-            elif parent_dir_name.startswith("run_high_rep_"):
-                if len(parts) >= 5:
-                    test_type_str = parts[3]
-                    n_str = parts[4][1:] # Remove 'n'
-            # Handle llama3-8b tests, e.g., llm_test_llama3-8b_20260101_231634
-            elif parent_dir_name.startswith("llm_test_"):
-                test_type_str = "standard" # This run has no strict/forgiving mode distinction
-                n_str = "30" # This run was with N=30
-            # Handle original formats, e.g., forgiving_n_30_20251229_183244
-            elif "_n_" in parent_dir_name:
-                if len(parts) >= 3:
-                    test_type_str = parts[0]
-                    n_str = parts[2]
-            
-            if not test_type_str or not n_str:
-                print(f"Skipping directory with unrecognized parent format: {parent_dir_name}")
-                continue
-            
-            match = pattern.match(dir_name)
-            if not match:
-                print(f"Skipping directory with unexpected format: {dir_name}")
-                continue
-                
-            model, lang, spec, prompt_style, test_case = match.groups()
-
-            result_path = os.path.join(root, 'result.json')
-            with open(result_path, 'r') as f:
-                try:
-                    data = json.load(f)
-                    success = "SUCCESS" in data.get('status', '')
-                    
-                    results.append({
-                        'model': model,
-                        'test_case': test_case,
-                        'n_type': f"n={n_str}",
-                        'test_type': test_type_str,
-                        'lang': lang,
-                        'spec': spec,
-                        'prompt_style': prompt_style,
-                        'success': 1 if success else 0
-                    })
-                except json.JSONDecodeError:
-                    print(f"Error decoding JSON in {result_path}")
-                    continue
-
-    if not results:
-        print("No results found. Please check the data directory path.")
+def extract_row(result_path):
+    """
+    Returns the analysis row (dict) for one result.json file, or None if its
+    directory names are not recognized or the file cannot be parsed.
+    """
+    root = os.path.dirname(result_path)
+    dir_name = os.path.basename(root)
+    parent_dir_name = os.path.basename(os.path.dirname(root))
+
+    test_type_str, n_str = parse_batch_dir_name(parent_dir_name)
+    if not test_type_str or not n_str:
+        print(f"Skipping directory with unrecognized parent format: {parent_dir_name}")
         return None
 
-    df = pd.DataFrame(results)
+    trial = parse_trial_dir_name(dir_name)
+    if trial is None:
+        print(f"Skipping directory with unexpected format: {dir_name}")
+        return None
+    spec, prompt_style = report_spec_columns(trial['spec_lang'], trial['prompt_style'])
 
-    # Aggregate results, including by test_case
-    summary = df.groupby(['model', 'test_case', 'n_type', 'test_type', 'lang', 'spec', 'prompt_style']).agg(
-        trials=('success', 'count'),
-        successes=('success', 'sum')
-    ).reset_index()
+    try:
+        data = read_result_header(result_path)
+    except (json.JSONDecodeError, ValueError):
+        print(f"Error decoding JSON in {result_path}")
+        return None
+    success = "SUCCESS" in data.get('status', '')
+
+    return {
+        'model': trial['model'],
+        'test_case': trial['test_case'],
+        'n_type': f"n={n_str}",
+        'test_type': test_type_str,
+        'lang': trial['lang'],
+        'spec': spec,
+        'prompt_style': prompt_style,
+        'success': 1 if success else 0
+    }
+
+def collect_results(data_dir):
+    """
+    Walks the data directory and returns one row (dict) per result.json file
+    (loose or packed).
+    """
+    results = []
+    for result_path in find_result_files([data_dir]):
+        row = extract_row(result_path)
+        if row is not None:
+            results.append(row)
+    return results
+
+def _add_to_groups(groups, row, sign):
+    key = tuple(row[column] for column in GROUP_COLUMNS)
+    counts = groups.setdefault(key, [0, 0])
+    counts[0] += sign
+    counts[1] += sign * row['success']
+    if counts[0] == 0:
+        del groups[key]
+
+def load_manifest(manifest_path, data_dir):
+    """
+    Loads an incremental-analysis manifest. Returns (files, groups), where
+    files maps each result.json path to {'mtime', 'size', 'row'} and groups
+    maps a GROUP_COLUMNS tuple to [trials, successes]. A manifest of another
+    MANIFEST_VERSION or written for another data directory starts empty.
+    """
+    if not os.path.exists(manifest_path):
+        return {}, {}
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        print(f"Manifest {manifest_path} was written by another version of this script; rebuilding it.")
+        return {}, {}
+    if manifest.get('data_root') != os.path.abspath(data_dir):
+        print(f"Manifest {manifest_path} was written for {manifest.get('data_root')}; rebuilding it.")
+        return {}, {}
+    groups = {tuple(entry[:-2]): entry[-2:] for entry in manifest.get('groups', [])}
+    return manifest.get('files', {}), groups
+
+def save_manifest(manifest_path, data_dir, files, groups):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'version': MANIFEST_VERSION,
+            'data_root': os.path.abspath(data_dir),
+            'files': files,
+            'groups': [list(key) + counts for key, counts in groups.items()]
+        }, f, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
 
+def update_manifest(data_dir, files, groups):
+    """
+    Re-reads only the result.json files that are new or whose mtime/size
+    changed since the manifest was written, and drops files that disappeared.
+    The per-group counts are adjusted in place by subtracting each stale row
+    and adding its replacement. Returns (reread, removed).
+    """
+    seen = set()
+    reread = 0
+    for result_path in find_result_files([data_dir]):
+        result_path = os.path.abspath(result_path)
+        seen.add(result_path)
+        # Packed results carry the pack file's mtime/size: repacking rereads their headers.
+        st = result_stat(result_path)
+        entry = files.get(result_path)
+        if entry is not None and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            continue
+        if entry is not None and entry['row'] is not None:
+            _add_to_groups(groups, entry['row'], -1)
+        row = extract_row(result_path)
+        if row is not None:
+            _add_to_groups(groups, row, 1)
+        files[result_path] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'row': row}
+        reread += 1
+
+    removed = [path for path in files if path not in seen]
+    for path in removed:
+        entry = files.pop(path)
+        if entry['row'] is not None:
+            _add_to_groups(groups, entry['row'], -1)
+    return reread, len(removed)
+
+def load_results_from_store(store_path):
+    """
+    Loads one row per trial from the SQLite results store written by
+    03_Scripts/results_store.py, with the same columns as collect_results().
+    """
+    with sqlite3.connect(store_path) as conn:
+        df = pd.read_sql_query(
+            "SELECT model, test_case, 'n=' || n_runs AS n_type, test_type, lang,"
+            " spec_lang AS spec, prompt_style, success FROM trials WHERE test_type IS NOT NULL",
+            conn
+        )
+    columns = [report_spec_columns(spec, style) for spec, style in zip(df['spec'], df['prompt_style'])]
+    df[['spec', 'prompt_style']] = pd.DataFrame(columns, columns=['spec', 'prompt_style'], index=df.index)
+    return df
+
+def add_confidence_intervals(summary):
+    """Adds success rates and 95% Wilson confidence intervals to per-group trials/successes counts."""
     summary['success_rate'] = summary['successes'] / summary['trials']
 
     # Calculate confidence intervals
-    conf_intervals = summary.apply(
-        lambda row: proportion_confint(row['successes'], row['trials'], method='wilson'),
-        axis=1
-    )
-    summary[['ci_lower', 'ci_upper']] = pd.DataFrame(conf_intervals.tolist(), index=summary.index)
+    summary['ci_lower'], summary['ci_upper'] = wilson_interval(summary['successes'], summary['trials'])
 
     # Format for readability
     summary['success_rate_percent'] = summary['success_rate'] * 100
     summary['ci_lower_percent'] = summary['ci_lower'] * 100
     summary['ci_upper_percent'] = summary['ci_upper'] * 100
     
-    summary['rate_with_ci'] = summary.apply(
-        lambda row: f"{row['success_rate_percent']:.1f}% (95% CI: {row['ci_lower_percent']:.1f}-{row['ci_upper_percent']:.1f})",
-        axis=1
-    )
+    summary['rate_with_ci'] = format_rate_with_ci(summary['success_rate'], summary['ci_lower'], summary['ci_upper'])
 
     return summary
 
+def analyze_results(data_dir=None, store_path=None, manifest_path=None):
+    """
+    Analyzes all result.json files in the data directory (or all trials in the
+    results store), calculates success rates and 95% confidence intervals.
+    With a manifest_path, only new or modified result.json files are read and
+    merged into the per-group counts cached in the manifest.
+    """
+    if manifest_path is not None:
+        files, groups = load_manifest(manifest_path, data_dir)
+        reread, removed = update_manifest(data_dir, files, groups)
+        save_manifest(manifest_path, data_dir, files, groups)
+        print(f"Incremental analysis: {reread} result files read, {removed} removed, {len(files) - reread} unchanged.")
+        if not groups:
+            print("No results found. Please check the data directory path.")
+            return None
+        summary = pd.DataFrame(
+            [list(key) + counts for key, counts in groups.items()],
+            columns=GROUP_COLUMNS + ['trials', 'successes']
+        ).sort_values(GROUP_COLUMNS).reset_index(drop=True)
+        return add_confidence_intervals(summary)
+
+    if store_path is not None:
+        df = load_results_from_store(store_path)
+    else:
+        df = pd.DataFrame(collect_results(data_dir))
+
+    if df.empty:
+        print("No results found. Please check the data directory path.")
+        return None
+
+    # Aggregate results, including by test_case
+    summary = df.groupby(GROUP_COLUMNS).agg(
+        trials=('success', 'count'),
+        successes=('success', 'sum')
+    ).reset_index()
+
+    return add_confidence_intervals(summary)
+
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__))
     DATA_DIRECTORY = os.path.join(script_dir, '..', '04_RawData')
+
+    parser = argparse.ArgumentParser(description="Analyze benchmark results with 95% Wilson confidence intervals.")
+    parser.add_argument("--data-dir", default=DATA_DIRECTORY, help="Directory containing the raw result.json files.")
+    parser.add_argument("--store", default=None, help="Read trials from a SQLite results store instead of crawling --data-dir.")
+    parser.add_argument("--incremental", nargs='?', const=os.path.join(script_dir, '.analysis_manifest.json'), default=None,
+                        metavar="MANIFEST", help="Only read new or modified result.json files, caching per-file rows and per-group counts in MANIFEST (default: 05_Reports/.analysis_manifest.json).")
+    args = parser.parse_args()
     
-    print(f"Analyzing data in: {DATA_DIRECTORY}")
+    if args.store:
+        print(f"Analyzing results store: {args.store}")
+    else:
+        print(f"Analyzing data in: {args.data_dir}")
     
-    full_summary = analyze_results(DATA_DIRECTORY)
+    full_summary = analyze_results(args.data_dir, store_path=args.store, manifest_path=args.incremental)
     
     if full_summary is not None:
         # Aggregate across lang, spec, prompt_style for a high-level summary
@@ -139,16 +249,9 @@ if __name__ == "__main__":
         ).reset_index()
 
         # Recalculate CIs for the fully aggregated data
-        conf_intervals_agg = agg_summary.apply(
-            lambda row: proportion_confint(row['successes'], row['trials'], method='wilson'),
-            axis=1
-        )
-        agg_summary[['ci_lower', 'ci_upper']] = pd.DataFrame(conf_intervals_agg.tolist(), index=agg_summary.index)
+        agg_summary['ci_lower'], agg_summary['ci_upper'] = wilson_interval(agg_summary['successes'], agg_summary['trials'])
         agg_summary['success_rate'] = agg_summary['successes'] / agg_summary['trials']
-        agg_summary['rate_with_ci'] = agg_summary.apply(
-            lambda row: f"{(row['success_rate'] * 100):.1f}% (95% CI: {(row['ci_lower'] * 100):.1f}-{(row['ci_upper'] * 100):.1f})",
-            axis=1
-        )
+        agg_summary['rate_with_ci'] = format_rate_with_ci(agg_summary['success_rate'], agg_summary['ci_lower'], agg_summary['ci_upper'])
 
         print("\n### High-Level Aggregated Results ###")
         print(agg_summary[['model', 'test_case', 'n_type', 'test_type', 'trials', 'successes', 'rate_with_ci']].sort_values(by=['model', 'test_case', 'test_type']))
@@ -1,10 +1,14 @@
 
 import json
+import sqlite3
 import pandas as pd
 import argparse
 from pathlib import Path
 import re
 
+from result_header import read_result_header, find_result_files, load_result
+from survival_stats import survival_curves
+
 def parse_run_info(path: Path):
     """
     Parses the directory name to extract model, task, language, and other info.
@@ -42,48 +46,78 @@ def parse_run_info(path: Path):
         "language": lang
     }
 
-def calculate_survival_curve(df_group):
-    """Calculates survival rate at each cycle for a group of runs."""
-    total_runs = len(df_group)
-    if total_runs == 0:
-        return []
-
-    survival_data = []
-    max_cycles = 10 # As defined in the benchmark
-
-    for cycle in range(1, max_cycles + 1):
-        survived_runs = (df_group['cycles_completed'] >= cycle).sum()
-        survival_rate = (survived_runs / total_runs) * 100
-        survival_data.append({'cycle': cycle, 'survival_rate': survival_rate})
-
-    return survival_data
+def load_runs_from_store(store_path):
+    """
+    Loads the main-experiment runs (pseudocode + hyper_guided, fizzbuzz and
+    separate_vowels_and_consonants) from the SQLite results store written by
+    03_Scripts/results_store.py.
+    """
+    with sqlite3.connect(store_path) as conn:
+        return pd.read_sql_query(
+            "SELECT model, test_case AS task, lang AS language,"
+            " COALESCE(cycles_completed, 0) AS cycles_completed"
+            " FROM trials"
+            " WHERE spec_lang = 'pseudocode' AND prompt_style = 'hyper_guided'"
+            " AND test_case IN ('fizzbuzz', 'separate_vowels_and_consonants')",
+            conn
+        )
+
+def partial_credit_rows(result_path, run_info):
+    """
+    Yields the share of test cases passed in every cycle of a run that
+    recorded per-case results of a test_cases.json (step2_test_results).
+    """
+    logs = load_result(result_path).get('logs', [])
+    for cycle_log in logs:
+        test_results = cycle_log.get('step2_test_results')
+        if test_results and test_results.get('total'):
+            yield dict(run_info, cycle=cycle_log.get('cycle'),
+                       case_pass_rate=test_results['passed'] / test_results['total'])
+
+def write_partial_credit(rows, output_file):
+    """Saves the mean share of test cases passed per (model, task, language, cycle) as CSV."""
+    df = pd.DataFrame(rows)
+    output_df = (df.groupby(['model', 'task', 'language', 'cycle'])['case_pass_rate']
+                 .agg(runs='count', mean_case_pass_rate='mean').reset_index())
+    output_df['mean_case_pass_rate'] *= 100
+    output_df.to_csv(output_file, index=False)
+    print(f"\nPartial-credit data for {len(df)} cycles saved to {output_file}")
 
-def main(data_dirs, output_file):
+def main(data_dirs, output_file, store_path=None, partial_credit_file=None):
     """
     Main function to aggregate data and generate the degradation curve CSV.
     """
+    if store_path is not None:
+        if partial_credit_file is not None:
+            print("Partial credit needs the per-case results in result.json; ignoring --partial-credit-file with --store.")
+        print(f"Reading runs from results store: {store_path}")
+        df = load_runs_from_store(store_path)
+        if df.empty:
+            print("No valid result files found for the specified criteria.")
+            return
+        write_degradation_curves(df, output_file)
+        return
+
     all_results = []
+    partial_credit = []
     print(f"Searching for 'result.json' in: {data_dirs}")
 
     for data_dir in data_dirs:
-        base_path = Path(data_dir)
-        for result_path in base_path.rglob('result.json'):
+        for result_path in map(Path, find_result_files([data_dir])):
             run_info = parse_run_info(result_path)
             if not run_info:
                 continue
             
             try:
-                with open(result_path, 'r') as f:
-                    result_data = json.load(f)
-                
-                cycles_completed = result_data.get('cycles_completed', 0)
-                # If SUCCESS, it completed all 10 cycles and the loop for the 11th.
-                if result_data.get('status') == 'SUCCESS':
-                    cycles_completed = 10
+                result_data = read_result_header(result_path)
                 
-                run_info['cycles_completed'] = cycles_completed
+                # A SUCCESS run records cycles_completed == max_cycles, so the
+                # number of cycles is derived from the data in survival_curves().
+                run_info['cycles_completed'] = result_data.get('cycles_completed', 0)
                 all_results.append(run_info)
-            except (json.JSONDecodeError, IOError) as e:
+                if partial_credit_file is not None:
+                    partial_credit.extend(partial_credit_rows(result_path, {key: run_info[key] for key in ('model', 'task', 'language')}))
+            except (json.JSONDecodeError, ValueError, IOError) as e:
                 print(f"Could not read or parse {result_path}: {e}")
                 continue
     
@@ -92,27 +126,23 @@ def main(data_dirs, output_file):
         return
 
     df = pd.DataFrame(all_results)
+    write_degradation_curves(df, output_file)
+    if partial_credit_file is not None:
+        if partial_credit:
+            write_partial_credit(partial_credit, partial_credit_file)
+        else:
+            print("\nNo runs with per-case test results (--suite-report) found; no partial-credit data written.")
+
+def write_degradation_curves(df, output_file):
+    """Computes the survival curve of every (model, task, language) group and saves it as CSV."""
     print("\nSuccessfully parsed a total of {} result files.".format(len(df)))
     print("\nData distribution by model and task:")
     print(df.groupby(['model', 'task']).size().reset_index(name='counts'))
 
 
-    # Calculate survival curves for each group
-    curves = df.groupby(['model', 'task', 'language']).apply(calculate_survival_curve)
-    
-    # Flatten the data for CSV export
-    output_data = []
-    for (model, task, lang), curve_data in curves.items():
-        for point in curve_data:
-            output_data.append({
-                'model': model,
-                'task': task,
-                'language': lang,
-                'cycle': point['cycle'],
-                'survival_rate': point['survival_rate']
-            })
-
-    output_df = pd.DataFrame(output_data)
+    # Calculate survival curves (with Kaplan-Meier-style 95% bands) for all groups at once
+    curves = survival_curves(df, ['model', 'task', 'language'])
+    output_df = curves[['model', 'task', 'language', 'cycle', 'survival_rate', 'ci_lower', 'ci_upper']]
     
     # Save to CSV
     output_df.to_csv(output_file, index=False)
@@ -123,12 +153,16 @@ def main(data_dirs, output_file):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate degradation curve data from benchmark results.')
-    parser.add_argument('data_dirs', nargs='+', help='One or more directories containing raw experiment data.')
+    parser.add_argument('data_dirs', nargs='*', help='One or more directories containing raw experiment data.')
     parser.add_argument('--output-file', default='05_Reports/degradation_data.csv', help='Path to the output CSV file.')
+    parser.add_argument('--store', default=None, help='Read runs from a SQLite results store instead of crawling data_dirs.')
+    parser.add_argument('--partial-credit-file', default=None, help='Also save the mean share of test cases passed per cycle (runs with --suite-report) to this CSV.')
     
     args = parser.parse_args()
+    if not args.data_dirs and not args.store:
+        parser.error('at least one data directory or --store is required.')
     
     output_path = Path(args.output_file)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    main(args.data_dirs, output_path)
+    main(args.data_dirs, output_path, store_path=args.store, partial_credit_file=args.partial_credit_file)
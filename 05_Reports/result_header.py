@@ -0,0 +1,105 @@
+# result_header.py
+#
+# Fast reader for the top-level scalar fields of a result.json file.
+#
+# Analysis only needs 'status' and 'cycles_completed', but json.load()
+# materializes every raw spec and generated code string of every cycle log.
+# save_result() in 03_Scripts/run_cycle_test_syntactic.py writes the scalar
+# fields before 'logs', so they form a small fixed header at the top of the
+# file: this reader decodes the top-level object one member at a time and stops
+# at the first array/object value, reading only the first few kilobytes no
+# matter how verbose the model outputs were.
+#
+# Files written in another key order fall back to a full json.load().
+#
+# Results packed by 03_Scripts/result_pack.py have no file of their own; their
+# header is stored in the pack. The pack-aware helpers are re-exported here so
+# the report scripts can list and load loose and packed results alike.
+#
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '03_Scripts'))
+from result_pack import find_result_files, load_result, load_result_header, result_stat  # noqa: E402
+
+CHUNK_SIZE = 1024
+HEADER_FIELDS = ('status', 'cycles_completed')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+class _NeedMoreData(Exception):
+    pass
+
+def _skip_whitespace(buf, idx):
+    idx = _WHITESPACE.match(buf, idx).end()
+    if idx >= len(buf):
+        raise _NeedMoreData()
+    return idx
+
+def _parse_header(buf, fields):
+    """
+    Decodes top-level members of buf until all fields are found or a container
+    value is reached. Returns (header, complete); raises _NeedMoreData if buf
+    ends before either happens.
+    """
+    header = {}
+    idx = _skip_whitespace(buf, 0)
+    if buf[idx] != '{':
+        raise ValueError("result file does not contain a JSON object")
+    idx += 1
+    while True:
+        idx = _skip_whitespace(buf, idx)
+        if buf[idx] == '}':
+            return header, True
+        if buf[idx] == ',':
+            idx = _skip_whitespace(buf, idx + 1)
+        try:
+            key, idx = _decoder.raw_decode(buf, idx)
+            idx = _skip_whitespace(buf, idx)
+            if buf[idx] != ':':
+                raise ValueError(f"expected ':' after key {key!r}")
+            idx = _skip_whitespace(buf, idx + 1)
+            if buf[idx] in '[{':
+                return header, all(field in header for field in fields)
+            value, idx = _decoder.raw_decode(buf, idx)
+            # A number at the very end of the buffer may continue in the next chunk.
+            idx = _skip_whitespace(buf, idx)
+        except json.JSONDecodeError:
+            # A string or number that is cut off at the end of the buffer.
+            raise _NeedMoreData()
+        header[key] = value
+        if all(field in header for field in fields):
+            return header, True
+
+def read_result_header(result_path, fields=HEADER_FIELDS):
+    """
+    Returns a dict with the top-level scalar fields of a result.json file
+    (at least `fields` when present), without decoding the cycle logs.
+    Raises json.JSONDecodeError/ValueError or IOError like json.load().
+    """
+    try:
+        f = open(result_path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        header = load_result_header(result_path)
+        if header is None:
+            raise
+        return header
+    with f:
+        buf = ''
+        while True:
+            chunk = f.read(CHUNK_SIZE if not buf else len(buf))
+            buf += chunk
+            try:
+                header, complete = _parse_header(buf, fields)
+                break
+            except _NeedMoreData:
+                if not chunk:
+                    raise json.JSONDecodeError("Unexpected end of result file", buf, len(buf))
+        if complete:
+            return header
+        f.seek(0)
+        data = json.load(f)
+    return {key: value for key, value in data.items() if not isinstance(value, (list, dict))}